@@ -1,19 +1,47 @@
 # Embedder.py
 import numpy as np
-import openai
-import requests as HTTPRequests ## some packages already have "requests"
+import os
+import re
+import heapq
+from concurrent.futures import ThreadPoolExecutor
 from os import getenv
 from backoff import on_exception, expo
-from scipy.spatial.distance import cosine
+from embedding_cache import EmbeddingCache
+from text_tokens import estimate_tokens
 
-
-
-from transformers import AutoTokenizer, AutoModel
+## openai, torch, transformers and onnxruntime are imported by the backend that needs them, see BACKENDS.
+## requests is imported on the first API call; its exceptions derive from OSError, which the retry decorators catch.
 
 MAX_TOKENS = 8194
 
+## Batching defaults. API batches are sent concurrently, local batches run one after another.
+## Token budgets for the API are estimates (see estimate_tokens); for the local model they count padded tokens.
+API_BATCH_SIZE = 128
+API_BATCH_TOKENS = 60000
+LOCAL_BATCH_SIZE = 32
+LOCAL_BATCH_TOKENS = 16384
+MAX_WORKERS = 4
+
+## a sentence ends at 。！？!? (plus closing quotes), at a period followed by whitespace, or at a line break
+_SENTENCE = re.compile(r'.+?(?:[。！？!?…]+[”’"」』）)]*|\.+[”’"\')]*(?=\s)|(?=\n)|$)\s*', re.S)
+
+SEGMENTERS = ['jina', 'local']
+
+## Embedding backends: default model, task recorded in the embedding cache, and the Embedder methods that
+## initialize the backend (None if nothing to load) and embed one batch. The local backends are used when
+## use_api is None: 'torch' (the HF model), 'int8' (dynamically quantized Linear layers, CPU) and 'onnx'
+## (ONNX Runtime export of the model, CPU). int8 embeddings differ slightly, so they are cached separately.
+BACKENDS = {
+    'jina': {'default_model': "jina-embeddings-v3", 'task': "text-matching", 'initialize': None, 'embed': "_get_jina_embedding"},
+    'openai': {'default_model': "text-embedding-3-small", 'task': "default", 'initialize': "_initialize_openai_client", 'embed': "_get_openai_embedding"},
+    'torch': {'default_model': None, 'task': "default", 'initialize': "_initialize_local_model", 'embed': "_get_torch_embedding"},
+    'int8': {'default_model': None, 'task': "int8", 'initialize': "_initialize_int8_model", 'embed': "_get_torch_embedding"},
+    'onnx': {'default_model': None, 'task': "default", 'initialize': "_initialize_onnx_model", 'embed': "_get_onnx_embedding"},
+}
+LOCAL_BACKENDS = ['torch', 'int8', 'onnx']
+
 class Embedder:
-    def __init__(self, model_name=None, use_api=None, to_cuda=False, attn_implementation=None):
+    def __init__(self, model_name=None, use_api=None, to_cuda=False, attn_implementation=None, batch_size=None, max_batch_tokens=None, max_workers=MAX_WORKERS, cache_dir=None, cache_dtype="float32", segmenter="jina", local_backend="torch", num_threads=None, onnx_path=None):
         """
         Initializes the Embedder class, which supports multiple embedding methods, including Jina API, 
         OpenAI API, and local model embeddings.
@@ -23,53 +51,120 @@ class Embedder:
             use_api (str): Flag to determine whether to use an API for embedding ('jina', 'openai') or a local model (None).
             to_cuda (bool): If True, use GPU; otherwise use CPU. (Some model must run on GPU)
             attn_implementation (str): Attention implementation method for the transformer model.
+            batch_size (int): Maximum number of texts per request / forward pass. Defaults to API_BATCH_SIZE or LOCAL_BATCH_SIZE.
+            max_batch_tokens (int): Token budget of a batch. Defaults to API_BATCH_TOKENS or LOCAL_BATCH_TOKENS.
+            max_workers (int): Number of API batches sent concurrently.
+            cache_dir (str): If given, embeddings are stored on disk by text hash and only uncached texts are embedded.
+            cache_dtype (str): 'float32' or 'float16' storage for the embedding cache.
+            segmenter (str): How long texts are split into chunks: 'jina' (segment.jina.ai) or 'local'
+                (sentence and paragraph boundaries, offline).
+            local_backend (str): Runtime of the local model: 'torch', 'int8' or 'onnx'. 'int8' and 'onnx' run on CPU.
+            num_threads (int): CPU threads of the local model. For 'torch' and 'int8' this sets torch's
+                process-wide thread count.
+            onnx_path (str): Where the ONNX export of the model is stored. Exported on first use.
+                Defaults to onnx_models/<model_name>.onnx.
         """
         self.use_api = use_api
         self.model_name = model_name
         self.to_cuda = to_cuda
-
-        # API-based embedding initialization
-        if self.use_api or self.use_api == "":
-            supported_apis = ["", 'jina', 'openai',]
-            if self.use_api not in supported_apis:
-                raise ValueError(f"API type '{self.use_api}' not supported. Supported APIs: {supported_apis}")
-            
-            elif self.use_api == "": # default
-                self.use_api == 'openai'
-
-            elif self.use_api == 'jina':
-                pass # maybe add something later
-
-            elif self.use_api == 'openai':
-                self.client = openai.Client(api_key=getenv("OPENAI_API_KEY"))
-        else:
-            # Load PyTorch model for local embedding generation
+        self.batch_size = batch_size or (API_BATCH_SIZE if use_api is not None else LOCAL_BATCH_SIZE)
+        self.max_batch_tokens = max_batch_tokens or (API_BATCH_TOKENS if use_api is not None else LOCAL_BATCH_TOKENS)
+        self.max_workers = max_workers
+        self.cache_dir = cache_dir
+        self.cache_dtype = cache_dtype
+        self.cache = None # EmbeddingCache, opened on first use once the model name is known
+        if segmenter not in SEGMENTERS:
+            raise ValueError(f"Segmenter '{segmenter}' not supported. Supported segmenters: {SEGMENTERS}")
+        self.segmenter = segmenter
+
+        if self.use_api == "": # default
+            self.use_api = 'openai'
+        self.backend = self.use_api if self.use_api is not None else local_backend
+        supported_apis = [name for name in BACKENDS if name not in LOCAL_BACKENDS]
+        if self.use_api is not None and self.backend not in supported_apis:
+            raise ValueError(f"API type '{self.use_api}' not supported. Supported APIs: {supported_apis}")
+        if self.use_api is None:
+            # Load the model for local embedding generation
+            if local_backend not in LOCAL_BACKENDS:
+                raise ValueError(f"Local backend '{local_backend}' not supported. Supported backends: {LOCAL_BACKENDS}")
             if not model_name:
                 raise ValueError("Model name must be provided when using a local model.")
+            if to_cuda and local_backend != 'torch':
+                raise ValueError(f"Local backend '{local_backend}' runs on CPU only.")
             self.attn_implementation = attn_implementation
-            self._initialize_local_model()
+            self.num_threads = num_threads
+            self.onnx_path = onnx_path or os.path.join("onnx_models", re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name) + ".onnx")
 
-    def _initialize_local_model(self):
-        import torch  # Importing PyTorch only when needed
-        import torch.nn.functional as F
+        initialize = BACKENDS[self.backend]['initialize']
+        if initialize:
+            getattr(self, initialize)()
 
+    def _initialize_openai_client(self):
+        import openai  # Importing openai only when needed
+        self.client = openai.Client(api_key=getenv("OPENAI_API_KEY"))
 
+    def _initialize_local_model(self):
         """Initializes the PyTorch model and tokenizer for local embedding generation."""
+        import torch  # Importing PyTorch and transformers only when needed
+        from transformers import AutoTokenizer, AutoModel
+
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        ## fp16 only pays off on GPU, many CPU kernels are slow for it or lack it
+        dtype = torch.float16 if self.to_cuda else torch.float32
         if self.attn_implementation:
             self.model = AutoModel.from_pretrained(self.model_name, 
                                                    trust_remote_code=True, 
                                                    attn_implementation=self.attn_implementation, 
-                                                   torch_dtype=torch.float16).to('cuda' if self.to_cuda else 'cpu')
+                                                   torch_dtype=dtype).to('cuda' if self.to_cuda else 'cpu')
         else:
             self.model = AutoModel.from_pretrained(self.model_name, 
                                                    trust_remote_code=True, 
-                                                   torch_dtype=torch.float16).to('cuda' if self.to_cuda else 'cpu')
+                                                   torch_dtype=dtype).to('cuda' if self.to_cuda else 'cpu')
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
         self.model.eval()
 
+    def _initialize_int8_model(self):
+        """Loads the fp32 model and quantizes its Linear layers to int8 with dynamic activation scales."""
+        import torch  # Importing PyTorch only when needed
+
+        self._initialize_local_model()
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def _initialize_onnx_model(self):
+        """Opens an ONNX Runtime session of the model, exporting the model first if onnx_path does not exist."""
+        import onnxruntime  # Importing ONNX Runtime and transformers only when needed
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        if not os.path.exists(self.onnx_path):
+            self._export_onnx()
+        options = onnxruntime.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        self.session = onnxruntime.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+        self.onnx_inputs = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _export_onnx(self):
+        """Exports the fp32 model to onnx_path with dynamic batch and sequence axes, last_hidden_state as output."""
+        import torch  # Importing PyTorch and transformers only when needed
+        from transformers import AutoModel
+
+        print(f"Exporting {self.model_name} to {self.onnx_path}")
+        model = AutoModel.from_pretrained(self.model_name, trust_remote_code=True, torch_dtype=torch.float32).eval()
+        inputs = dict(self.tokenizer(["Once upon a time."], return_tensors='pt'))
+        axes = {0: "batch", 1: "sequence"}
+        os.makedirs(os.path.dirname(self.onnx_path) or ".", exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(model, (inputs,), self.onnx_path,
+                              input_names=list(inputs), output_names=["last_hidden_state"],
+                              dynamic_axes={**{name: axes for name in inputs}, "last_hidden_state": axes},
+                              opset_version=17)
+
     def get_embedding(self, texts: list) -> np.ndarray:
         """
-        Generates embeddings for a list of texts.
+        Generates embeddings for a list of texts. The texts are sorted by length and packed into batches
+        under the token budget; API batches are sent concurrently. The output follows the input order.
         
         Args:
             texts (list of str): A list of texts to be embedded.
@@ -81,28 +176,107 @@ class Embedder:
         if not isinstance(texts, list):
             raise ValueError("Input must be a list of strings.")
 
+        backend = BACKENDS[self.backend]
+        if not self.model_name:
+            self.model_name = backend['default_model']
+            print(f"use default model: {self.model_name}")
+        return self._embed_cached(texts, getattr(self, backend['embed']), task=backend['task'])
+
+    def _embed_cached(self, texts: list, embed, task: str = "default") -> np.ndarray:
+        """Embeds only the texts missing from the embedding cache and splices the cached ones back in order."""
+        if not self.cache_dir:
+            return self._embed_in_batches(texts, embed)
+        if self.cache is None:
+            self.cache = EmbeddingCache(self.cache_dir, self.model_name, task=task, dtype=self.cache_dtype)
+        if not texts:
+            return np.empty((0, self.cache.dim or 0), dtype="f") # the dimension is known once the cache holds a vector
+
+        embeddings, missing = self.cache.lookup(texts)
+        if not missing:
+            return embeddings
+        computed = self._embed_in_batches([texts[i] for i in missing], embed)
+        self.cache.add([texts[i] for i in missing], computed)
+        if embeddings is None:
+            return computed
+        embeddings[missing] = computed
+        return embeddings
+
+    def _embed_in_batches(self, texts: list, embed) -> np.ndarray:
+        """
+        Splits texts into length-sorted batches, embeds every batch with `embed` and restores the input order.
+
+        Args:
+            texts (list of str): Texts to embed.
+            embed (callable): Backend function mapping a list of texts to an array of embeddings.
+        """
+        if len(texts) == 0:
+            return np.empty((0, 0), dtype="f")
+
         if self.use_api:
+            lengths = [estimate_tokens(text) for text in texts]
+            ## texts over the Jina input limit are segmented first instead of failing their whole batch
             if self.use_api == 'jina':
-                if not self.model_name:
-                    self.model_name = "jina-embeddings-v3"
-                    print(f"use default model: {self.model_name}")
-                return self._get_jina_embedding(texts)
-            elif self.use_api == 'openai':
-                # set the default to be GPT embedding
-                if not self.model_name:
-                    self.model_name = "text-embedding-3-small"
-                    print(f"use default model: {self.model_name}")
-                return self._get_openai_embedding(texts)
-            else:
-                raise ValueError(f"API type '{self.use_api}' is not supported.")
+                overlong = [i for i, length in enumerate(lengths) if length > MAX_TOKENS]
+                if overlong:
+                    return self._embed_long_texts(texts, overlong, embed)
+            batches = _make_batches(lengths, self.batch_size, self.max_batch_tokens, padded=False)
         else:
-            return self._get_torch_embedding(texts)
-    
+            lengths = [len(ids) for ids in self.tokenizer(texts, max_length=512, truncation=True)["input_ids"]]
+            batches = _make_batches(lengths, self.batch_size, self.max_batch_tokens, padded=True)
+
+        if len(batches) == 1:
+            return embed(texts)
+
+        if self.use_api and self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(lambda batch: embed([texts[i] for i in batch]), batches))
+        else:
+            results = [embed([texts[i] for i in batch]) for batch in batches]
+
+        embeddings = np.empty((len(texts), results[0].shape[1]), dtype=results[0].dtype)
+        for batch, result in zip(batches, results):
+            embeddings[batch] = result
+        return embeddings
+
+    def _embed_long_texts(self, texts: list, overlong: list, embed) -> np.ndarray:
+        """
+        Embeds texts of which some are too long for the API. Only the overlong texts are segmented, in
+        parallel; their chunks are embedded in the same batches as the other texts, and each overlong text
+        gets the token-weighted average of its chunk embeddings.
+
+        Args:
+            texts (list of str): Texts to embed.
+            overlong (list of int): Indices of the texts that have to be segmented.
+            embed (callable): Backend function mapping a list of texts to an array of embeddings.
+        """
+        overlong_set = set(overlong)
+        short = [i for i in range(len(texts)) if i not in overlong_set]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            segmented = list(executor.map(lambda i: self._segment(texts[i], max_token=MAX_TOKENS), overlong))
+        ## the segmenter returns no chunks for unusable input, embed the head of the text in that case
+        segmented = [chunks or [texts[i][:MAX_TOKENS]] for i, chunks in zip(overlong, segmented)]
+
+        chunks = [chunk for text_chunks in segmented for chunk in text_chunks]
+        computed = self._embed_in_batches([texts[i] for i in short] + chunks, embed)
+        embeddings = np.empty((len(texts), computed.shape[1]), dtype="f")
+        embeddings[short] = computed[:len(short)]
+        start = len(short)
+        for i, text_chunks in zip(overlong, segmented):
+            weights = [max(1, estimate_tokens(chunk)) for chunk in text_chunks]
+            average = np.average(computed[start:start + len(text_chunks)], weights=weights, axis=0)
+            embeddings[i] = average / (np.linalg.norm(average) or 1.0)
+            start += len(text_chunks)
+        return embeddings
+
     ## Below are model-specific functions
 
-    @on_exception(expo, HTTPRequests.exceptions.RequestException, max_time=30)
-    def _get_jina_embedding(self, texts: list, dim: int = 1024) -> np.ndarray:
-        """Fetches embeddings from the Jina API. Requires Jina API key in .env file."""
+    @on_exception(expo, OSError, max_time=30)
+    def _get_jina_embedding(self, texts: list, dim: int = 1024, segment_on_error: bool = True) -> np.ndarray:
+        """
+        Fetches embeddings from the Jina API. Requires Jina API key in .env file.
+        A 400 response is answered by segmenting the texts that are too long, unless segment_on_error is False.
+        """
+        import requests as HTTPRequests ## some packages already have "requests"
         # check if dim is between 1 and 1024
         if dim < 1 or dim > 1024:
             raise ValueError("Jina embedding dimension must be between 1 and 1024.")
@@ -136,22 +310,20 @@ class Embedder:
                 f"Rate limit exceeded: {response.status_code}, {response.text}"
             )
         
-        ## When the input is too long, we need to segment the text
-        elif response.status_code == 400:
-            ebd = []
-            for text in texts:
-                chunks = self._Jina_segmenter(text, max_token=MAX_TOKENS)
-                token_counts = [len(chunk) for chunk in chunks]
-                chunk_embedding = self.get_embedding(chunks)
-                weighted_avg = np.average(chunk_embedding, weights=token_counts, axis=0)
-                ebd.append(weighted_avg)
-            return np.array(ebd, dtype="f")
+        ## The token estimate missed a text that is too long. Bisect the batch until that text is on its own and
+        ## segment only it, the other texts are embedded as they are.
+        elif response.status_code == 400 and segment_on_error:
+            if len(texts) == 1:
+                return self._embed_long_texts(texts, [0], lambda batch: self._get_jina_embedding(batch, dim=dim, segment_on_error=False))
+            middle = len(texts) // 2
+            return np.concatenate([self._get_jina_embedding(texts[:middle], dim=dim),
+                                   self._get_jina_embedding(texts[middle:], dim=dim)])
             
         else:
             print(f"Error: {response.status_code}, {response.text}")
             raise Exception(f"Failed to get embedding from Jina API: {response.status_code}, {response.text}")
     
-    @on_exception(expo, HTTPRequests.exceptions.RequestException, max_time=30)
+    @on_exception(expo, OSError, max_time=30)
     def _get_openai_embedding(self, texts: list) -> np.ndarray:
         """Fetches embeddings from the OpenAI API and returns them as a NumPy array. Requires OpenAI API key in .env file."""
         texts = [text.replace("\n", " ") for text in texts]  # Clean text input
@@ -207,9 +379,73 @@ class Embedder:
             return reps
         
         return _encode(self, texts)
+
+    def _get_onnx_embedding(self, texts: list) -> np.ndarray:
+        """Generates embeddings with the ONNX Runtime export, pooled and normalized like the PyTorch path."""
+        batch_dict = self.tokenizer(texts, max_length=512, padding=True, truncation=True, return_tensors='np', return_attention_mask=True)
+        feed = {name: value for name, value in batch_dict.items() if name in self.onnx_inputs}
+        hidden = self.session.run(["last_hidden_state"], feed)[0]
+        reps = _weighted_mean_pooling(hidden, batch_dict["attention_mask"])
+        return _normalize(reps)
     
-    @on_exception(expo, HTTPRequests.exceptions.RequestException, max_time=30)
-    def _Jina_segmenter(self, text: str, max_token: int, max_chunk = None, merge_precision = 128) -> list[str]:
+    def _segment(self, text: str, max_token: int, **kwargs) -> list[str]:
+        """Segments a text with the segmenter chosen for this Embedder. See _Jina_segmenter for the arguments."""
+        if self.segmenter == 'local':
+            return self._local_segmenter(text, max_token, **kwargs)
+        return self._Jina_segmenter(text, max_token, **kwargs)
+
+    def _count_tokens(self, text: str) -> int:
+        """Token count with the loaded tokenizer, or the estimate_tokens estimate for API backends."""
+        if getattr(self, 'tokenizer', None) is not None:
+            return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+        return estimate_tokens(text)
+
+    def _local_segmenter(self, text: str, max_token: int, max_chunk = None, merge_precision = 128, approximate_merge = False, batched_merge = False) -> list[str]:
+        """
+        Offline counterpart of _Jina_segmenter. Splits on paragraph and sentence boundaries (including 。！？)
+        and packs whole sentences into chunks of at most max_token tokens. A chunk is closed early at a
+        paragraph break once it is half full. Sentences longer than max_token are cut into pieces.
+        Joining the chunks gives back the text.
+
+        Args:
+            text (str): The text to be segmented.
+            max_token (int): The maximum number of tokens allowed in each chunk.
+            max_chunk (int | None, optional): The maximum number of chunks to generate. Defaults to None.
+            merge_precision, approximate_merge, batched_merge: As for _Jina_segmenter.
+
+        Returns:
+            list[str]: A list of segmented chunks.
+        """
+        chunks = []
+        current, current_tokens = "", 0
+        for sentence in _SENTENCE.findall(text):
+            tokens = self._count_tokens(sentence)
+            if current and current_tokens + tokens > max_token:
+                chunks.append(current)
+                current, current_tokens = "", 0
+            ## cut a sentence that does not fit in a chunk on its own
+            while tokens > max_token:
+                cut = max(1, len(sentence) * max_token // tokens)
+                chunks.append(sentence[:cut])
+                sentence = sentence[cut:]
+                tokens = self._count_tokens(sentence)
+            current += sentence
+            current_tokens += tokens
+            if sentence.count("\n", len(sentence.rstrip())) >= 2 and current_tokens >= max_token // 2:
+                chunks.append(current)
+                current, current_tokens = "", 0
+        if current.strip():
+            chunks.append(current)
+        elif current and chunks:
+            chunks[-1] += current
+
+        if max_chunk is not None and len(chunks) >= max_chunk:
+            chunks = self._iterative_sequential_merge(chunks, max_chunk, merge_precision,
+                                                      approximate=approximate_merge, batched=batched_merge)
+        return chunks
+
+    @on_exception(expo, OSError, max_time=30)
+    def _Jina_segmenter(self, text: str, max_token: int, max_chunk = None, merge_precision = 128, approximate_merge = False, batched_merge = False) -> list[str]:
         """
         Segments a given text into chunks using the Jina API, they merge the chunks based on semantic similarity to max_chunk number of chunks.
 
@@ -218,6 +454,8 @@ class Embedder:
             max_token (int): The maximum number of tokens allowed in each chunk.
             max_chunk (int | None, optional): The maximum number of chunks to generate. Defaults to None.
             merge_precision (int, optional): The precision used for merging chunks, only need if merge chunks. Defaults to 128.
+            approximate_merge (bool, optional): Approximate merged embeddings locally instead of re-embedding them. Defaults to False.
+            batched_merge (bool, optional): Merge in rounds with one batched re-embedding request per round. Defaults to False.
 
         Returns:
             list[str]: A list of segmented chunks.
@@ -228,6 +466,7 @@ class Embedder:
         Note:
             This function requires a Jina API key in the .env file.
         """
+        import requests as HTTPRequests ## some packages already have "requests"
         url = 'https://segment.jina.ai/'
         headers = {
             'Content-Type': 'application/json',
@@ -242,57 +481,189 @@ class Embedder:
         response = HTTPRequests.post(url, headers=headers, json=data)
         chunks = response.json().get('chunks', [])
         if max_chunk is not None and len(chunks) >= max_chunk:
-            chunks = self._iterative_sequential_merge(chunks, max_chunk, merge_precision)
+            chunks = self._iterative_sequential_merge(chunks, max_chunk, merge_precision,
+                                                      approximate=approximate_merge, batched=batched_merge)
         return chunks
     
-    def _iterative_sequential_merge(self, chunked_text, target_count, embedding_dim):
+    def _iterative_sequential_merge(self, chunked_text, target_count, embedding_dim, approximate=False, batched=False):
         """
         Iteratively merge sequentially adjacent text chunks based on semantic similarity
         until a target count is reached.
 
+        The adjacent pairs live in a heap keyed by cosine similarity over L2-normalized embeddings, and the
+        chunks in a doubly linked list, so each merge costs O(log n) instead of a rescan of all pairs and a
+        copy of the embedding matrix. Heap entries made stale by a merge are skipped when popped.
+
         Args:
-            text_list (list of str): List of textual elements to merge.
-            embedder: Embedder object with a method `_get_jina_embedding(chunked_text, dim)`.
+            chunked_text (list of str): List of textual elements to merge.
             target_count (int): Desired number of elements in the final list.
             embedding_dim (int): Dimension of the embeddings.
+            approximate (bool): Approximate the embedding of a merged chunk locally with the token-weighted
+                mean of its parts, instead of re-embedding the merged text with one API call per merge.
+            batched (bool): Merge in rounds instead of one pair at a time, see _round_merge.
 
         Returns:
             list of str: Merged list of text elements.
         """
-        text_chunks = chunked_text.copy() # create a copy of the text chunks so that the original list is not modified
+        text_chunks = list(chunked_text) # copy so that the original list is not modified
         print(f"Initial number of chunks: {len(text_chunks)}")
         print(f"Target number of chunks: {target_count}")
         ## Check if the target count is already reached
         if len(text_chunks) <= target_count:
             return text_chunks
-        
-        chunk_embedding = self._get_jina_embedding(text_chunks, dim = embedding_dim)
-        # list of similarity of adjacent chunks
-        similarities = [
-            1 - cosine(chunk_embedding[i], chunk_embedding[i + 1])
-            for i in range(len(chunk_embedding) - 1)
-        ]
+        if batched:
+            return self._round_merge(text_chunks, target_count, embedding_dim, approximate=approximate)
+
+        n = len(text_chunks)
+        embeddings = _normalize(self._get_jina_embedding(text_chunks, dim=embedding_dim))
+        tokens = [estimate_tokens(text) for text in text_chunks]
+        prev = list(range(-1, n - 1))
+        next_ = list(range(1, n + 1))
+        next_[-1] = -1
+        version = [0] * n # bumped whenever a chunk changes, older heap entries become stale
+
+        ## similarity of all adjacent chunks at once
+        similarities = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
+        heap = [(-similarity, i, i + 1, 0, 0) for i, similarity in enumerate(similarities.tolist())]
+        heapq.heapify(heap)
+
+        count = n
+        while count > target_count and heap:
+            _, left, right, left_version, right_version = heapq.heappop(heap)
+            if next_[left] != right or version[left] != left_version or version[right] != right_version:
+                continue # stale pair
+
+            ## merge right into left and unlink right
+            text_chunks[left] = f"{text_chunks[left]} {text_chunks[right]}"
+            text_chunks[right] = None
+            if approximate:
+                merged = embeddings[left] * tokens[left] + embeddings[right] * tokens[right]
+                embeddings[left] = merged / (np.linalg.norm(merged) or 1.0)
+            else:
+                embeddings[left] = _normalize(self._get_jina_embedding([text_chunks[left]], dim=embedding_dim))[0]
+            tokens[left] += tokens[right]
+            version[left] += 1
+            version[right] += 1
+            next_[left] = next_[right]
+            if next_[left] != -1:
+                prev[next_[left]] = left
+            count -= 1
+
+            ## new similarities with the neighbours
+            for a, b in ((prev[left], left), (left, next_[left])):
+                if a != -1 and b != -1:
+                    heapq.heappush(heap, (-float(embeddings[a] @ embeddings[b]), a, b, version[a], version[b]))
+
+        return [text for text in text_chunks if text is not None]
+
+    def _round_merge(self, text_chunks, target_count, embedding_dim, approximate=False):
+        """
+        Round-based variant of _iterative_sequential_merge for the real API.
+
+        Each round takes the most similar adjacent pairs that do not share a chunk, at most half of the
+        chunks still to be removed, merges them all and re-embeds every merged chunk in one batched request.
+        Reducing n chunks to target_count thus takes about log2(n - target_count) API calls instead of
+        n - target_count. Capping a round at half the remaining merges keeps the result close to the greedy
+        one-pair-at-a-time merge.
+
+        Args:
+            text_chunks (list of str): Chunks to merge, longer than target_count.
+            target_count (int): Desired number of chunks.
+            embedding_dim (int): Dimension of the embeddings.
+            approximate (bool): Use the token-weighted mean of the parts instead of re-embedding.
+
+        Returns:
+            list of str: Merged list of text elements.
+        """
+        embeddings = _normalize(self._get_jina_embedding(text_chunks, dim=embedding_dim))
+        tokens = [estimate_tokens(text) for text in text_chunks]
+
         while len(text_chunks) > target_count:
-            ## Find the most similar adjacent chunks, merge them and remove the second chunk
-            ## Then update the similarity scores
-            max_idx = np.argmax(similarities)
-            print(f"Merge chunk {max_idx} and {max_idx+1} with a similarity score of {np.max(similarities)}. New length: {len(text_chunks)}")    
-
-            merged_text = f"{chunked_text[max_idx]} {chunked_text[max_idx + 1]}"
-            text_chunks[max_idx] = merged_text
-            text_chunks.pop(max_idx + 1)
-            #print(merged_text)
-
-            ## update embedding
-            chunk_embedding[max_idx] = self._get_jina_embedding([merged_text], dim = embedding_dim)[0]
-            chunk_embedding = np.delete(chunk_embedding, max_idx + 1, axis=0)
-
-            # Update similarities
-            if max_idx > 0:  # Update similarity with the previous neighbor
-                similarities[max_idx - 1] = 1 - cosine(chunk_embedding[max_idx - 1], chunk_embedding[max_idx])
-            if max_idx < len(similarities) - 1:  # Update similarity with the next neighbor
-                similarities[max_idx] = 1 - cosine(chunk_embedding[max_idx], chunk_embedding[max_idx + 1])
-            # Remove the similarity for the merged element
-            similarities.pop(max_idx)
+            excess = len(text_chunks) - target_count
+            similarities = np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:])
+
+            ## most similar pairs first, skipping pairs that overlap an already chosen one
+            taken = np.zeros(len(text_chunks), dtype=bool)
+            starts = []
+            for i in np.argsort(-similarities, kind="stable"):
+                if not taken[i] and not taken[i + 1]:
+                    taken[i] = taken[i + 1] = True
+                    starts.append(int(i))
+                    if len(starts) == (excess + 1) // 2:
+                        break
+            starts.sort()
+            print(f"Merge {len(starts)} pairs in one round. New length: {len(text_chunks) - len(starts)}")
+
+            ## rebuild the chunk list, merged pairs in place of their parts
+            new_chunks, new_tokens, rows, merged = [], [], [], []
+            i = 0
+            pair = set(starts)
+            while i < len(text_chunks):
+                if i in pair:
+                    merged.append(len(new_chunks))
+                    new_chunks.append(f"{text_chunks[i]} {text_chunks[i + 1]}")
+                    new_tokens.append(tokens[i] + tokens[i + 1])
+                    rows.append(i)
+                    i += 2
+                else:
+                    new_chunks.append(text_chunks[i])
+                    new_tokens.append(tokens[i])
+                    rows.append(i)
+                    i += 1
+
+            new_embeddings = embeddings[rows]
+            if approximate:
+                left = np.array(starts)
+                weights = np.array(tokens, dtype="f")[:, None]
+                new_embeddings[merged] = _normalize(embeddings[left] * weights[left] + embeddings[left + 1] * weights[left + 1])
+            else:
+                new_embeddings[merged] = _normalize(self._get_jina_embedding([new_chunks[j] for j in merged], dim=embedding_dim))
+            text_chunks, tokens, embeddings = new_chunks, new_tokens, new_embeddings
 
         return text_chunks
+
+
+def _weighted_mean_pooling(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """NumPy version of the position-weighted mean pooling in _get_torch_embedding."""
+    attention_mask_ = attention_mask * attention_mask.cumsum(axis=1)
+    s = np.sum(hidden * attention_mask_[..., None].astype(hidden.dtype), axis=1)
+    d = attention_mask_.sum(axis=1, keepdims=True).astype(hidden.dtype)
+    return s / d
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalizes rows, so cosine similarity becomes a dot product. A single vector becomes one row."""
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype="f"))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def _make_batches(lengths: list, batch_size: int, max_batch_tokens: int, padded: bool) -> list:
+    """
+    Packs text indices into batches, longest first, so similar lengths end up together.
+
+    Args:
+        lengths (list of int): Token count of every text.
+        batch_size (int): Maximum number of texts per batch.
+        max_batch_tokens (int): Token budget per batch. A text over budget gets a batch of its own.
+        padded (bool): Count the budget as longest text x batch size (padded local batches) instead of the sum.
+
+    Returns:
+        list of list of int: Indices into `lengths`.
+    """
+    batches = []
+    batch, batch_tokens, batch_max = [], 0, 0
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+        new_max = max(batch_max, lengths[i])
+        cost = new_max * (len(batch) + 1) if padded else batch_tokens + lengths[i]
+        if batch and (len(batch) >= batch_size or cost > max_batch_tokens):
+            batches.append(batch)
+            batch, batch_tokens, new_max = [], 0, lengths[i]
+        batch.append(i)
+        batch_tokens += lengths[i]
+        batch_max = new_max
+    if batch:
+        batches.append(batch)
+    return batches
+
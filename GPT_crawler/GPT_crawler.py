@@ -1,13 +1,33 @@
 import GPT_crawler_utils as GPT_crawler
-from openai import OpenAI
 from dotenv import load_dotenv
 import json
 import argparse
-import csv
+import asyncio
+import os
+import queue
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
-GPT_MAX_TOKENS = 30000
+if __name__ == '__main__': # run as a script, the shared crawler modules live in the repo root
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawl_state import CrawlState
+from story_sink import StorySink
+from fetcher import Fetcher
+from rate_limit import AdaptiveBackoff
+import content_template
+import pagination
+import snapshot_links
+
+GPT_MAX_TOKENS = 30000 # upper bound of the tokens sent in one request, prompt included
+GPT_PART_TOKENS = 8000 # link lists above this are split into parallel requests, which also bounds the output per request
+CONTENT_CONCURRENCY = 8 # stories extracted at the same time
+LISTING_CONCURRENCY = 4 # predicted listing pages fetched at the same time
+CATEGORY_CONCURRENCY = 4 # categories validated and listed at the same time
+TEMPLATE_MIN_STORIES = 10 # sites with fewer pending stories are not worth learning a template for
 load_dotenv()
-client = OpenAI()
 
 ## Chunks and merge the website snapshot
 excluded_selectors = [
@@ -32,9 +52,12 @@ def get_category_urls(url):
     completion_category = GPT_crawler.find_available_content(snapshot_links)
     categories = json.loads(completion_category.choices[0].message.content).get('categories', {})
 
-    ### check correctness of the categories url
-    for category, category_url in categories.copy().items():
-        if GPT_crawler.GPT_boolean(category_url, "Does this website contain > 10 stories (with title and urls)?"):
+    ### check correctness of the categories url, all categories at once
+    query = "Does this website contain > 10 stories (with title and urls)?"
+    with ThreadPoolExecutor(max_workers=max(1, min(CATEGORY_CONCURRENCY, len(categories)))) as executor:
+        valid = dict(zip(categories, executor.map(lambda category_url: GPT_crawler.GPT_boolean(category_url, query), categories.values())))
+    for category in list(categories):
+        if valid[category]:
             print(f"The category '{category}' contains stories for kids.")
         else:
             print(f"The category '{category}' does not contain stories for kids.")
@@ -42,136 +65,485 @@ def get_category_urls(url):
     print()
     return categories
 
-def get_titles_and_urls(categories: dict):
+def _parse_titles(result):
+    """Returns [(title, url)] from a get_titles_and_urls result, as a list of {"title", "url"} or a {title: url} dict."""
+    titles = result.get('titles_and_urls', [])
+    if isinstance(titles, dict):
+        return list(titles.items())
+    return [(item.get('title', ""), item.get('url', "")) for item in titles if isinstance(item, dict)]
+
+def extract_titles_and_urls(snapshot, page_url, page=1, full_page=False, label=""):
+    '''
+    Extracts the story titles and urls and the next page from a list page snapshot with the LLM.
+
+    The snapshot is pre-processed locally first: in link mode only the story-link group and the pagination links
+    of the "Links/Buttons:" section are kept (see snapshot_links.prepare_links); in full page mode the page is split
+    at line breaks. Parts over the token budget are sent as parallel requests and their results merged. `label` prefixes
+    the log lines, e.g. the category when several categories are listed at once.
+
+    Returns:
+        tuple: ([{"title", "url"}], next_page)
+    '''
+    start = time.perf_counter()
+    budget = min(GPT_PART_TOKENS, GPT_MAX_TOKENS - GPT_crawler.count_tokens(GPT_crawler.load_prompt('./2024-11-19-get_title_and_url.md')))
+    page_note = f"Current Page Number: {page}"
+    if full_page:
+        parts = [part if page_note in part else f"{part}\n{page_note}" for part in snapshot_links.split_text(snapshot, budget)]
+        print(f"{label}Full page: {GPT_crawler.count_tokens(snapshot)} tokens, {len(parts)} request(s)")
+    else:
+        parts, stats = snapshot_links.prepare_links(snapshot, page_url, budget, page_note=page_note)
+        print(f"{label}Links: {stats['links']} -> {stats['kept_links']}, tokens {stats['tokens']} -> {stats['kept_tokens']}, {stats['parts']} request(s)")
+
+    with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+        results = [json.loads(completion.choices[0].message.content)
+                   for completion in executor.map(GPT_crawler.get_titles_and_urls, parts)]
+    titles = {}
+    for result in results:
+        for title, url in _parse_titles(result):
+            titles.setdefault(title, url)
+    ## the parts see the same pagination links, take the next page most of them agree on
+    next_pages = Counter(result.get('next_page', "") for result in results if result.get('next_page'))
+    next_page = next_pages.most_common(1)[0][0] if next_pages else ""
+    print(f"{label}{len(titles)} titles in {time.perf_counter() - start:.1f}s")
+    return [{'title': title, 'url': url} for title, url in titles.items()], next_page
+
+def _list_page(page_url, page, full_page=False, snapshot=None, label=""):
+    """Fetches (unless `snapshot` is given) and extracts one listing page. Returns (snapshot, [{"title", "url"}], LLM next page)."""
+    if snapshot is None:
+        snapshot = f"{GPT_crawler.get_text_snapshot(page_url, exclude_selector=excluded_selectors, links_at_end=True)}\nCurrent Page Number: {page}" # This might help the model to stop at the end of the page
+    titles_and_urls_list, next_page = extract_titles_and_urls(snapshot, page_url, page=page, full_page=full_page, label=label)
+    return snapshot, titles_and_urls_list, next_page
+
+def find_next_page(snapshot, page_url, page, llm_next_page, label=""):
+    '''
+    Decides the next listing page locally with pagination.detect_pagination ("Next"/"下一页"/"»" links, page number
+    sequences). When the heuristics disagree, the next page the LLM extracted breaks the tie if it is one of the candidates.
+    Whenever the heuristics find no next page but the LLM does, the LLM's next page is validated with GPT_boolean as before.
+
+    Returns:
+        tuple: (next page or "", urls of the following pages up to the predicted last page, snapshot of the next page or None)
+    '''
+    detected = pagination.detect_pagination(snapshot, page_url, page)
+    if llm_next_page and snapshot_links.normalize_url(llm_next_page, page_url) == snapshot_links.normalize_url(page_url, page_url):
+        llm_next_page = "" # the LLM pointed back at the current page
+    if detected['agree'] and (detected['next_page'] or not llm_next_page):
+        return detected['next_page'], detected['page_urls'], None
+    candidates = {snapshot_links.normalize_url(url, page_url): url for urls in detected['signals'].values() for url in urls}
+    if llm_next_page and snapshot_links.normalize_url(llm_next_page, page_url) in candidates:
+        return candidates[snapshot_links.normalize_url(llm_next_page, page_url)], [], None
+    if not llm_next_page:
+        return "", [], None
+
+    ## validate the next page exists
+    print(f"{label}Pagination heuristics found no agreed next page ({detected['signals']}), asking the LLM.")
+    query = f"the current page is {page}, does this page have a link to next page or page {page+1}?"
+    snapshot = f"{GPT_crawler.get_text_snapshot(llm_next_page, exclude_selector=excluded_selectors, links_at_end=True)}\nCurrent Page Number: {page}" # This might help the model to stop at the end of the page
+    if GPT_crawler.GPT_boolean(snapshot, query):
+        return llm_next_page, [], snapshot
+    print(f"{label}Next page does not exist.")
+    return "", [], None
+
+def _crawl_category(category, category_url, emit, progress):
     '''
-    Get the titles and urls of the stories of each category in the categories dictionary.
+    Lists the stories of one category page by page and calls `emit(title, url)` for each of them as soon as its page is
+    extracted. When the pagination of a listing page reveals the last page (e.g. links to pages 2 ... 12), the remaining
+    pages are fetched and extracted in parallel instead of one after the other. `progress` is updated with the pages and
+    titles done so far.
+    '''
+    label = f"[{category}] "
+    send_full_page = False # whether send full page to the model
+    page = 0
+    next_page = category_url
+    cached_snapshot = None  # Cache the valid snapshot
+
+    def done(page, titles_and_urls_list):
+        for title_and_url in titles_and_urls_list:
+            emit(title_and_url.get('title', ""), title_and_url.get('url', ""))
+        progress['pages'] += 1
+        progress['titles'] += len(titles_and_urls_list)
+        print(f"{label}page {page}: {len(titles_and_urls_list)} titles, {progress['titles']} so far")
+
+    while next_page:
+        page += 1
+        page_url = next_page
+
+        # Fetch or reuse snapshot
+        snapshot = None
+        if cached_snapshot and cached_snapshot.get("url") == next_page:
+            snapshot = cached_snapshot["snapshot"]
+        cached_snapshot = None  # Reset cache
+        snapshot, titles_and_urls_list, llm_next_page = _list_page(page_url, page, send_full_page, snapshot, label)
+
+        ## if the crawled content is empty, try to crawl the full page
+        if not titles_and_urls_list and not send_full_page:
+            print(f"{label}Empty content. Setting send_full_page to True and retrying...")
+            send_full_page = True
+            page -= 1
+            next_page = page_url
+            cached_snapshot = {"url": page_url, "snapshot": snapshot}
+            continue # restart the loop with full page mode
+
+        done(page, titles_and_urls_list)
+        next_page, page_urls, next_snapshot = find_next_page(snapshot, page_url, page, llm_next_page, label)
+        if next_snapshot is not None:
+            cached_snapshot = {"url": next_page, "snapshot": next_snapshot}
+
+        ## 已知最后一页时, 剩下的列表页并行抓取
+        if len(page_urls) > 1:
+            print(f"{label}pages {page + 1}-{page + len(page_urls)} predicted, fetching them in parallel...")
+            next_page = ""
+            first, empty = page + 1, []
+            with ThreadPoolExecutor(max_workers=min(len(page_urls), LISTING_CONCURRENCY)) as executor:
+                ## executor.map keeps the page order: each page is emitted as soon as it and the pages before it are done
+                results = executor.map(lambda item: _list_page(item[1], item[0], send_full_page, label=label),
+                                       enumerate(page_urls, start=page + 1))
+                for offset, (predicted_url, (snapshot, titles_and_urls_list, llm_next_page)) in enumerate(zip(page_urls, results)):
+                    if not titles_and_urls_list: # a page that failed, or predicted past the real last page
+                        empty.append(first + offset)
+                        continue
+                    page = first + offset
+                    page_url = predicted_url
+                    done(page, titles_and_urls_list)
+            if empty:
+                print(f"{label}no titles on predicted page(s) {', '.join(map(str, empty))}, skipped")
+            if titles_and_urls_list:
+                ## the pagination of the last predicted page may reveal more pages
+                next_page, _, next_snapshot = find_next_page(snapshot, page_url, page, llm_next_page, label)
+                if next_snapshot is not None:
+                    cached_snapshot = {"url": next_page, "snapshot": next_snapshot}
+
+def iter_titles_and_urls(categories: dict, concurrency=CATEGORY_CONCURRENCY, summary=None):
+    '''
+    Lists the stories of all categories, `concurrency` categories at a time, and yields (title, url, category) records as
+    soon as their listing page is extracted, so the content stage can start on them right away. A story listed in several
+    categories is yielded once. Prints a per-category summary (pages, titles, time) once every category is done.
+
+    Args:
+        categories (dict): A dictionary of categories and their urls, in the form {"category": "url"}. Should be the output of get_category_urls.
+        concurrency (int): Maximum number of categories listed at the same time.
+        summary (dict | None): If given, filled with {"category": {'pages', 'titles', 'seconds', 'error'}}, where 'error' is the
+            exception that stopped the listing of the category or None.
+    '''
+    records = queue.Queue()
+    summary = {} if summary is None else summary
+    summary.update({category: {'pages': 0, 'titles': 0, 'seconds': 0.0, 'error': None} for category in categories})
+
+    def crawl(category, category_url):
+        start = time.perf_counter()
+        try:
+            _crawl_category(category, category_url, lambda title, url: records.put((title, url, category)), summary[category])
+        except Exception as e:
+            summary[category]['error'] = e
+            print(f"[{category}] listing failed: {e}")
+        finally:
+            summary[category]['seconds'] = time.perf_counter() - start
+            records.put(None) # this category is done
+
+    start = time.perf_counter()
+    seen = set()
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(categories)))) as executor:
+        for category, category_url in categories.items():
+            executor.submit(crawl, category, category_url)
+        finished = 0
+        while finished < len(categories):
+            record = records.get()
+            if record is None:
+                finished += 1
+            elif record[1] not in seen:
+                seen.add(record[1])
+                yield record
+
+    print(f"\nListed {len(seen)} stories from {len(categories)} categories in {time.perf_counter() - start:.1f}s:")
+    for category, stats in summary.items():
+        status = f"failed: {stats['error']}" if stats['error'] is not None else "done"
+        print(f"  {category}: {stats['pages']} pages, {stats['titles']} titles, {stats['seconds']:.1f}s ({status})")
+
+def list_new_stories(categories: dict, state, concurrency=CATEGORY_CONCURRENCY):
+    '''
+    Yields the (title, url, category) records of iter_titles_and_urls that are new to the crawl state, and adds them to it.
+    The listing is only marked done in the state when every category was listed without error, so that the next run lists
+    the failed categories again instead of resuming with the stories found so far.
+    '''
+    summary = {}
+    new_count = 0
+    for title, url, category in iter_titles_and_urls(categories, concurrency, summary):
+        if state.add(url, title, category):
+            new_count += 1
+            yield title, url, category
+    if all(stats['error'] is None for stats in summary.values()):
+        state.set_meta('listing_done', '1')
+    print(f"Found {new_count} new stories.")
+
+def get_titles_and_urls(categories: dict, concurrency=CATEGORY_CONCURRENCY):
+    '''
+    Get the titles and urls of the stories of each category in the categories dictionary, see iter_titles_and_urls.
     
     Args:
         categories (dict): A dictionary of categories and their urls, in the form {"category": "url"}. Should be the output of get_category_urls.
+        concurrency (int): Maximum number of categories listed at the same time.
+
+    Returns:
+        dict: {"title": ("url", "category")}
     '''
-    titles_and_urls = {}  
-    send_full_page = False # whether send full page to the model
-    for category, category_url in categories.items():
-        print(f"Category: {category}\nURL: {category_url}\n")
-        page = 0
-        next_page = category_url
-        cached_snapshot = None  # Cache the valid snapshot
-
-        while next_page:
-            page += 1
-            print(f"[Page: {page}]")
-
-            # Fetch or reuse snapshot
-            if cached_snapshot and cached_snapshot.get("url") == next_page:
-                snapshot = cached_snapshot["snapshot"]
-            else:
-                snapshot = f"{GPT_crawler.get_text_snapshot(next_page, exclude_selector=excluded_selectors, links_at_end=True)}\nCurrent Page Number: {page}" # This might help the model to stop at the end of the page
-                cached_snapshot = None  # Reset cache
+    return {title: (url, category) for title, url, category in iter_titles_and_urls(categories, concurrency)}
 
-            snapshot_links = snapshot[snapshot.find("Links/Buttons:"):]
+def _parse_story(completion):
+    """Returns (content, author) from a get_content completion."""
+    story = json.loads(completion.choices[0].message.content).get('content', {})
+    # the response schema nests the story fields in "content"
+    if isinstance(story, dict):
+        return story.get('content', ''), story.get('author', '')
+    return story, ''
 
-            if not send_full_page:
-                completion_titles = GPT_crawler.get_titles_and_urls(snapshot_links)
-            else:
-                completion_titles = GPT_crawler.get_titles_and_urls(snapshot)
-
-            titles_and_urls_list = json.loads(completion_titles.choices[0].message.content).get('titles_and_urls', [])
-            
-            ## if the crawled content is empty, try to crawl the full page
-            if not titles_and_urls_list and not send_full_page:
-                print("Empty content. Setting send_full_page to True and retrying...")
-                send_full_page = True
-                page -= 1
-                continue # restart the loop with full page mode
-
-            for title_and_url in titles_and_urls_list:
-                title = title_and_url.get('title', "")
-                url = title_and_url.get('url', "")
-                titles_and_urls[title] = (url, category)
-                print(f"{title}: {titles_and_urls[title]}")
-
-            next_page = json.loads(completion_titles.choices[0].message.content).get('next_page', "")
-            ## validate the next page exists
-            query = f"the current page is {page}, does this page have a link to next page or page {page+1}?"
-            snapshot = f"{GPT_crawler.get_text_snapshot(next_page, exclude_selector=excluded_selectors, links_at_end=True)}\nCurrent Page Number: {page}" # This might help the model to stop at the end of the page
-            if GPT_crawler.GPT_boolean(snapshot, query):
-                cached_snapshot = {"url": next_page, "snapshot": snapshot}
-            else:
-                print(f"Next page does not exist.")
-                next_page = ""
+def get_content(titles_and_urls, state=None, sink=None, concurrency=CONTENT_CONCURRENCY, use_templates=False):
+    '''
+    Get the content of each story with the LLM, `concurrency` stories at a time.
 
-            print(f"Next page: {next_page}")
-        return titles_and_urls
+    Args:
+        titles_and_urls (dict | iterable): A dictionary in the form {"title": ("url", "category")}, the output of get_titles_and_urls,
+            or an iterable of (title, url, category) records such as iter_titles_and_urls. An iterable is consumed in a background
+            thread, and each story is extracted as soon as it arrives.
+        state (CrawlState | None): If given, every story is saved to the crawl state as soon as it is extracted, so an interrupted run can resume.
+        sink (StorySink | None): If given, every story is written to it in completion order.
+        concurrency (int): Maximum number of stories processed at the same time.
+        use_templates (bool): Learn a content template per site from the LLM extraction of a few sample stories and extract the
+            other stories of the site locally from the raw html (see content_template). Stories the template is not confident about
+            still go to the LLM. Learned templates are kept in the crawl state.
+    '''
+    return asyncio.run(_get_content_async(titles_and_urls, state, sink, concurrency, use_templates))
 
-def get_content(titles_and_urls):
+async def _get_content_async(titles_and_urls, state, sink, concurrency, use_templates=False):
     stories = {}
+    backoff_state = GPT_crawler.llm_backoff or AdaptiveBackoff() # shared by all workers
+    semaphore = asyncio.Semaphore(concurrency)
+    fetcher = Fetcher(max_workers=concurrency, encoding=None) if use_templates else None # raw html for the templates
+    timing = {'llm': [0, 0.0], 'template': [0, 0.0]} # stories and seconds per extraction method
+
+    async def fetch(title, url, category):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                completion = await GPT_crawler.get_content_async(url, backoff_state)
+                content, author = _parse_story(completion)
+                error = None if content else "Empty content"
+            except Exception as e:
+                content, author, error = '', '', e
+            timing['llm'][0] += 1
+            timing['llm'][1] += time.perf_counter() - start
+            return title, url, category, content, author, error
 
-    for title, (url, category) in titles_and_urls.items():
-        print(f"Title: {title}")
-        print(f"Category: {category}")
-        print(f"URL: {url}")
-        print("")
-        completion = GPT_crawler.get_content(url)
+    async def learn(host, sample_tasks):
+        ## the sample stories are extracted by the LLM anyway, their results double as training data
+        results = await asyncio.gather(*sample_tasks)
+        samples = []
+        for _, url, _, content, author, error in results:
+            if error is None:
+                try:
+                    samples.append((await asyncio.to_thread(fetcher.get, url), content, author))
+                except Exception as e:
+                    print(f"Error while fetching the html of {url}: {e}")
         try:
-            content = json.loads(completion.choices[0].message.content).get('content', '')
-            author = json.loads(completion.choices[0].message.content).get('author', '')
-            next_page = json.loads(completion.choices[0].message.content).get('next_page', "") # should be empty
-        except Exception as e:
-            print(f"Error while fetching story content: {e}")
-            print(completion)
-            content = ''
-            author = ''
-            next_page = "" # currently not support multi-page story
-
-        stories[title] = {
-            'title': title,
-            'author': author,
-            'content': content,
-            'category': category,
-            'url': url
-        }
+            template = await asyncio.to_thread(content_template.learn_template, samples)
+        except Exception as e: # the stories of the site then go to the LLM instead of failing with the template
+            print(f"{host}: learning a template failed ({e}), using the LLM")
+            return None
+        if template is not None and state is not None:
+            state.set_meta(f'template:{host}', json.dumps(template.to_dict()))
+        print(f"{host}: {'learned template ' + repr(template.selector) if template else 'no template, using the LLM'}")
+        return template
+
+    async def extract(title, url, category, template_task):
+        template = await template_task
+        if template is not None and template.active:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    html = await asyncio.to_thread(fetcher.get, url)
+                    content, author, confidence = await asyncio.to_thread(template.extract, html)
+                except Exception as e:
+                    content, author, confidence = '', '', 0.0
+                    print(f"Template extraction of '{title}' ({url}) failed: {e}")
+                timing['template'][0] += 1
+                timing['template'][1] += time.perf_counter() - start
+            template.observe(confidence < content_template.MIN_CONFIDENCE)
+            if confidence >= content_template.MIN_CONFIDENCE:
+                return title, url, category, content, author, None
+        return await fetch(title, url, category)
+
+    ## 故事可以一次给全 (dict), 也可以边列出边抓取 (iterable, 在后台线程里读取)
+    records = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+    if isinstance(titles_and_urls, dict):
+        host_counts = Counter(urlparse(url).netloc for url, _ in titles_and_urls.values())
+        for title, (url, category) in titles_and_urls.items():
+            records.put_nowait((title, url, category))
+        records.put_nowait(None)
+        producer = None
+    else:
+        host_counts = None # unknown up front, every site gets a template once its samples are in
+
+        def produce():
+            try:
+                for record in titles_and_urls:
+                    loop.call_soon_threadsafe(records.put_nowait, record)
+            finally:
+                loop.call_soon_threadsafe(records.put_nowait, None)
+        producer = asyncio.create_task(asyncio.to_thread(produce))
+
+    templates = {} # host -> task or future resolving to a ContentTemplate or None
+    samples = defaultdict(list) # host -> sample tasks extracted by the LLM
+    n_samples = content_template.TRAIN_SAMPLES + content_template.HOLDOUT_SAMPLES
+
+    def schedule(title, url, category):
+        host = urlparse(url).netloc
+        if use_templates and host not in templates:
+            saved = state.get_meta(f'template:{host}') if state is not None else None
+            if saved:
+                templates[host] = loop.create_future()
+                templates[host].set_result(content_template.ContentTemplate.from_dict(json.loads(saved)))
+                print(f"{host}: reusing template {templates[host].result().selector!r}")
+            elif host_counts is None or host_counts[host] >= TEMPLATE_MIN_STORIES:
+                task = asyncio.create_task(fetch(title, url, category))
+                samples[host].append(task)
+                if len(samples[host]) == n_samples:
+                    templates[host] = asyncio.create_task(learn(host, samples[host]))
+                return task
+        if host in templates:
+            return asyncio.create_task(extract(title, url, category, templates[host]))
+        return asyncio.create_task(fetch(title, url, category))
 
+    running = set()
+    scheduled = {} # task -> (title, url, category)
+    getter = asyncio.create_task(records.get())
+    done, total = 0, 0
+    while getter is not None or running:
+        finished, _ = await asyncio.wait(running | {getter} if getter is not None else running, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            if task is getter:
+                record = task.result()
+                if record is None:
+                    getter = None
+                else:
+                    total += 1
+                    task = schedule(*record)
+                    scheduled[task] = record
+                    running.add(task)
+                    getter = asyncio.create_task(records.get())
+                continue
+
+            running.discard(task)
+            done += 1
+            try:
+                title, url, category, content, author, error = task.result()
+            except Exception as e: # the workers catch their own errors, this only guards the stage
+                (title, url, category), content, author, error = scheduled[task], '', '', e
+            del scheduled[task]
+            if error is not None:
+                print(f"Error while fetching story content of '{title}' ({url}): {error}")
+            else:
+                print(f"[{done}/{total}] {title} ({category})")
+
+            stories[title] = {
+                'title': title,
+                'author': author,
+                'content': content,
+                'category': category,
+                'url': url
+            }
+            if state is not None:
+                if error is None:
+                    state.mark_done(url, content, author=author)
+                else:
+                    state.mark_failed(url, error)
+            if sink is not None and error is None:
+                sink.write(stories[title])
+    if producer is not None:
+        await producer # re-raises an error of the listing
+
+    if backoff_state.rate_limits:
+        print(f"Hit {backoff_state.rate_limits} rate limits.")
+    if use_templates:
+        fetcher.close()
+        for host, template_task in templates.items():
+            try:
+                template = await template_task
+            except Exception:
+                template = None
+            if template is not None:
+                print(f"{host}: {template.extracted} stories extracted by template, {template.fallbacks} fell back to the LLM")
+        (llm_count, llm_time), (template_count, template_time) = timing['llm'], timing['template']
+        print(f"LLM calls: {llm_count} ({llm_time / max(llm_count, 1):.2f}s per story), "
+              f"template extractions: {template_count} ({template_time / max(template_count, 1):.3f}s per story)")
     return stories
 
 def main(args):
+    state = CrawlState(args.state or os.path.splitext(args.output)[0] + '.state.sqlite')
+    GPT_crawler.snapshot_backend = args.snapshot_backend
+    GPT_crawler.enable_shared_rate_limit(max_concurrent=args.concurrency) # one rate-limited LLM client for every stage
+    snapshot_cache = None
+    if args.snapshot_cache:
+        snapshot_cache = GPT_crawler.enable_snapshot_cache(args.snapshot_cache, ttl=args.snapshot_ttl * 3600)
+    completion_cache = None
+    if args.completion_cache:
+        completion_cache = GPT_crawler.enable_completion_cache(args.completion_cache, offline=args.offline)
+
     ## Step 1
-    ## Get the categories and their urls
-    categories = get_category_urls(args.input) 
+    ## Get the categories and their urls (reuse the ones found by an earlier run)
+    categories = json.loads(state.get_meta('categories', 'null') or 'null')
+    if categories is None or args.refresh:
+        categories = get_category_urls(args.input)
+        state.set_meta('categories', json.dumps(categories, ensure_ascii=False))
     for category, category_url in categories.items():
         print(category)
         print(category_url)
 
     ## Step 2
-    ## Get the titles and urls of the stories of each category
-    print("\nFetching titles and urls of the stories of each category...\n")
-    titles_and_urls = get_titles_and_urls(categories) 
+    ## List the stories of all categories concurrently; each new story is handed to step 3 as soon as its page is listed
+    ## Skipped when resuming an interrupted run, --refresh looks for new stories
+    pending = [(title, url, category) for url, (title, category) in state.pending().items()] # stories not done by earlier runs
+    stories = pending
+    if state.get_meta('listing_done') != '1' or args.refresh:
+        print("\nFetching titles and urls of the stories of each category...\n")
+
+        def listed():
+            yield from pending
+            yield from list_new_stories(categories, state, args.category_concurrency)
+        stories = listed()
+    else:
+        print(f"{len(pending)} stories to fetch.")
 
     ## Step 3
-    ## Get the content of the stories
-    stories = get_content(titles_and_urls) 
-    # Transform the stories dictionary into a list of dictionaries
-    stories_list = [
-        {
-            'title': title,
-            'author': details.get('author', ''),
-            'content': details.get('content', ''),
-            'category': details.get('category', ''),
-            'url': details.get('url', '')
-        }
-        for title, details in stories.items()
-    ]
-
-    with open(args.output, 'w', newline='') as file:
-        fieldnames = ['title', 'author', 'content', 'category', 'url']
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(stories_list)
+    ## Get the content of the stories that are not done yet, streamed to the output in completion order
+    with StorySink(args.output, ['title', 'author', 'content', 'category', 'url']) as sink:
+        for story in state.iter_stories(): # stories finished by earlier runs
+            sink.write(story)
+        get_content(stories, state=state, sink=sink, concurrency=args.concurrency, use_templates=args.template)
+    state.close()
+
+    if snapshot_cache is not None:
+        stats = snapshot_cache.stats()
+        print(f"Snapshot cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+              f"{stats['entries']} entries, {stats['bytes'] / 2**20:.1f} MiB")
+    if completion_cache is not None:
+        stats = completion_cache.stats()
+        print(f"Completion cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+              f"{stats['saved_tokens']} tokens saved")
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Crawl stories from a website')
     parser.add_argument('-i', '--input', type=str, help='Input an url of the website to be crawled.')
     parser.add_argument('-o', '--output', type=str, help='Output file to save the crawled stories.')
+    parser.add_argument('-s', '--state', type=str, default=None, help='Crawl state database used to resume the crawl. Defaults to <output>.state.sqlite.')
+    parser.add_argument('--snapshot-cache', type=str, default='snapshot_cache.sqlite', help='Snapshot cache database. Pass an empty string to disable the cache.')
+    parser.add_argument('--snapshot-backend', choices=GPT_crawler.SNAPSHOT_BACKENDS, default='jina', help="Take snapshots through r.jina.ai ('jina') or fetch and convert the pages locally ('local').")
+    parser.add_argument('--snapshot-ttl', type=float, default=24 * 7, help='Hours a cached snapshot stays valid.')
+    parser.add_argument('--completion-cache', type=str, default='completion_cache.sqlite', help='Completion cache database. Pass an empty string to disable the cache.')
+    parser.add_argument('--offline', action='store_true', help='Replay completions from the completion cache only, never call the OpenAI API.')
+    parser.add_argument('-c', '--concurrency', type=int, default=CONTENT_CONCURRENCY, help='Number of stories extracted at the same time.')
+    parser.add_argument('--category-concurrency', type=int, default=CATEGORY_CONCURRENCY, help='Number of categories listed at the same time.')
+    parser.add_argument('--template', action='store_true', help='Learn a content template per site from a few LLM extractions and extract the other stories locally.')
+    parser.add_argument('--refresh', action='store_true', help='Look for new categories and stories even if an earlier run finished listing them.')
     args = parser.parse_args()
 
     main(args)
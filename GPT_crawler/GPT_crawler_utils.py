@@ -1,20 +1,116 @@
-from openai import OpenAI, RateLimitError
+from openai import OpenAI, AsyncOpenAI, RateLimitError, InternalServerError
 from dotenv import load_dotenv
 from os import getenv
+from concurrent.futures import Future
+from urllib.parse import urlparse
+import asyncio
 import json
+import threading
 import requests
 import backoff
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from snapshot_cache import SnapshotCache
+from completion_cache import CompletionCache
+from rate_limit import AdaptiveBackoff, retry_after_seconds
+from text_tokens import count_tokens, estimate_tokens # the token estimates of every stage, see text_tokens
 
 load_dotenv()
-client = OpenAI()
+client = None # created on first use, offline replay needs no API key
+async_client = None
+session = requests.Session() # pooled connections to r.jina.ai
+## r.jina.ai answers 429 and 5xx when busy, retry those with backoff (and Retry-After) instead of returning an error snapshot
+_retrying_adapter = HTTPAdapter(max_retries=Retry(total=4, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)))
+session.mount("https://", _retrying_adapter)
+session.mount("http://", _retrying_adapter)
+JINA_READER_URL = "https://r.jina.ai/"
+
+## requests currently in flight, keyed by (url, headers). Identical concurrent requests share one response.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+snapshot_cache = None # SnapshotCache used by get_text_snapshot, see enable_snapshot_cache
+completion_cache = None # CompletionCache used for every chat completion, see enable_completion_cache
+llm_backoff = None # AdaptiveBackoff shared by every completion call, see enable_shared_rate_limit
+llm_slots = None # threading.Semaphore bounding the completion calls in flight
+snapshot_backend = "jina" # default backend of get_text_snapshot: "jina" (r.jina.ai) or "local" (see local_snapshot)
+SNAPSHOT_BACKENDS = ["jina", "local"]
 
 def load_prompt(file):
     with open(file, 'r') as f:
         return f.read()
+
+def enable_snapshot_cache(path="snapshot_cache.sqlite", ttl=7 * 24 * 3600, max_bytes=512 * 2**20):
+    """
+    Turns on the persistent snapshot cache for get_text_snapshot. See SnapshotCache for the arguments.
+
+    Returns:
+        SnapshotCache: The cache, e.g. to read its hit/miss statistics.
+    """
+    global snapshot_cache
+    snapshot_cache = SnapshotCache(path, ttl=ttl, max_bytes=max_bytes)
+    return snapshot_cache
+
+def enable_completion_cache(path="completion_cache.sqlite", offline=False):
+    """
+    Turns on the persistent completion cache. With offline=True no API call is made and a cache miss raises CompletionCacheMiss.
+
+    Returns:
+        CompletionCache: The cache, e.g. to read its hit rate and saved tokens.
+    """
+    global completion_cache
+    completion_cache = CompletionCache(path, offline=offline)
+    return completion_cache
+
+def enable_shared_rate_limit(max_concurrent=8, backoff_state=None):
+    """
+    Makes all threads share one rate-limited LLM client: at most `max_concurrent` completions are in flight,
+    and a rate limit hit by any caller pauses every caller (see AdaptiveBackoff). The per-function retry
+    decorators still retry, after the shared pause.
+
+    Returns:
+        AdaptiveBackoff: The shared backoff state, to be passed on to the async callers (get_content_async).
+    """
+    global llm_backoff, llm_slots
+    llm_backoff = backoff_state or AdaptiveBackoff()
+    llm_slots = threading.Semaphore(max_concurrent)
+    return llm_backoff
+
+def _create_completion(**request):
+    """
+    Calls client.chat.completions.create, going through the completion cache if one is enabled.
+    Identical requests in flight at the same time are sent once.
+    """
+    cache = completion_cache
+    if cache is not None:
+        completion = cache.get(request)
+        if completion is not None:
+            return completion
+
+    def create():
+        global client
+        if client is None:
+            client = OpenAI()
+        if llm_backoff is None:
+            completion = client.chat.completions.create(**request)
+        else:
+            with llm_slots:
+                llm_backoff.wait()
+                try:
+                    completion = client.chat.completions.create(**request)
+                except RateLimitError as e:
+                    llm_backoff.on_rate_limit(retry_after_seconds(e))
+                    raise
+                llm_backoff.on_success()
+        if cache is not None:
+            cache.set(request, completion)
+        return completion
+
+    return _single_flight(("completion", CompletionCache.make_key(request)), create)
     
-def get_text_snapshot(web_url, use_api_key=True, return_format="default", timeout=0, target_selector=[], wait_for_selector=[], exclude_selector=[], remove_image=False, links_at_end=False, images_at_end=False, json_response=False, image_caption=False):
+def get_text_snapshot(web_url, use_api_key=True, return_format="default", timeout=0, target_selector=[], wait_for_selector=[], exclude_selector=[], remove_image=False, links_at_end=False, images_at_end=False, json_response=False, image_caption=False, use_cache=True, backend=None):
     """
-    Fetch a text snapshot of the webpage using r.jina.ai.
+    Fetch a text snapshot of the webpage using r.jina.ai, or locally.
     
     Args:
         web_url (str): The URL of the webpage to process.
@@ -29,15 +125,25 @@ def get_text_snapshot(web_url, use_api_key=True, return_format="default", timeou
         images_at_end (bool): An "Images" section will be created at the end. This gives the downstream LLMs an overview of all visuals on the page, which may improve reasoning.
         json_response (bool): The response will be in JSON format, containing the URL, title, content, and timestamp (if available).
         image_caption (bool): Captions all images at the specified URL, adding 'Image [idx]: [caption]' as an alt tag for those without one. This allows downstream LLMs to interact with the images in activities such as reasoning and summarizing.
+        use_cache (bool): Read and write the snapshot cache, if one is enabled with enable_snapshot_cache. Default is True.
+        backend (str | None): "jina" sends the page through r.jina.ai; "local" fetches it directly and converts it to markdown
+            in-process (local_snapshot), applying target_selector, exclude_selector, remove_image, links_at_end and images_at_end
+            locally. The other options need a browser and are ignored by "local". Defaults to the module's snapshot_backend.
         
     Returns:
         str: The cleaned text content from the webpage, or an error message.
     """
+    backend = backend or snapshot_backend
+    if backend not in SNAPSHOT_BACKENDS:
+        raise ValueError(f"Unknown snapshot backend '{backend}', choose from {SNAPSHOT_BACKENDS}.")
     headers = {}
-    if use_api_key:
+    if backend == "local":
+        use_api_key = False
+    elif use_api_key:
         api_key = 'Bearer ' + getenv("JINAAI_API_KEY")
     else:
         print("No API key found, proceeding without it.")
+    if not use_api_key:
         api_key = None
     
     header_values = {
@@ -51,7 +157,8 @@ def get_text_snapshot(web_url, use_api_key=True, return_format="default", timeou
         "X-With-Links-Summary": "true" if links_at_end else None,
         "X-With-Images-Summary": "true" if images_at_end else None,
         "Accept": "application/json" if json_response else None,
-        "X-With-Generated-Alt": "true" if image_caption else None
+        "X-With-Generated-Alt": "true" if image_caption else None,
+        "X-Backend": "local" if backend == "local" else None # only keeps the two backends apart in the cache
     }
 
     for key, value in header_values.items():
@@ -60,15 +167,25 @@ def get_text_snapshot(web_url, use_api_key=True, return_format="default", timeou
     
     try:
         # Construct the API URL
-        api_url = f"https://r.jina.ai/{web_url}"
+        api_url = f"{JINA_READER_URL}{web_url}"
         
-        # Make a GET request to fetch the cleaned content
-        response = requests.get(api_url, headers=headers)
-        response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
+        cache = snapshot_cache if use_cache else None
+        if cache is not None:
+            text = cache.get(web_url, headers)
+            if text is not None:
+                return text
 
-        # Return the text content of the response
-        return response.text
-    except requests.exceptions.RequestException as e:
+        # Make a GET request to fetch the cleaned content, shared with identical requests in flight
+        if backend == "local":
+            import local_snapshot  # Importing local_snapshot only when needed, it requires lxml
+            fetch = lambda: local_snapshot.get_local_snapshot(web_url, target_selector, exclude_selector, remove_image, links_at_end, images_at_end)
+        else:
+            fetch = lambda: _get_text(api_url, headers)
+        text = _single_flight((api_url, tuple(sorted(headers.items()))), fetch)
+        if cache is not None:
+            cache.set(web_url, headers, text)
+        return text
+    except (requests.exceptions.RequestException, ValueError) as e: # ValueError: a page the local backend cannot parse
         return f"Error fetching text snapshot: {e}"
 
 @backoff.on_exception(backoff.expo, RateLimitError, max_time=60)
@@ -78,7 +195,7 @@ def find_available_content(query_str):
     else:
         content = query_str
 
-    completion = client.chat.completions.create(
+    completion = _create_completion(
         model="gpt-4o",
         messages=[
             {
@@ -139,7 +256,7 @@ def GPT_boolean(query_str, query):
 
     try:
         # OpenAI completion API call
-        completion = client.chat.completions.create(
+        completion = _create_completion(
             model="gpt-4o-mini",
             messages=[
             {"role": "system", "content": "Some times AI returns incorrect urls, You are a helpful assistant that evaluates that checks the webpage snap shot and determine if there actually stories (with title and urls) in that page. Return 'True' if the content is relevant to the query and 'False' otherwise. return false if page not found or story not found."},
@@ -186,7 +303,7 @@ def get_titles_and_urls(query_str):
     else:
         content = query_str
         
-    completion = client.chat.completions.create(
+    completion = _create_completion(
         model="gpt-4o-mini",
         messages=[
             {
@@ -243,73 +360,147 @@ def get_content(query_str):
         content = get_text_snapshot(query_str)
     else:
         content = query_str
-        
-    completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": load_prompt('./2024-11-19-get_content.md')
-                        }
-                    ]
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": content
-                        }
-                    ]
-                }
-            ],
-            temperature=0.0,
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "story_dict",
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "content": {
-                                "description": "A dictionary containing the extracted story information.",
-                                "type": "object",
-                                "properties": {
-                                    "title": {
-                                        "description": "The title of the story.",
-                                        "type": "string"
-                                    },
-                                    "author": {
-                                        "description": "The author of the story, if available. Empty string if unknown.",
-                                        "type": "string"
-                                    },
-                                    "content": {
-                                        "description": "The main content of the story.",
-                                        "type": "string"
-                                    }
+
+    completion = _create_completion(**_content_request(content))
+    return completion
+
+async def get_content_async(query_str, backoff_state, max_retries=8):
+    """
+    Async version of get_content for concurrent workers. Rate limits are handled with `backoff_state`,
+    an AdaptiveBackoff shared by all workers, instead of a per-call retry decorator.
+    """
+    if _is_url(query_str):
+        content = await asyncio.to_thread(get_text_snapshot, query_str)
+    else:
+        content = query_str
+
+    return await _create_completion_async(backoff_state, max_retries, **_content_request(content))
+
+def _content_request(content):
+    return dict(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": load_prompt('./2024-11-19-get_content.md')
+                    }
+                ]
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": content
+                    }
+                ]
+            }
+        ],
+        temperature=0.0,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {
+                "name": "story_dict",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "content": {
+                            "description": "A dictionary containing the extracted story information.",
+                            "type": "object",
+                            "properties": {
+                                "title": {
+                                    "description": "The title of the story.",
+                                    "type": "string"
+                                },
+                                "author": {
+                                    "description": "The author of the story, if available. Empty string if unknown.",
+                                    "type": "string"
                                 },
-                                "required": ["title", "author", "content"],
-                                "additionalProperties": False  # No extra fields allowed
+                                "content": {
+                                    "description": "The main content of the story.",
+                                    "type": "string"
+                                }
                             },
-                            "next_page": {
-                                "description": "The URL of the next page to fetch more content from. Empty string means no more pages.",
-                                "type": "string"
-                            }
+                            "required": ["title", "author", "content"],
+                            "additionalProperties": False  # No extra fields allowed
                         },
-                        "required": ["content", "next_page"],  # Ensure these keys are always present
-                        "additionalProperties": False  # Disallow extra fields in the top-level object
-                    }
+                        "next_page": {
+                            "description": "The URL of the next page to fetch more content from. Empty string means no more pages.",
+                            "type": "string"
+                        }
+                    },
+                    "required": ["content", "next_page"],  # Ensure these keys are always present
+                    "additionalProperties": False  # Disallow extra fields in the top-level object
                 }
-    }
+            }
+        }
     )
-    return completion
 
-def _is_url(url):
+async def _create_completion_async(backoff_state, max_retries=8, **request):
+    """Async counterpart of _create_completion, with a shared AdaptiveBackoff in place of the retry decorator."""
+    global async_client
+    cache = completion_cache
+    if cache is not None:
+        completion = cache.get(request)
+        if completion is not None:
+            return completion
+
+    if async_client is None:
+        async_client = AsyncOpenAI(max_retries=0) # retries are driven by backoff_state
+    for attempt in range(max_retries + 1):
+        await backoff_state.wait_async()
+        try:
+            completion = await async_client.chat.completions.create(**request)
+        except (RateLimitError, InternalServerError) as e: # 429 and 5xx, the API is overloaded
+            backoff_state.on_rate_limit(retry_after_seconds(e))
+            if attempt == max_retries:
+                raise
+            continue
+        backoff_state.on_success()
+        if cache is not None:
+            cache.set(request, completion)
+        return completion
+
+def _get_text(url, headers):
+    response = session.get(url, headers=headers)
+    response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
+
+    # Return the text content of the response
+    return response.text
+
+def _single_flight(key, fetch):
+    """
+    Runs `fetch` once for all callers asking for the same key at the same time.
+    The first caller does the request, the others wait for its result (or exception).
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = _inflight[key] = Future()
+    if not is_owner:
+        return future.result()
+
     try:
-        response = requests.get(url)
-        return response.status_code == 200
-    except requests.exceptions.RequestException:
-        return False
\ No newline at end of file
+        result = fetch()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+def _is_url(url):
+    """
+    Checks whether the string is an http(s) url, without fetching it.
+    Whether the page exists is found out by the snapshot fetch itself.
+    """
+    if not isinstance(url, str) or len(url) > 2048 or any(c.isspace() for c in url.strip()):
+        return False
+    parsed = urlparse(url.strip())
+    return parsed.scheme in ("http", "https") and bool(parsed.netloc)
@@ -0,0 +1,73 @@
+"""
+Benchmark of content_template: API calls and per-story latency of LLM extraction versus a learned template.
+Run from the GPT_crawler directory, e.g. `python benchmarks/content_template_benchmark.py [story urls of one site]`.
+"""
+import os
+import sys
+
+GPT_CRAWLER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(GPT_CRAWLER) # content_template lives one level up
+sys.path.append(os.path.dirname(GPT_CRAWLER)) # and the shared crawler modules in the repo root
+from content_template import HOLDOUT_SAMPLES, MIN_CONFIDENCE, TRAIN_SAMPLES, _synthetic_pages, learn_template, overlap
+
+
+def benchmark(urls=None, n_pages=200, llm_samples=5):
+    """
+    API calls and per-story latency of LLM extraction versus a learned template.
+
+    With `urls` (story pages of one site) and OPENAI_API_KEY set, the first TRAIN_SAMPLES + HOLDOUT_SAMPLES
+    pages are extracted by the LLM, a template is learned from them and applied to the rest; the local
+    extractions are compared with the LLM on `llm_samples` of the remaining pages. Without urls the template
+    is learned from synthetic pages of one layout and the LLM latency is left out.
+    """
+    import time
+    samples = TRAIN_SAMPLES + HOLDOUT_SAMPLES
+
+    if urls:
+        import GPT_crawler_utils as GPT_crawler
+        from GPT_crawler import _parse_story
+        from fetcher import Fetcher
+
+        with Fetcher(encoding=None) as fetcher:
+            pages = {url: html for url, html, error in fetcher.fetch_all(urls) if error is None}
+        urls = [url for url in urls if url in pages]
+        llm = {}
+        start = time.perf_counter()
+        for url in urls[:samples] + urls[samples:samples + llm_samples]:
+            llm[url] = _parse_story(GPT_crawler.get_content(url))
+        llm_latency = (time.perf_counter() - start) / len(llm)
+        dataset = [(pages[url], *llm[url]) for url in urls[:samples]]
+        rest = [(pages[url], *llm.get(url, ('', ''))) for url in urls[samples:]]
+    else:
+        pages = _synthetic_pages(n_pages)
+        dataset, rest, llm_latency = pages[:samples], pages[samples:], None
+
+    start = time.perf_counter()
+    template = learn_template(dataset)
+    learn_time = time.perf_counter() - start
+    if template is None:
+        print("No template learned, every story needs the LLM.")
+        return
+
+    start = time.perf_counter()
+    results = [template.extract(html) for html, _, _ in rest]
+    local_latency = (time.perf_counter() - start) / max(len(rest), 1)
+    confident = sum(confidence >= MIN_CONFIDENCE for _, _, confidence in results)
+    scores = [overlap(content, reference) for (content, _, _), (_, reference, _) in zip(results, rest) if reference]
+    authors = sum(author == reference for (_, author, _), (_, _, reference) in zip(results, rest) if reference)
+
+    print(f"Learned '{template.selector}' (author '{template.author_selector or template.author}') in {learn_time * 1000:.0f} ms")
+    print(f"{len(rest)} remaining stories: {confident} extracted locally, {len(rest) - confident} sent to the LLM")
+    print(f"API calls: {len(dataset) + len(rest)} without template, {len(dataset) + len(rest) - confident} with template")
+    if scores:
+        print(f"Token F1 against the LLM: mean {sum(scores) / len(scores):.3f}, min {min(scores):.3f}; "
+              f"authors matching {authors}/{len(scores)}")
+    print(f"Per-story latency: local {local_latency * 1000:.2f} ms" +
+          (f", LLM {llm_latency:.1f}s ({llm_latency / local_latency:.0f}x)" if llm_latency else ""))
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    benchmark(sys.argv[1:] or None)
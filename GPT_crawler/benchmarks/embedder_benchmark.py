@@ -0,0 +1,243 @@
+"""
+Benchmarks of Embedder: batching, the CPU backends, chunk merging, the local segmenter and the import cost.
+Run from the GPT_crawler directory, e.g. `python benchmarks/embedder_benchmark.py cpu BAAI/bge-small-en-v1.5`.
+"""
+import argparse
+import os
+import sys
+from os import getenv
+
+import numpy as np
+
+GPT_CRAWLER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(GPT_CRAWLER) # Embedder lives one level up
+from Embedder import Embedder, LOCAL_BACKENDS, LOCAL_BATCH_SIZE, LOCAL_BATCH_TOKENS, _normalize
+
+
+def benchmark(model_name, n_texts=512, repeat=1):
+    """
+    Compares texts/sec and peak RSS of the local torch path with one padded forward pass over all
+    texts against length-sorted, token-budgeted batches. Story-like inputs of mixed lengths are used,
+    each configuration runs in a fresh process so peak RSS is not shared.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    for name, batch_size, max_batch_tokens in [("single pass", n_texts, 10**9), ("batched", LOCAL_BATCH_SIZE, LOCAL_BATCH_TOKENS)]:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            rate, peak, _ = executor.submit(_run_benchmark, model_name, n_texts, batch_size, max_batch_tokens, repeat).result()
+        print(f"{name:<12}: {rate:.1f} texts/s, peak RSS {peak:.0f} MiB")
+
+
+def benchmark_cpu(model_name, n_texts=256, repeat=1, num_threads=None):
+    """
+    Compares the CPU backends of the local model: fp32 torch, dynamic int8 and ONNX Runtime. Reports texts/sec,
+    peak RSS and parity with the fp32 torch embeddings (cosine similarity per text). Each backend runs
+    in a fresh process.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    reference = None
+    for local_backend in LOCAL_BACKENDS:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            rate, peak, embeddings = executor.submit(_run_benchmark, model_name, n_texts, LOCAL_BATCH_SIZE, LOCAL_BATCH_TOKENS,
+                                                     repeat, local_backend, num_threads).result()
+        if reference is None:
+            reference = embeddings
+        cosine = np.einsum("ij,ij->i", _normalize(reference), _normalize(embeddings))
+        print(f"{local_backend:<6}: {rate:.1f} texts/s, peak RSS {peak:.0f} MiB, "
+              f"cosine to fp32 torch min {cosine.min():.4f} mean {cosine.mean():.4f}")
+
+
+def _run_benchmark(model_name, n_texts, batch_size, max_batch_tokens, repeat, local_backend="torch", num_threads=None):
+    import resource
+    import time
+
+    rng = np.random.default_rng(0)
+    words = ["once", "upon", "a", "time", "the", "little", "fox", "ran", "into", "forest", "and", "found", "a", "story"]
+    texts = [" ".join(rng.choice(words, size=int(rng.integers(5, 400)))) for _ in range(n_texts)]
+
+    embedder = Embedder(model_name=model_name, batch_size=batch_size, max_batch_tokens=max_batch_tokens,
+                        local_backend=local_backend, num_threads=num_threads)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        embeddings = embedder.get_embedding(texts)
+    rate = n_texts * repeat / (time.perf_counter() - start)
+    return rate, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, embeddings
+
+
+def benchmark_merge(sizes=(1000, 2000, 5000, 10000), target_ratio=0.1, dim=128):
+    """
+    Times _iterative_sequential_merge on synthetic chunks against the previous argmax-rescan algorithm
+    (one np.argmax over all pairs and one np.delete copy of the embedding matrix per merge).
+    The embedding API is stubbed with random vectors, so only the merge bookkeeping is measured.
+    """
+    import time
+
+    rng = np.random.default_rng(0)
+
+    def rescan_merge(embeddings, texts, target_count, embed):
+        embeddings = embeddings.copy()
+        texts = list(texts)
+        similarities = list(np.einsum("ij,ij->i", embeddings[:-1], embeddings[1:]))
+        while len(texts) > target_count:
+            i = int(np.argmax(similarities))
+            texts[i] = f"{texts[i]} {texts[i + 1]}"
+            texts.pop(i + 1)
+            embeddings[i] = embed([texts[i]])[0]
+            embeddings = np.delete(embeddings, i + 1, axis=0)
+            similarities.pop(i)
+            if i > 0:
+                similarities[i - 1] = float(embeddings[i - 1] @ embeddings[i])
+            if i < len(similarities):
+                similarities[i] = float(embeddings[i] @ embeddings[i + 1])
+        return texts
+
+    for n in sizes:
+        texts = [f"chunk {i}" for i in range(n)]
+        initial = _normalize(rng.standard_normal((n, dim)))
+        target = max(1, int(n * target_ratio))
+
+        def embed(batch, dim=dim):
+            return initial if len(batch) == n else _normalize(rng.standard_normal((len(batch), dim)))
+
+        embedder = Embedder(use_api="jina")
+        embedder._get_jina_embedding = embed
+
+        start = time.perf_counter()
+        rescan_merge(initial, texts, target, embed)
+        rescan = time.perf_counter() - start
+        timings = []
+        for approximate in (False, True):
+            start = time.perf_counter()
+            embedder._iterative_sequential_merge(texts, target, dim, approximate=approximate)
+            timings.append(time.perf_counter() - start)
+        print(f"{n:>6} -> {target:<5} chunks: rescan {rescan:.3f}s, heap {timings[0]:.3f}s, heap + approximate {timings[1]:.3f}s")
+
+
+def benchmark_merge_api(n_chunks=200, target_count=10, dim=128, latency=0.05):
+    """
+    Compares the merge modes against a simulated embedding API: API call count, wall-clock time with
+    `latency` seconds per call, and how many chunk boundaries agree with the greedy merge.
+    Chunks belong to topics of random length and a merged chunk is embedded as the normalized sum of
+    its parts, so merging similar neighbours is meaningful.
+    """
+    import time
+
+    rng = np.random.default_rng(0)
+    topics = np.repeat(np.arange(n_chunks), rng.integers(5, 40, n_chunks))[:n_chunks]
+    topic_vectors = rng.standard_normal((n_chunks, dim))
+    parts = _normalize(topic_vectors[topics] + 0.8 * rng.standard_normal((n_chunks, dim)))
+    texts = [f"c{i}" for i in range(n_chunks)]
+    calls = []
+
+    def embed(batch, dim=dim):
+        calls.append(len(batch))
+        time.sleep(latency)
+        return _normalize([parts[[int(part[1:]) for part in text.split(" ")]].sum(axis=0) for text in batch])
+
+    def boundaries(chunks):
+        return set(np.cumsum([len(chunk.split(" ")) for chunk in chunks]).tolist())
+
+    embedder = Embedder(use_api="jina")
+    embedder._get_jina_embedding = embed
+    greedy = None
+    for name, kwargs in [("greedy", {}), ("rounds", {"batched": True}),
+                         ("greedy + approximate", {"approximate": True}),
+                         ("rounds + approximate", {"batched": True, "approximate": True})]:
+        calls.clear()
+        start = time.perf_counter()
+        chunks = embedder._iterative_sequential_merge(texts, target_count, dim, **kwargs)
+        elapsed = time.perf_counter() - start
+        greedy = greedy or boundaries(chunks)
+        agreement = len(greedy & boundaries(chunks)) / len(greedy)
+        print(f"{name:<22} {len(calls):>4} API calls, {elapsed:.2f}s, {agreement:.0%} boundaries shared with greedy")
+
+
+def _chunk_ends(text: str, chunks: list) -> set:
+    """Character offsets in `text` where the (whitespace-stripped) chunks end."""
+    ends, position = set(), 0
+    for chunk in chunks:
+        chunk = chunk.strip()
+        start = text.find(chunk, position)
+        if chunk and start != -1:
+            position = start + len(chunk)
+            ends.add(position)
+    return ends
+
+
+def benchmark_segmenter(path="stories_togrowby.csv", column="content", max_token=1000, n_texts=20):
+    """
+    Compares the local segmenter with segment.jina.ai on the stories of a crawled CSV: chunks per second,
+    and the share of API chunk boundaries the local segmenter reproduces. The API part needs JINAAI_API_KEY.
+    Note that segment.jina.ai counts max_chunk_length in characters while the local segmenter counts tokens.
+    """
+    import time
+    import pandas as pd
+
+    texts = pd.read_csv(path)[column].dropna().astype(str).tolist()[:n_texts]
+    embedder = Embedder(use_api="jina", segmenter="local")
+    results = {}
+    for name, segment in [("local", embedder._local_segmenter), ("jina", embedder._Jina_segmenter)]:
+        if name == "jina" and not getenv("JINAAI_API_KEY"):
+            print("JINAAI_API_KEY not set, skipping segment.jina.ai")
+            continue
+        start = time.perf_counter()
+        results[name] = [segment(text, max_token) for text in texts]
+        elapsed = time.perf_counter() - start
+        n_chunks = sum(len(chunks) for chunks in results[name])
+        print(f"{name:<6} {n_chunks} chunks from {len(texts)} texts in {elapsed:.2f}s ({n_chunks / elapsed:.0f} chunks/s)")
+
+    if "jina" in results:
+        shared = total = 0
+        for text, local, api in zip(texts, results["local"], results["jina"]):
+            api_ends = _chunk_ends(text, api)
+            shared += len(api_ends & _chunk_ends(text, local))
+            total += len(api_ends)
+        print(f"Boundary agreement: {shared / max(total, 1):.0%} of the API boundaries")
+
+
+def benchmark_import(repeat=5):
+    """
+    Measures the import time and peak RSS of Embedder in fresh interpreters, for the bare import and for
+    constructing an API-only Embedder. Neither should load torch or transformers.
+    """
+    import subprocess
+
+    snippets = {
+        "import Embedder": "import Embedder",
+        "Embedder(use_api='jina')": "import Embedder; Embedder.Embedder(use_api='jina')",
+    }
+    probe = ("import resource, sys, time; start = time.perf_counter(); {code}; "
+             "print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "
+             "'torch' in sys.modules or 'transformers' in sys.modules)")
+    for name, code in snippets.items():
+        timings, rss = [], []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, "-c", probe.format(code=code)], capture_output=True, text=True,
+                                    check=True, cwd=GPT_CRAWLER).stdout.split()
+            timings.append(float(output[0]))
+            rss.append(float(output[1]))
+        print(f"{name:<26} median {sorted(timings)[len(timings) // 2] * 1000:.0f} ms, "
+              f"peak RSS {max(rss):.0f} MiB, torch/transformers loaded: {output[2]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks of Embedder')
+    parser.add_argument('benchmark', choices=['batching', 'cpu', 'merge', 'merge_api', 'segmenter', 'import'],
+                        help='batching: one padded pass vs token-budgeted batches; cpu: torch vs int8 vs onnx; '
+                             'merge and merge_api: chunk merging; segmenter: local vs segment.jina.ai; import: import cost.')
+    parser.add_argument('model', nargs='?', default="BAAI/bge-small-en-v1.5", help='Local model of the batching and cpu benchmarks.')
+    args = parser.parse_args()
+
+    if args.benchmark == 'batching':
+        benchmark(args.model)
+    elif args.benchmark == 'cpu':
+        benchmark_cpu(args.model)
+    elif args.benchmark == 'merge':
+        benchmark_merge()
+    elif args.benchmark == 'merge_api':
+        benchmark_merge_api()
+    elif args.benchmark == 'segmenter':
+        benchmark_segmenter()
+    else:
+        benchmark_import()
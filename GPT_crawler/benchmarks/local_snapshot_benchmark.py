@@ -0,0 +1,71 @@
+"""
+Benchmark of local_snapshot: conversion cost and pages/s of the local snapshot backend against a local test site.
+Run from the GPT_crawler directory, e.g. `python benchmarks/local_snapshot_benchmark.py`.
+"""
+import os
+import sys
+
+GPT_CRAWLER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(GPT_CRAWLER) # local_snapshot lives one level up
+sys.path.append(os.path.dirname(GPT_CRAWLER)) # and the shared crawler modules in the repo root
+from local_snapshot import get_local_snapshot, html_to_snapshot
+
+
+def benchmark(n_pages=200, latency=0.05, workers=(1, 8, 16), remote_sample=0):
+    """
+    Throughput of the local backend against a local test site that serves generated story list pages with a fixed
+    latency, at several concurrency levels. With `remote_sample` > 0 and network access, the same number of
+    r.jina.ai snapshots of a public page are timed as well for comparison.
+    """
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    items = "".join(f'<li><a href="/story/{i}/">Story number {i}</a> <img src="/img/{i}.jpg" alt="cover {i}"></li>' for i in range(60))
+    body = (f"<html><head><title>Stories</title><script>var x = 1;</script></head><body><nav><a href='/'>Home</a></nav>"
+            f"<div class='ads'>Buy now</div><main><h1>Bedtime stories</h1><p>All our <b>stories</b>, page 1.</p><ul>{items}</ul>"
+            f"<a href='/page/2/'>Next »</a></main><footer>Copyright</footer></body></html>").encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f'http://127.0.0.1:{server.server_port}/list/{i}.html' for i in range(n_pages)]
+    try:
+        start = time.perf_counter()
+        for _ in range(50):
+            snapshot = html_to_snapshot(body.decode('utf-8'), urls[0], exclude_selector=['.ads'], links_at_end=True)
+        print(f"Conversion: {(time.perf_counter() - start) / 50 * 1000:.2f} ms per page, {snapshot.split('Links/Buttons:')[1].count('- [')} links summarized")
+        for n in workers:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=n) as executor:
+                list(executor.map(lambda url: get_local_snapshot(url, exclude_selector=['.ads'], links_at_end=True), urls))
+            elapsed = time.perf_counter() - start
+            print(f"local backend, {n:>2} workers: {n_pages} pages in {elapsed:.2f}s ({n_pages / elapsed:.1f} pages/s)")
+    finally:
+        server.shutdown()
+
+    if remote_sample:
+        import GPT_crawler_utils as GPT_crawler
+        start = time.perf_counter()
+        for _ in range(remote_sample):
+            GPT_crawler.get_text_snapshot("https://example.com/", use_api_key=bool(os.getenv("JINAAI_API_KEY")), links_at_end=True,
+                                          use_cache=False, backend="jina")
+        print(f"r.jina.ai: {remote_sample / (time.perf_counter() - start):.1f} pages/s sequentially")
+
+
+if __name__ == '__main__':
+    benchmark()
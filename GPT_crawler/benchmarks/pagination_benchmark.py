@@ -0,0 +1,51 @@
+"""
+Benchmark of pagination.detect_pagination: accuracy and speed on synthetic listings.
+Run from the GPT_crawler directory, e.g. `python benchmarks/pagination_benchmark.py`.
+"""
+import os
+import sys
+
+GPT_CRAWLER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(GPT_CRAWLER) # pagination lives one level up
+from pagination import detect_pagination
+from snapshot_links import normalize_url
+
+
+def _synthetic_snapshot(style, page, last_page):
+    base = "https://example.com/stories"
+    urls = {
+        'wordpress': lambda n: f"{base}/" if n == 1 else f"{base}/page/{n}/",
+        'list': lambda n: f"{base}/list_12_{n}.html",
+        'query': lambda n: f"{base}?page={n}",
+    }[style]
+    links = [f"- [Story {page}-{i} of a kind]({base}/story-{page}-{i}/)" for i in range(20)]
+    window = range(max(1, page - 2), min(last_page, page + 2) + 1)
+    links += [f"- [{n}]({urls(n)})" for n in window]
+    if page < last_page:
+        links.append(f"- [下一页]({urls(page + 1)})" if style == 'list' else f"- [Next »]({urls(page + 1)})")
+    links.append(f"- [Last]({urls(last_page)})")
+    return urls(page), f"Title: Stories\n\nLinks/Buttons:\n" + "\n".join(links)
+
+
+def benchmark(last_page=12, repeat=200):
+    """Accuracy and speed of detect_pagination on synthetic WordPress, list_N.html and ?page=N listings."""
+    import time
+
+    for style in ('wordpress', 'list', 'query'):
+        pages = [(page, *_synthetic_snapshot(style, page, last_page)) for page in range(1, last_page + 1)]
+        correct, agree = 0, 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for page, url, snapshot in pages:
+                result = detect_pagination(snapshot, url, page)
+                expected = _synthetic_snapshot(style, page + 1, last_page)[0] if page < last_page else ""
+                correct += normalize_url(result['next_page'], url) == normalize_url(expected, url) if expected else not result['next_page']
+                agree += result['agree']
+        elapsed = (time.perf_counter() - start) / (repeat * len(pages))
+        first = detect_pagination(pages[0][2], pages[0][1], 1)
+        print(f"{style:>9}: next page correct {correct / (repeat * len(pages)):.0%}, signals agree {agree / (repeat * len(pages)):.0%}, "
+              f"{elapsed * 1e6:.0f} us per page, page range predicted from page 1: 2-{first['last_page']}")
+
+
+if __name__ == '__main__':
+    benchmark()
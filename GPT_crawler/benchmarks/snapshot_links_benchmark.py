@@ -0,0 +1,57 @@
+"""
+Benchmark of snapshot_links.prepare_links: tokens per page and title/url extraction latency, raw versus pre-processed.
+Run from the GPT_crawler directory, e.g. `python benchmarks/snapshot_links_benchmark.py <urls or saved snapshots>`.
+"""
+import os
+import re
+import sys
+
+GPT_CRAWLER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(GPT_CRAWLER) # snapshot_links lives one level up
+from snapshot_links import LINKS_HEADER, prepare_links
+
+
+def benchmark(sources, max_tokens=8000):
+    """
+    Tokens per page and title/url extraction latency with the raw "Links/Buttons:" section versus the
+    pre-processed parts (sent in parallel). `sources` are urls or files holding saved snapshots; files
+    need a first line "URL Source: <url>" as written by r.jina.ai. The LLM part needs OPENAI_API_KEY.
+    """
+    import os
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import GPT_crawler_utils as GPT_crawler
+
+    for source in sources:
+        if os.path.exists(source):
+            with open(source, encoding='utf-8') as f:
+                snapshot = f.read()
+            match = re.search(r'URL Source:\s*(\S+)', snapshot)
+            page_url = match.group(1) if match else source
+        else:
+            snapshot, page_url = GPT_crawler.get_text_snapshot(source, links_at_end=True), source
+        raw = snapshot[snapshot.find(LINKS_HEADER):] if LINKS_HEADER in snapshot else snapshot
+
+        start = time.perf_counter()
+        parts, stats = prepare_links(snapshot, page_url, max_tokens)
+        local = time.perf_counter() - start
+        print(f"{page_url}\n  links {stats['links']} -> {stats['kept_links']}, tokens {stats['tokens']} -> "
+              f"{stats['kept_tokens']} in {stats['parts']} part(s), pre-processing {local * 1000:.1f} ms")
+        if not os.getenv("OPENAI_API_KEY"):
+            continue
+
+        start = time.perf_counter()
+        raw_titles = GPT_crawler.get_titles_and_urls(raw).choices[0].message.content
+        raw_time = time.perf_counter() - start
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+            list(executor.map(GPT_crawler.get_titles_and_urls, parts))
+        print(f"  LLM latency: raw {raw_time:.1f}s ({len(raw_titles)} chars of output), "
+              f"pre-processed {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    benchmark(sys.argv[1:])
@@ -0,0 +1,63 @@
+"""
+Benchmark of StoryIndex: recall@k and latency of the exact and the IVF search on synthetic clustered vectors.
+Run from the GPT_crawler directory, e.g. `python benchmarks/story_index_benchmark.py`.
+"""
+import os
+import sys
+
+import numpy as np
+
+GPT_CRAWLER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(GPT_CRAWLER) # story_index lives one level up
+from Embedder import _normalize
+from story_index import StoryIndex
+
+
+def benchmark(n_vectors=100000, dim=256, n_queries=200, k=10, n_clusters=500, directory=None):
+    """
+    Recall@k and latency of the exact and the IVF search on synthetic clustered vectors, for float32 and
+    float16 storage. Recall is measured against the exact float32 results.
+    """
+    import shutil
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((n_clusters, dim))
+    labels = rng.integers(0, n_clusters, n_vectors)
+    vectors = _normalize(centers[labels] + 0.9 * rng.standard_normal((n_vectors, dim)))
+    queries = _normalize(centers[rng.integers(0, n_clusters, n_queries)] + 0.9 * rng.standard_normal((n_queries, dim)))
+    records = [{'title': f"story {i}", 'category': str(labels[i]), 'url': f"synthetic/{i}"} for i in range(n_vectors)]
+
+    truth = None
+    for dtype in ("float32", "float16"):
+        path = tempfile.mkdtemp(dir=directory)
+        try:
+            with StoryIndex(path, dtype=dtype) as index:
+                start = time.perf_counter()
+                for batch in range(0, n_vectors, 10000):
+                    index.add(vectors[batch:batch + 10000], records[batch:batch + 10000])
+                print(f"[{dtype}] added {n_vectors} vectors in {time.perf_counter() - start:.2f}s")
+
+                start = time.perf_counter()
+                _, rows = index.search(queries, k)
+                elapsed = time.perf_counter() - start
+                truth = rows if truth is None else truth
+                recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(rows, truth)])
+                print(f"[{dtype}] exact        recall@{k} {recall:.3f}, {elapsed / n_queries * 1000:.2f} ms/query (batched)")
+
+                start = time.perf_counter()
+                index.build_ivf()
+                print(f"[{dtype}] built IVF with {len(index.centroids)} lists in {time.perf_counter() - start:.2f}s")
+                for nprobe in (1, 4, 16, 64):
+                    start = time.perf_counter()
+                    _, rows = index.search(queries, k, nprobe=nprobe)
+                    elapsed = time.perf_counter() - start
+                    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(rows, truth)])
+                    print(f"[{dtype}] IVF nprobe={nprobe:<3} recall@{k} {recall:.3f}, {elapsed / n_queries * 1000:.2f} ms/query")
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from openai.types.chat import ChatCompletion
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT,
+    total_tokens INTEGER,
+    created_at REAL
+);
+"""
+
+
+class CompletionCacheMiss(Exception):
+    """Raised in offline mode when a completion is not in the cache."""
+
+
+class CompletionCache:
+    def __init__(self, path="completion_cache.sqlite", offline=False):
+        """
+        Persistent cache of chat completions. Our calls use temperature 0.0, so the same model, prompts and
+        response_format give the same answer and can be replayed instead of paid for again.
+
+        Args:
+            path (str): Path of the SQLite database.
+            offline (bool): Never call the API. A cache miss raises CompletionCacheMiss.
+        """
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(request):
+        """Hashes the request arguments: model, messages (system prompt and user content), response_format, ..."""
+        return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, request):
+        """Returns the cached ChatCompletion for the request arguments, or None on a miss."""
+        key = self.make_key(request)
+        with self._lock:
+            row = self._conn.execute("SELECT response, total_tokens FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_tokens += row[1] or 0
+        if row is None:
+            if self.offline:
+                raise CompletionCacheMiss(f"Completion for model '{request.get('model')}' is not cached (offline mode).")
+            return None
+        return ChatCompletion.model_validate_json(row[0])
+
+    def set(self, request, completion):
+        total_tokens = completion.usage.total_tokens if completion.usage else 0
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, response, total_tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                (self.make_key(request), request.get("model"), completion.model_dump_json(), total_tokens, time.time()))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_tokens": self.saved_tokens,
+        }
+
+    def close(self):
+        self._conn.close()
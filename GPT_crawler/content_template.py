@@ -0,0 +1,301 @@
+import re
+from collections import Counter, deque
+
+import page_parser
+from text_tokens import words
+
+TRAIN_SAMPLES = 3     # pages the selector is induced from
+HOLDOUT_SAMPLES = 2   # pages the selector is validated on before it replaces the LLM
+MIN_SCORE = 0.8       # token F1 against the LLM extraction a template needs on every held-out page
+MIN_CONFIDENCE = 0.5  # below this a page is sent to the LLM instead
+DRIFT_WINDOW = 20     # the template is dropped when more than half of the last DRIFT_WINDOW pages fell back
+
+## ids and classes with long numbers (post-1234, story-5678) differ from page to page
+_STABLE_NAME = re.compile(r'^-?[A-Za-z_][\w-]*$')
+_VOLATILE_NAME = re.compile(r'\d{3,}')
+_SKIPPED_TAGS = {'html', 'head', 'title', 'meta', 'link', 'script', 'style', 'noscript', 'a', 'img', 'br'}
+
+
+def _tokens(text):
+    return Counter(words(text))
+
+
+def overlap(extracted, reference):
+    """Token F1 of an extracted text against a reference text, 0 to 1."""
+    extracted, reference = _tokens(extracted), _tokens(reference)
+    common = sum((extracted & reference).values())
+    if not common:
+        return 0.0
+    precision = common / sum(extracted.values())
+    recall = common / sum(reference.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def clean_text(text):
+    """Strips every line, drops the empty ones and separates the rest by blank lines, like the LLM's paragraphs."""
+    return "\n\n".join(line.strip() for line in str(text).splitlines() if line.strip())
+
+
+def _names(element):
+    """The stable simple selectors of one element: tag#id, tag.class1.class2 and tag.class."""
+    tag = element.tag
+    names = []
+    id_ = element.get('id')
+    if id_ and _STABLE_NAME.match(id_) and not _VOLATILE_NAME.search(id_):
+        names.append(f"{tag}#{id_}")
+    classes = [name for name in (element.get('class') or '').split()
+               if _STABLE_NAME.match(name) and not _VOLATILE_NAME.search(name)]
+    if classes:
+        names.append(tag + ''.join(f".{name}" for name in classes))
+        if len(classes) > 1:
+            names.extend(f"{tag}.{name}" for name in classes)
+    return names
+
+
+def candidate_selectors(element, max_depth=3):
+    """
+    CSS selectors that may match `element` on other pages of the same site: its own id and classes, a
+    named ancestor (up to `max_depth` levels up) followed by the tag path, the paragraphs of each of
+    those, and the plain tag path from <body>.
+    """
+    selectors = list(_names(element))
+    path = [element.tag]
+    ancestor = element.getparent()
+    depth = 0
+    while ancestor is not None and ancestor.tag not in ('body', 'html') and depth < max_depth:
+        selectors.extend(f"{name} > {' > '.join(path)}" for name in _names(ancestor))
+        path.insert(0, ancestor.tag)
+        ancestor = ancestor.getparent()
+        depth += 1
+    if any(child.tag == 'p' for child in element):
+        selectors.extend([f"{selector} > p" for selector in selectors])
+
+    structural = []
+    node = element
+    while node is not None and node.tag not in ('body', 'html'):
+        structural.insert(0, node.tag)
+        node = node.getparent()
+    selectors.append(' > '.join(['body'] + structural))
+    return list(dict.fromkeys(selectors))
+
+
+def best_element(tree, reference, min_share=0.3):
+    """The element of a parsed page whose text has the highest token F1 with the reference text."""
+    size = sum(_tokens(reference).values())
+    best, best_score = None, 0.0
+    for element in tree.iter():
+        if not isinstance(element.tag, str) or element.tag in _SKIPPED_TAGS:
+            continue
+        text = element.text_content()
+        ## 太短的元素不可能包含整篇故事
+        if len(words(text)) < min_share * size:
+            continue
+        score = overlap(text, reference)
+        if score > best_score:
+            best, best_score = element, score
+    return best, best_score
+
+
+class ContentTemplate:
+    def __init__(self, selector, author_selector=None, author=None, min_tokens=0, score=None, parser='lxml'):
+        """
+        A learned extraction rule for the story pages of one site: a CSS selector that reproduces the content
+        the LLM extracts, applied with a fast local parser from page_parser.
+
+        Every extraction gets a confidence from its length (against the shortest training story) and its link
+        density (navigation and story lists are mostly links). Callers send pages below MIN_CONFIDENCE to the
+        LLM and report the outcome with `observe`; once more than half of the last DRIFT_WINDOW pages fell
+        back, the template is deactivated, e.g. after a site redesign.
+
+        Args:
+            selector (str): CSS selector of the story content. The texts of all matches are joined.
+            author_selector (str | None): CSS selector of the author.
+            author (str | None): Author used when there is no author selector (same author on every sample).
+            min_tokens (int): Tokens of the shortest training story.
+            score (float | None): Lowest token F1 on the held-out pages.
+            parser (str): page_parser backend ('lxml' or 'selectolax').
+        """
+        self.selector = selector
+        self.author_selector = author_selector
+        self.author = author
+        self.min_tokens = min_tokens
+        self.score = score
+        self.parser_name = parser
+        self.parser = page_parser.get_parser(parser)
+        self.active = True
+        self.extracted = 0
+        self.fallbacks = 0
+        self._recent = deque(maxlen=DRIFT_WINDOW)
+
+    def extract(self, html):
+        """
+        Extracts a story from the raw html of a page.
+
+        Returns:
+            tuple: (content, author, confidence). confidence is 0 when the selector matched nothing.
+        """
+        tree = self.parser.parse(html)
+        content = clean_text("\n".join(self.parser.texts(tree, self.selector)))
+        if not content:
+            return '', '', 0.0
+        links = sum(len(text.strip()) for text in self.parser.texts(tree, f"{self.selector} a"))
+        tokens = len(words(content))
+        confidence = min(1.0, tokens / max(1.0, 0.5 * self.min_tokens)) * (1 - min(1.0, links / len(content)))
+        author = self.author or ''
+        if self.author_selector:
+            author = " ".join((self.parser.text(tree, self.author_selector) or '').split())
+        return content, author, confidence
+
+    def observe(self, fell_back):
+        """Records whether a page fell back to the LLM and deactivates the template when too many did."""
+        self._recent.append(fell_back)
+        if fell_back:
+            self.fallbacks += 1
+        else:
+            self.extracted += 1
+        if len(self._recent) == DRIFT_WINDOW and sum(self._recent) > DRIFT_WINDOW / 2 and self.active:
+            self.active = False
+            print(f"Template '{self.selector}' fell back on {sum(self._recent)} of the last {DRIFT_WINDOW} pages, using the LLM from now on.")
+
+    def to_dict(self):
+        return {'selector': self.selector, 'author_selector': self.author_selector, 'author': self.author,
+                'min_tokens': self.min_tokens, 'score': self.score, 'parser': self.parser_name}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def _extract_all(parser, trees, selector):
+    return [clean_text("\n".join(parser.texts(tree, selector))) for tree in trees]
+
+
+def _best_selector(parser, trees, references, elements):
+    """The candidate selector with the highest mean token F1 on the training pages, shorter ones win ties."""
+    candidates = list(dict.fromkeys(selector for element in elements for selector in candidate_selectors(element)))
+    best, best_score = None, 0.0
+    for selector in candidates:
+        try:
+            texts = _extract_all(parser, trees, selector)
+        except Exception: # cssselect rejects some odd tag or class names
+            continue
+        score = sum(overlap(text, reference) for text, reference in zip(texts, references)) / len(references)
+        if score > best_score + 1e-9 or (best is not None and abs(score - best_score) <= 1e-9 and len(selector) < len(best)):
+            best, best_score = selector, score
+    return best, best_score
+
+
+def _author_selector(parser, trees, authors):
+    """A selector reproducing every sample's author, or None."""
+    elements = []
+    for tree, author in zip(trees, authors):
+        if not author:
+            return None
+        matches = [element for element in tree.iter()
+                   if isinstance(element.tag, str) and element.tag not in _SKIPPED_TAGS
+                   and author.lower() in element.text_content().lower()]
+        if not matches:
+            return None
+        ## the smallest element holding the name, e.g. <span class="author">
+        elements.append(min(matches, key=lambda element: len(element.text_content())))
+    candidates = dict.fromkeys(selector for element in elements for selector in candidate_selectors(element, max_depth=1))
+    for selector in sorted(candidates, key=len):
+        try:
+            found = [parser.text(tree, selector) or '' for tree in trees]
+        except Exception:
+            continue
+        if all(author.lower() in text.lower() and len(text) < 4 * len(author) + 20 for text, author in zip(found, authors)):
+            return selector
+    return None
+
+
+def learn_template(samples, parser='lxml', train=TRAIN_SAMPLES, min_score=MIN_SCORE):
+    """
+    Induces a content template from pages the LLM has already extracted.
+
+    The first `train` samples locate, on each page, the element whose text best matches the LLM content and
+    propose selectors for it; the selector with the highest mean token F1 over the training pages wins. The
+    remaining samples are held out: the template is only returned if it reaches `min_score` on every one.
+
+    Args:
+        samples (list of tuple): (html, content, author) of story pages of one site, content and author as
+            extracted by the LLM. Needs more than `train` samples.
+        parser (str): page_parser backend the template is applied with.
+        train (int): Number of samples the selector is induced from, the others validate it.
+        min_score (float): Lowest held-out token F1 accepted.
+
+    Returns:
+        ContentTemplate | None: None when no selector reproduces the LLM content well enough.
+    """
+    ## lxml rejects a page without any markup ("Document is empty")
+    samples = [(html, content, author) for html, content, author in samples if html and html.strip() and content]
+    if len(samples) <= train:
+        print(f"Template: {len(samples)} usable samples, need more than {train}.")
+        return None
+    backend = page_parser.get_parser(parser)
+    lxml = page_parser.get_parser('lxml')
+    training, holdout = samples[:train], samples[train:]
+
+    trees = []
+    elements = []
+    for html, content, _ in training:
+        tree = lxml.parse(html)
+        for element in tree.xpath('//script|//style'):
+            element.drop_tree()
+        element, _ = best_element(tree, content)
+        if element is None:
+            print("Template: no element of a sample page matches the extracted story.")
+            return None
+        trees.append(tree)
+        elements.append(element)
+
+    ## the selectors are scored with the backend they will run on
+    parsed = [backend.parse(html) for html, _, _ in training]
+    selector, train_score = _best_selector(backend, parsed, [content for _, content, _ in training], elements)
+    if selector is None:
+        print("Template: no selector reproduces the extracted stories.")
+        return None
+
+    held_out = [backend.parse(html) for html, _, _ in holdout]
+    scores = [overlap(text, content) for text, (_, content, _) in zip(_extract_all(backend, held_out, selector), holdout)]
+    print(f"Template '{selector}': token F1 {train_score:.2f} on {len(training)} training pages, "
+          f"{', '.join(f'{score:.2f}' for score in scores)} on held-out pages")
+    if min(scores) < min_score:
+        return None
+
+    authors = [author or '' for _, _, author in samples]
+    author_selector = _author_selector(backend, [lxml.parse(html) for html, _, _ in samples], authors)
+    author = None
+    if author_selector is None and len(set(authors)) == 1:
+        author = authors[0] # e.g. one author writes the whole site
+    min_tokens = min(len(words(content)) for _, content, _ in samples)
+    return ContentTemplate(selector, author_selector, author, min_tokens, min(scores), parser)
+
+
+_LAYOUT = """<html><head><title>{title} | Bedtime Stories</title><script>var ads = "{noise}";</script></head>
+<body><header class="site-header"><nav class="menu">{nav}</nav></header>
+<div class="container"><main id="main"><article class="post post-{number} type-post">
+<h1 class="entry-title">{title}</h1><div class="entry-meta">By <span class="author vcard">{author}</span></div>
+<div class="entry-content">{paragraphs}<div class="share-buttons"><a href="#">Share</a> <a href="#">Pin</a></div></div>
+</article></main><aside class="sidebar"><h3>Popular stories</h3><ul>{related}</ul></aside></div>
+<footer class="site-footer">Copyright Bedtime Stories. {noise}</footer></body></html>"""
+
+
+def _synthetic_pages(n_pages, paragraphs=12, seed=0):
+    """(html, content, author) of story pages that share one WordPress-like layout."""
+    import random
+
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(3000)]
+    nav = "".join(f'<a href="/category/{i}/">Category {i}</a>' for i in range(12))
+    pages = []
+    for number in range(n_pages):
+        story = ["".join(rng.choice(words) + " " for _ in range(rng.randint(20, 80))).strip().capitalize() + "."
+                 for _ in range(rng.randint(paragraphs // 2, paragraphs))]
+        author = rng.choice(["Elaine Lindy", "Sam Wood", "Mia Chen"])
+        related = "".join(f'<li><a href="/story-{rng.randint(0, 999)}/">{" ".join(rng.sample(words, 4))}</a></li>' for _ in range(10))
+        html = _LAYOUT.format(title=" ".join(rng.sample(words, 3)), number=1000 + number, author=author, nav=nav,
+                              paragraphs="".join(f"<p>{paragraph}</p>" for paragraph in story), related=related,
+                              noise=" ".join(rng.sample(words, 20)))
+        pages.append((html, "\n\n".join(story), author))
+    return pages
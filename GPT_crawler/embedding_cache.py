@@ -0,0 +1,109 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+from row_store import META_SCHEMA, RowStore, select_in
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    hash TEXT PRIMARY KEY,
+    row INTEGER NOT NULL
+);
+""" + META_SCHEMA
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str, model_name: str, task: str = "default", dtype: str = "float32"):
+        """
+        Persistent embedding store for one (model_name, task) pair, keyed by the hash of the text.
+
+        Vectors live in a row_store.RowStore (a memory-mapped vectors.bin), with a small SQLite index from
+        text hash to row. Only the rows that are looked up are read, so 100k+ vectors do not have to fit in
+        RAM. The embedding dimension is recorded on the first write; writing vectors of another dimension
+        raises a ValueError.
+
+        Args:
+            directory (str): Root directory of the cache. Each (model_name, task) gets its own subdirectory.
+            model_name (str): Name of the embedding model.
+            task (str): Task the embeddings were made for (e.g. Jina's 'text-matching').
+            dtype (str): 'float32' or 'float16'. float16 halves the disk and page cache footprint.
+        """
+        self.path = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{model_name}__{task}"))
+        os.makedirs(self.path, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.path, "index.sqlite"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._store = RowStore(self.path, self._conn, dtype, "Embedding cache")
+
+    @property
+    def dim(self):
+        return self._store.dim
+
+    @property
+    def count(self):
+        return self._store.count
+
+    def lookup(self, texts: list):
+        """
+        Finds cached embeddings.
+
+        Returns:
+            tuple: (embeddings, missing). `embeddings` is a float32 array with a row per text (rows of missing
+            texts are undefined), or None if nothing was found. `missing` lists the indices of uncached texts.
+        """
+        hashes = [text_hash(text) for text in texts]
+        with self._lock:
+            rows = dict(select_in(self._conn, "SELECT hash, row FROM vectors WHERE hash IN ({})", set(hashes)))
+
+            missing = [i for i, h in enumerate(hashes) if h not in rows]
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            if len(missing) == len(texts):
+                return None, missing
+
+            embeddings = np.zeros((len(texts), self.dim), dtype="f")
+            found = [i for i, h in enumerate(hashes) if h in rows]
+            embeddings[found] = self._store.vectors[[rows[hashes[i]] for i in found]]
+        return embeddings, missing
+
+    def add(self, texts: list, embeddings: np.ndarray):
+        """Stores embeddings for texts. Texts already cached keep their stored vector."""
+        embeddings = np.asarray(embeddings)
+        with self._lock:
+            self._store.check_dim(embeddings.shape[1])
+
+            new = {}
+            for text, vector in zip(texts, embeddings):
+                new.setdefault(text_hash(text), vector)
+            hashes = list(new)
+            known = {h for (h,) in select_in(self._conn, "SELECT hash FROM vectors WHERE hash IN ({})", hashes)}
+            hashes = [h for h in hashes if h not in known]
+            if not hashes:
+                return
+
+            first = self.count
+            self._store.write(slice(first, first + len(hashes)), np.stack([new[h] for h in hashes]))
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT INTO vectors (hash, row) VALUES (?, ?)",
+                                   [(h, first + i) for i, h in enumerate(hashes)])
+            self._store.set_count(first + len(hashes))
+            self._conn.execute("COMMIT")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0, "vectors": self.count}
+
+    def close(self):
+        self._store.close()
+        self._conn.close()
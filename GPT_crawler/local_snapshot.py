@@ -0,0 +1,168 @@
+import re
+from urllib.parse import urljoin
+
+from fetcher import Fetcher
+from page_parser import strip_xml_declaration
+
+FETCH_WORKERS = 16 # pooled connections of the shared fetcher
+
+_fetcher = None # created on first use
+_META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+_SPACES = re.compile(r'\s+')
+_DROPPED_TAGS = ('script', 'style', 'noscript', 'template', 'svg', 'iframe', 'head', 'form', 'button', 'select')
+_BLOCK_TAGS = {'p', 'div', 'section', 'article', 'main', 'header', 'footer', 'nav', 'aside', 'ul', 'ol', 'li', 'table',
+               'tr', 'blockquote', 'pre', 'figure', 'figcaption', 'dl', 'dt', 'dd', 'hr', 'body', 'center', 'details',
+               'summary', 'address', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+
+def _get_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher(max_workers=FETCH_WORKERS, encoding=None)
+    return _fetcher
+
+
+def decode(response):
+    """Decodes a page with the charset of the Content-Type header, else of its <meta> tag, else utf-8 ('gbk' pages declare it)."""
+    if 'charset=' in response.headers.get('Content-Type', '').lower():
+        response.encoding = response.headers['Content-Type'].lower().split('charset=')[-1].split(';')[0].strip()
+        return response.text
+    match = _META_CHARSET.search(response.content[:4096])
+    encoding = match.group(1).decode('ascii') if match else 'utf-8'
+    try:
+        return response.content.decode(encoding, errors='replace')
+    except LookupError: # unknown charset name
+        return response.content.decode('utf-8', errors='replace')
+
+
+class _Markdown:
+    def __init__(self, page_url, remove_image):
+        """Renders an lxml tree as markdown and collects its links and images along the way."""
+        self.page_url = page_url
+        self.remove_image = remove_image
+        self.links = []
+        self.images = []
+
+    def inline(self, element):
+        """Markdown of the inline content of an element, block children rendered as their own paragraphs."""
+        parts = [_SPACES.sub(' ', element.text or '')]
+        for child in element:
+            if isinstance(child.tag, str):
+                parts.append(self.render(child))
+            parts.append(_SPACES.sub(' ', child.tail or ''))
+        return ''.join(parts)
+
+    def render(self, element):
+        tag = element.tag
+        if tag == 'br':
+            return '\n'
+        if tag == 'hr':
+            return '\n\n---\n\n'
+        if tag == 'img':
+            src = element.get('src') or element.get('data-src')
+            if not src or self.remove_image:
+                return ''
+            alt = _SPACES.sub(' ', element.get('alt') or '').strip()
+            self.images.append((alt, urljoin(self.page_url, src)))
+            return f"![Image {len(self.images)}: {alt}]({urljoin(self.page_url, src)})"
+        if tag == 'a':
+            text = self.inline(element).strip()
+            href = element.get('href')
+            if not href:
+                return text
+            url = urljoin(self.page_url, href)
+            self.links.append((text.replace('\n', ' ') or _SPACES.sub(' ', element.get('title') or '').strip(), url))
+            return f"[{text}]({url})" if text else ''
+        if tag in ('pre', 'code'):
+            code = element.text_content()
+            return f"\n\n```\n{code.strip()}\n```\n\n" if tag == 'pre' else f"`{code}`"
+
+        text = self.inline(element)
+        if tag in ('strong', 'b') and text.strip():
+            return f"**{text.strip()}**"
+        if tag in ('em', 'i') and text.strip():
+            return f"_{text.strip()}_"
+        if tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            return f"\n\n{'#' * int(tag[1])} {_SPACES.sub(' ', text).strip()}\n\n"
+        if tag == 'li':
+            marker = '1.' if element.getparent() is not None and element.getparent().tag == 'ol' else '-'
+            return f"\n{marker} {text.strip()}"
+        if tag in ('td', 'th'):
+            return f" {text.strip()} |"
+        if tag == 'tr':
+            return f"\n|{text.strip()}\n"
+        if tag == 'blockquote':
+            return "\n\n" + "\n".join(f"> {line}" for line in text.strip().splitlines()) + "\n\n"
+        if tag in _BLOCK_TAGS:
+            return f"\n\n{text}\n\n"
+        return text
+
+
+def _tidy(markdown):
+    """Strips the lines and keeps at most one blank line between blocks."""
+    lines = [line.strip() for line in markdown.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines)).strip()
+
+
+def html_to_snapshot(html, page_url, target_selector=[], exclude_selector=[], remove_image=False, links_at_end=False, images_at_end=False):
+    """
+    Converts a raw html page into an r.jina.ai style snapshot: "Title:", "URL Source:" and "Markdown Content:"
+    sections, plus the "Links/Buttons:" and "Images:" summaries when requested.
+
+    Args:
+        html (str | bytes): The page, bytes are decoded as utf-8.
+        page_url (str): Url of the page, to resolve relative links.
+        target_selector (list): CSS selectors of the parts to keep. Everything is kept when empty.
+        exclude_selector (list): CSS selectors of the parts to remove, e.g. ads and sidebars.
+        remove_image (bool): Leave the images out.
+        links_at_end (bool): Append a "Links/Buttons:" summary of every link of the kept content.
+        images_at_end (bool): Append an "Images:" summary.
+
+    Returns:
+        str: The snapshot. An empty page gives a snapshot without content.
+
+    Raises:
+        ValueError: The page cannot be parsed.
+    """
+    from lxml import etree, html as lxml_html  # Importing lxml only when needed
+    from lxml.cssselect import CSSSelector
+
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+    html = strip_xml_declaration(html)
+    try:
+        tree = lxml_html.document_fromstring(html) if html.strip() else None
+    except etree.ParserError: # "Document is empty", e.g. only comments or whitespace
+        tree = None
+    except etree.LxmlError as e:
+        raise ValueError(f"Cannot parse {page_url}: {e}") from e
+    if tree is None:
+        snapshot = f"Title: \n\nURL Source: {page_url}\n\nMarkdown Content:\n\n"
+        return snapshot + ("\nLinks/Buttons:\n\n" if links_at_end else "")
+    title = _SPACES.sub(' ', tree.findtext('.//title') or '').strip()
+    for element in list(tree.iter(*_DROPPED_TAGS)):
+        if element.getparent() is not None:
+            element.drop_tree()
+    for selector in exclude_selector:
+        for element in CSSSelector(selector)(tree):
+            if element.getparent() is not None:
+                element.drop_tree()
+    roots = [element for selector in target_selector for element in CSSSelector(selector)(tree)] if target_selector else []
+    if not roots:
+        body = tree.find('body')
+        roots = [body if body is not None else tree]
+
+    renderer = _Markdown(page_url, remove_image)
+    markdown = _tidy("\n\n".join(renderer.render(root) for root in roots))
+    snapshot = f"Title: {title}\n\nURL Source: {page_url}\n\nMarkdown Content:\n{markdown}\n"
+    if images_at_end and renderer.images:
+        snapshot += "\nImages:\n" + "\n".join(f"- ![Image {i}: {alt}]({url})" for i, (alt, url) in enumerate(renderer.images, start=1)) + "\n"
+    if links_at_end:
+        snapshot += "\nLinks/Buttons:\n" + "\n".join(f"- [{text}]({url})" for text, url in renderer.links) + "\n"
+    return snapshot
+
+
+def get_local_snapshot(web_url, target_selector=[], exclude_selector=[], remove_image=False, links_at_end=False, images_at_end=False):
+    """Fetches a page with the shared pooled session and converts it locally, see html_to_snapshot."""
+    response = _get_fetcher().fetch(web_url)
+    return html_to_snapshot(decode(response), response.url, target_selector, exclude_selector, remove_image, links_at_end, images_at_end)
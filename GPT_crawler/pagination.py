@@ -0,0 +1,82 @@
+import re
+from collections import defaultdict
+from urllib.parse import urljoin
+
+from snapshot_links import filter_links, is_page_variant, is_pagination, normalize_url, split_snapshot
+
+MAX_PREDICTED_PAGES = 200 # upper bound of the listing pages predicted from one page
+
+## "下一页", "Next Page »", "« Older Entries", "»": 指向下一页的链接文字 ("»»", ">>" 常常指向最后一页, 不算)
+_NEXT_TEXT = re.compile(r'\bnext\b|\bolder\b|下一页|下页|后页|→|^\s*(?:»|›|>)\s*$', re.I)
+## 页码在链接里的位置: /page/3/, ?page=3, ?paged=3, ?p=3, list_12_3.html, index_3.html
+_PAGE_NUMBER = [
+    re.compile(r'(/page/)(\d+)(/?(?:[?#].*)?)$', re.I),
+    re.compile(r'([?&](?:page|paged|p)=)(\d+)(.*)$', re.I),
+    re.compile(r'(_)(\d+)(\.s?html?(?:[?#].*)?)$', re.I),
+]
+
+
+def page_number(url):
+    """Returns (template, number) for a url holding a page number, e.g. ('/news/list_12_{}.html', 3), or None."""
+    for pattern in _PAGE_NUMBER:
+        match = pattern.search(url)
+        if match:
+            escape = lambda text: text.replace('{', '{{').replace('}', '}}')
+            return escape(url[:match.start(2)]) + '{}' + escape(url[match.end(2):]), int(match.group(2))
+    return None
+
+
+def detect_pagination(snapshot, page_url, page):
+    """
+    Finds the next listing page without the LLM, from two independent signals:
+
+    - text: links reading "Next", "Next Page »", "« Older Entries", "下一页", "»", ... that point to another
+      page of the listing (is_page_variant of `page_url`, or a url holding a page number), so a story link
+      such as "What Happened Next" is not taken for the next page;
+    - sequence: links with page numbers (/page/N, ?page=N, list_N.html) of one url template. The page after
+      `page` is taken from the template, and the highest number seen gives the last page.
+
+    The signals agree when every one that fired points to the same url (after dropping fragments and
+    trailing slashes). No signal at all only counts as agreement that this is the last page when the page is
+    the highest number of its page sequence; otherwise the result is unknown ('agree' is False) and the
+    caller has to ask the LLM.
+
+    Args:
+        snapshot (str): r.jina.ai snapshot of the listing page, taken with links_at_end=True.
+        page_url (str): Url of the listing page.
+        page (int): Number of the listing page, 1 for the category url.
+
+    Returns:
+        dict: 'next_page' (url or ""), 'last_page' (int or None), 'page_urls' (urls of the pages after `page`
+        up to the last page, when the sequence is known), 'signals' ({signal: [urls]}) and 'agree' (bool).
+    """
+    links = filter_links(split_snapshot(snapshot)[1], page_url)
+    signals = {}
+    signals['text'] = [url for text, url in links
+                       if _NEXT_TEXT.search(text) and (is_page_variant(url, page_url) or page_number(url))]
+
+    ## 同一个模板下的页码越多, 越可能是分页序列; 故事链接 (如 20210101_123.html) 不算
+    sequences = defaultdict(dict)
+    for text, url in links + [('1', page_url)]:
+        found = page_number(url) if is_pagination(text, url, page_url) else None
+        if found:
+            sequences[found[0]].setdefault(found[1], url)
+    last_page, page_urls = None, []
+    if sequences:
+        template, numbers = max(sequences.items(), key=lambda item: len(item[1]))
+        if len(numbers) > 1 or page + 1 in numbers:
+            last_page = max(numbers)
+            page_urls = [numbers.get(n, urljoin(page_url, template.format(n)))
+                         for n in range(page + 1, min(last_page, page + MAX_PREDICTED_PAGES) + 1)]
+            signals['sequence'] = page_urls[:1]
+
+    fired = {name: urls for name, urls in signals.items() if urls}
+    candidates = {normalize_url(url, page_url) for urls in fired.values() for url in urls}
+    next_page = ""
+    if len(candidates) == 1:
+        ## keep the url as the page wrote it
+        next_page = next(url for urls in fired.values() for url in urls)
+    ## 没有任何信号时只有页码序列到头了才算最后一页, 否则交给 LLM
+    agree = len(candidates) == 1 or (not candidates and last_page is not None and last_page <= page)
+    return {'next_page': next_page, 'last_page': last_page, 'page_urls': page_urls if agree else [],
+            'signals': fired, 'agree': agree}
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+
+
+class AdaptiveBackoff:
+    def __init__(self, initial_delay=1.0, max_delay=60.0, decay=0.5):
+        """
+        Backoff state shared by all workers talking to one API.
+
+        When any worker hits a rate limit, every worker pauses until the pause is over, and the pause
+        doubles on each consecutive rate limit. Successful calls shrink it again, so throughput recovers
+        once the API stops complaining. This replaces per-call retry decorators, where each worker backs off
+        on its own while the others keep hammering the API.
+
+        Args:
+            initial_delay (float): Pause in seconds after the first rate limit.
+            max_delay (float): Upper bound of the pause in seconds.
+            decay (float): Factor applied to the pause after each successful call.
+        """
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.decay = decay
+        self.rate_limits = 0
+        self._delay = 0.0
+        self._pause_until = 0.0
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds left before requests may be sent again."""
+        return max(0.0, self._pause_until - time.monotonic())
+
+    def wait(self):
+        while (delay := self.remaining()) > 0:
+            time.sleep(delay)
+
+    async def wait_async(self):
+        while (delay := self.remaining()) > 0:
+            await asyncio.sleep(delay)
+
+    def on_rate_limit(self, retry_after=None):
+        """Records a rate limit. `retry_after` (seconds) is honoured when the API provides it."""
+        with self._lock:
+            self.rate_limits += 1
+            self._delay = min(self.max_delay, max(self.initial_delay, self._delay * 2))
+            pause = max(self._delay, retry_after or 0)
+            self._pause_until = max(self._pause_until, time.monotonic() + pause)
+
+    def on_success(self):
+        with self._lock:
+            self._delay *= self.decay
+            if self._delay < self.initial_delay / 8:
+                self._delay = 0.0
+
+
+def retry_after_seconds(error):
+    """Reads the Retry-After header of an openai.RateLimitError, if any."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
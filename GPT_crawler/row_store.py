@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+
+META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+INITIAL_CAPACITY = 1024
+QUERY_CHUNK = 500 # SQLite limits the number of parameters of one query
+
+
+def select_in(conn, sql, keys):
+    """
+    Runs a query with an `IN ({})` list over `keys`, QUERY_CHUNK keys at a time, and yields the result rows.
+    The '{}' of `sql` is replaced by the placeholders of one chunk.
+    """
+    keys = list(keys)
+    for start in range(0, len(keys), QUERY_CHUNK):
+        chunk = keys[start:start + QUERY_CHUNK]
+        yield from conn.execute(sql.format(",".join("?" * len(chunk))), chunk)
+
+
+class RowStore:
+    def __init__(self, path, conn, dtype, label):
+        """
+        Fixed-size vectors stored row by row in a memory-mapped array file (vectors.bin) that grows by doubling.
+        Only the rows that are read are paged in, so 100k+ vectors do not have to fit in RAM.
+
+        The dtype, the dimension and the number of rows are kept in the 'meta' table (META_SCHEMA) of the owner's
+        SQLite database. The dimension is recorded on the first write; vectors of another dimension, or opening
+        the store with another dtype, raise a ValueError.
+
+        Args:
+            path (str): Directory of vectors.bin.
+            conn (sqlite3.Connection): Connection of the owner's database, with the meta table created.
+            dtype (str): 'float32' or 'float16'. float16 halves the disk and page cache footprint.
+            label (str): Name of the owner in error messages, e.g. 'Embedding cache'.
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"{label} dtype must be 'float32' or 'float16'.")
+        self.path = path
+        self.label = label
+        self.dtype = np.dtype(dtype)
+        self._conn = conn
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get("dtype", dtype) != dtype:
+            raise ValueError(f"{label} at {path} stores {meta['dtype']}, not {dtype}.")
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dtype', ?)", (dtype,))
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.count = int(meta.get("count", 0))
+        self._vectors = None
+        if self.dim is not None:
+            self._open(max(self.count, INITIAL_CAPACITY))
+
+    def _open(self, capacity):
+        """(Re)maps vectors.bin with room for `capacity` rows, growing the file if needed."""
+        file = os.path.join(self.path, "vectors.bin")
+        size = capacity * self.dim * self.dtype.itemsize
+        if not os.path.exists(file) or os.path.getsize(file) < size:
+            with open(file, "ab") as f:
+                f.truncate(size)
+        capacity = os.path.getsize(file) // (self.dim * self.dtype.itemsize)
+        self._vectors = np.memmap(file, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+
+    @property
+    def vectors(self):
+        """The stored rows, a view of the memory map."""
+        if self._vectors is None:
+            return np.empty((0, 0), dtype=self.dtype)
+        return self._vectors[:self.count]
+
+    def check_dim(self, dim):
+        """Records the dimension on the first write, raises a ValueError when `dim` differs from it afterwards."""
+        if self.dim is None:
+            self.dim = dim
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+            self._open(INITIAL_CAPACITY)
+        elif dim != self.dim:
+            raise ValueError(f"{self.label} at {self.path} stores dimension {self.dim}, got {dim}.")
+
+    def write(self, rows, vectors):
+        """
+        Writes vectors at the given rows (a slice or an index array), growing the file when they go past its end.
+        The new row count is only recorded by set_count, inside the owner's transaction.
+        """
+        end = rows.stop if isinstance(rows, slice) else int(np.max(rows)) + 1
+        if end > self._vectors.shape[0]:
+            self._vectors.flush()
+            self._open(max(end, 2 * self._vectors.shape[0]))
+        self._vectors[rows] = np.asarray(vectors).astype(self.dtype)
+        self._vectors.flush()
+
+    def set_count(self, count):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('count', ?)", (str(count),))
+        self.count = count
+
+    def close(self):
+        if self._vectors is not None:
+            self._vectors.flush()
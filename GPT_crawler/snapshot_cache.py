@@ -0,0 +1,117 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT,
+    body_hash TEXT NOT NULL,
+    created_at REAL,
+    accessed_at REAL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+CREATE TABLE IF NOT EXISTS bodies (
+    hash TEXT PRIMARY KEY,
+    data BLOB,
+    size INTEGER
+);
+"""
+
+## headers that do not change the snapshot and must not end up in the cache key
+_IGNORED_HEADERS = {"Authorization"}
+
+
+class SnapshotCache:
+    def __init__(self, path="snapshot_cache.sqlite", ttl=7 * 24 * 3600, max_bytes=512 * 2**20):
+        """
+        Persistent cache of r.jina.ai snapshots, so re-runs and prompt iterations cost no network.
+
+        Entries are keyed by the url plus the request headers (selectors, return format, links_at_end, ...).
+        Bodies are zlib-compressed and stored once per content hash, so identical snapshots requested with
+        different headers share storage. Expired entries are ignored, and the least recently used entries
+        are evicted once the compressed bodies exceed `max_bytes`.
+
+        Args:
+            path (str): Path of the SQLite database.
+            ttl (float | None): Seconds an entry stays valid. None means forever.
+            max_bytes (int | None): Maximum total size of the compressed bodies. None means unbounded.
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url, headers):
+        headers = {k: v for k, v in headers.items() if k not in _IGNORED_HEADERS}
+        return hashlib.sha256(json.dumps([url, sorted(headers.items())], default=str).encode("utf-8")).hexdigest()
+
+    def get(self, url, headers):
+        """Returns the cached snapshot, or None on a miss or an expired entry."""
+        key = self.make_key(url, headers)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT e.created_at, b.data FROM entries e JOIN bodies b ON b.hash = e.body_hash WHERE e.key = ?",
+                (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[0] > self.ttl):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return zlib.decompress(row[1]).decode("utf-8")
+
+    def set(self, url, headers, text):
+        data = zlib.compress(text.encode("utf-8"))
+        body_hash = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("INSERT OR IGNORE INTO bodies (hash, data, size) VALUES (?, ?, ?)",
+                               (body_hash, data, len(data)))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, url, body_hash, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.make_key(url, headers), url, body_hash, now, now))
+            self._evict()
+            self._conn.execute("COMMIT")
+
+    def _evict(self):
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl,))
+        if self.max_bytes is not None:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._conn.execute(
+                    "SELECT e.key, b.size, e.body_hash FROM entries e JOIN bodies b ON b.hash = e.body_hash "
+                    "ORDER BY e.accessed_at LIMIT 1").fetchone()
+                if row is None:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (row[0],))
+                ## a body shared with other entries stays until its last entry is gone
+                if self._conn.execute("SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1", (row[2],)).fetchone() is None:
+                    total -= row[1]
+        self._conn.execute("DELETE FROM bodies WHERE hash NOT IN (SELECT body_hash FROM entries)")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT (SELECT COUNT(*) FROM entries), (SELECT COALESCE(SUM(size), 0) FROM bodies)").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        self._conn.close()
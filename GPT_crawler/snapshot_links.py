@@ -0,0 +1,204 @@
+import re
+from collections import defaultdict
+from urllib.parse import urljoin, urlparse, urlunparse
+
+from text_tokens import CJK, count_tokens
+
+LINKS_HEADER = "Links/Buttons:"
+_LINK = re.compile(r'^\s*-\s*\[(.*)\]\((\S+?)(?:\s+"[^"]*")?\)\s*$')
+_NUMBER = re.compile(r'\d+')
+_ASSET = re.compile(r'\.(?:jpe?g|png|gif|svg|webp|ico|css|js|pdf|zip|mp3|mp4)$', re.I)
+## 分页链接: 页码, 下一页, », "next", ?page=3, /page/3/
+_PAGINATION_TEXT = re.compile(r'^\s*(?:\d+|next|next page|older|more|下一页|下页|后页|»|›|>|>>)\s*$', re.I)
+_PAGINATION_URL = re.compile(r'(?:[?&](?:page|paged|p)=\d+|/page/\d+|list_\d+)', re.I)
+## "Next Page »", "« Older Entries", "下一页 >": 文字里带有这些词的链接也是分页链接
+_PAGINATION_HINT = re.compile(r'\bnext\b|\bolder\b|\bnewer\b|\bprevious\b|下一页|上一页|下页|后页|»|«|›|‹|→|←', re.I)
+## 列表页地址后面多出来的页码段: /stories/2/, /stories/page/2/
+_PAGE_SEGMENTS = re.compile(r'^(?:(?:page|p)/)?\d{1,4}$', re.I)
+
+def split_snapshot(snapshot):
+    """Splits an r.jina.ai snapshot into (page text, [(link text, url)]) at the "Links/Buttons:" section."""
+    position = snapshot.find(LINKS_HEADER)
+    if position == -1:
+        return snapshot, []
+    links = []
+    for line in snapshot[position + len(LINKS_HEADER):].splitlines():
+        match = _LINK.match(line)
+        if match:
+            links.append((match.group(1).strip(), match.group(2)))
+    return snapshot[:position], links
+
+
+def normalize_url(url, page_url):
+    parsed = urlparse(urljoin(page_url, url))
+    return urlunparse(parsed._replace(fragment='', path=parsed.path.rstrip('/') or '/'))
+
+
+def _site(host):
+    return host.lower().removeprefix('www.')
+
+
+def filter_links(links, page_url):
+    """
+    Drops links the LLM never needs: duplicates (same url without fragment or trailing slash), links to
+    other sites, non-http links (mailto:, javascript:, ...) and links to images, scripts and other assets.
+    The first occurrence of a url is kept, with the longest link text seen for it.
+    """
+    site = _site(urlparse(page_url).netloc)
+    kept = {}
+    for text, url in links:
+        absolute = urljoin(page_url, url)
+        parsed = urlparse(absolute)
+        if parsed.scheme not in ('http', 'https') or _site(parsed.netloc) != site or _ASSET.search(parsed.path):
+            continue
+        key = normalize_url(absolute, page_url)
+        if key == normalize_url(page_url, page_url) and not _PAGINATION_TEXT.match(text):
+            continue
+        if key not in kept or len(text) > len(kept[key][0]):
+            kept[key] = (text, kept[key][1] if key in kept else absolute)
+    return list(kept.values())
+
+
+def path_pattern(url):
+    """
+    The url path with its last segment replaced by '*' and digit runs by '0', e.g. /story/cinderella/ and
+    /story/snow-white/ share the pattern /story/*; /news/123.html and /news/456.html share /news/*.
+    """
+    segments = [segment for segment in urlparse(url).path.split('/') if segment]
+    if not segments:
+        return '/'
+    return '/' + '/'.join([_NUMBER.sub('0', segment) for segment in segments[:-1]] + ['*'])
+
+
+def is_page_variant(url, page_url):
+    """
+    True when `url` is another page of the listing at `page_url`: the two differ only in digits
+    (list_12_1.html / list_12_2.html, ?page=1 / ?page=2), or one adds a page segment to the other
+    (/stories/ / /stories/2/, /stories/ / /stories/page/2/).
+    """
+    link, page = urlparse(urljoin(page_url, url)), urlparse(page_url)
+    if _site(link.netloc) != _site(page.netloc) or normalize_url(url, page_url) == normalize_url(page_url, page_url):
+        return False
+    if _NUMBER.sub('0', link.path.rstrip('/') + '?' + link.query) == _NUMBER.sub('0', page.path.rstrip('/') + '?' + page.query):
+        return True
+    if link.query != page.query:
+        return False
+    longer, shorter = sorted([link.path.strip('/'), page.path.strip('/')], key=len, reverse=True)
+    if shorter and not longer.startswith(shorter + '/'):
+        return False
+    return bool(_PAGE_SEGMENTS.match(longer[len(shorter):].strip('/')))
+
+
+def is_pagination(text, url, page_url=None):
+    """True for links to other pages of a listing, by link text, by url pattern or, given `page_url`, by is_page_variant."""
+    return bool(_PAGINATION_TEXT.match(text) or _PAGINATION_HINT.search(text) or _PAGINATION_URL.search(url)
+                or (page_url and is_page_variant(url, page_url)))
+
+
+def story_links(links, min_share=0.5, page_url=None):
+    """
+    Keeps the links of the candidate story group plus the pagination links.
+
+    Pagination links (see is_pagination; with `page_url`, other pages of the same listing too) are always
+    kept, whatever their group would score.
+
+    Links are clustered by path_pattern. Story lists are the largest groups of links with descriptive
+    (multi-word or CJK) texts, while navigation, footer and social links spread over many small groups.
+    Every group scoring at least `min_share` of the best group is kept.
+
+    Returns:
+        tuple: (story links, pagination links), both lists of (text, url).
+    """
+    groups = defaultdict(list)
+    pagination = []
+    for text, url in links:
+        if is_pagination(text, url, page_url):
+            pagination.append((text, url))
+        else:
+            groups[path_pattern(url)].append((text, url))
+    if not groups:
+        return [], pagination
+
+    def score(group):
+        descriptive = sum(1 for text, _ in group if len(text.split()) > 1 or CJK.search(text))
+        return len(group) + descriptive
+
+    best = max(score(group) for group in groups.values())
+    stories = [link for group in groups.values() if score(group) >= min_share * best for link in group]
+    return stories, pagination
+
+
+def render_links(links):
+    return LINKS_HEADER + "\n" + "\n".join(f"- [{text}]({url})" for text, url in links)
+
+
+def budget_parts(links, max_tokens, header="", footer=""):
+    """
+    Renders links as "Links/Buttons:" sections of at most `max_tokens` tokens each (header and footer,
+    e.g. the pagination links, are repeated in every part). Returns a single part when everything fits.
+    """
+    fixed = count_tokens(header) + count_tokens(footer) + count_tokens(LINKS_HEADER) + 2
+    parts, current, current_tokens = [], [], fixed
+    for text, url in links:
+        tokens = count_tokens(f"- [{text}]({url})\n")
+        if current and current_tokens + tokens > max_tokens:
+            parts.append(current)
+            current, current_tokens = [], fixed
+        current.append((text, url))
+        current_tokens += tokens
+    if current or not parts:
+        parts.append(current)
+    return [f"{header}{render_links(part)}\n{footer}".strip() for part in parts]
+
+
+def split_text(text, max_tokens):
+    """Splits text at line breaks into parts of at most `max_tokens` tokens (a longer line is cut)."""
+    parts, current, current_tokens = [], [], 0
+    for line in text.splitlines(keepends=True):
+        tokens = count_tokens(line)
+        while tokens > max_tokens:
+            cut = max(1, len(line) * max_tokens // tokens)
+            parts.append(''.join(current) + line[:cut])
+            current, current_tokens = [], 0
+            line = line[cut:]
+            tokens = count_tokens(line)
+        if current and current_tokens + tokens > max_tokens:
+            parts.append(''.join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        parts.append(''.join(current))
+    return parts or ['']
+
+
+def prepare_links(snapshot, page_url, max_tokens, page_note=""):
+    """
+    Local pre-processing of a snapshot for the title/url extraction: parses the "Links/Buttons:" section,
+    drops duplicate, off-site and asset links, keeps the story-link group and the pagination links, and
+    splits the result into parts of at most `max_tokens` tokens.
+
+    Args:
+        snapshot (str): The r.jina.ai snapshot (taken with links_at_end=True).
+        page_url (str): Url of the page, to resolve relative links and recognize off-site links.
+        max_tokens (int): Token budget of one part.
+        page_note (str): Text appended to every part, e.g. the current page number.
+
+    Returns:
+        tuple: (parts, stats). stats holds the token and link counts before and after.
+    """
+    _, links = split_snapshot(snapshot)
+    kept = filter_links(links, page_url)
+    stories, pagination = story_links(kept, page_url=page_url)
+    footer = ""
+    if pagination:
+        footer = "Pagination links:\n" + "\n".join(f"- [{text}]({url})" for text, url in pagination) + "\n"
+    parts = budget_parts(stories, max_tokens, footer=footer + page_note)
+    stats = {
+        'links': len(links),
+        'kept_links': len(stories) + len(pagination),
+        'tokens': count_tokens(snapshot[snapshot.find(LINKS_HEADER):] if LINKS_HEADER in snapshot else snapshot),
+        'kept_tokens': sum(count_tokens(part) for part in parts),
+        'parts': len(parts),
+    }
+    return parts, stats
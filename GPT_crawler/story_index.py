@@ -0,0 +1,343 @@
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+
+import numpy as np
+
+from Embedder import _normalize
+from row_store import META_SCHEMA, RowStore, select_in
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    row INTEGER PRIMARY KEY,
+    url TEXT UNIQUE,
+    title TEXT,
+    category TEXT
+);
+""" + META_SCHEMA
+
+_BLOCK_ROWS = 65536  # rows scored per matrix multiply in the exact search
+
+COLUMNS = ['title', 'category', 'url']
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores of every row, best first."""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+class StoryIndex:
+    def __init__(self, directory="story_index", dtype="float32"):
+        """
+        Similarity index over story embeddings (e.g. Embedder.get_embedding of the story contents).
+
+        Vectors are L2-normalized and stored contiguously in a row_store.RowStore (a memory-mapped vectors.bin),
+        so cosine similarity is a dot product and the exact search is a blocked matrix multiply.
+        Title, category and url of every story live in a SQLite table next to it, keyed by the vector row.
+        An optional IVF (inverted file) partition, built with build_ivf, restricts a search to the vectors
+        of the `nprobe` clusters closest to the query.
+
+        Args:
+            directory (str): Directory of the index. Created if it does not exist.
+            dtype (str): 'float32' or 'float16' storage. float16 halves the disk and page cache footprint.
+        """
+        self.path = directory
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.path, "stories.sqlite"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._store = RowStore(self.path, self._conn, dtype, "Story index")
+
+        ## IVF partition: centroids and the cluster of every row
+        self.centroids = None
+        self.assignments = None
+        self._lists = None
+        ivf = os.path.join(self.path, "ivf.npz")
+        if os.path.exists(ivf):
+            with np.load(ivf) as data:
+                self.centroids = data["centroids"]
+                self.assignments = data["assignments"][:self.count]
+            if len(self.assignments) < self.count:
+                ## rows added after the partition was saved
+                self.assignments = np.concatenate([self.assignments, self._assign(self.vectors[len(self.assignments):])])
+            self._build_lists()
+
+    @property
+    def dim(self):
+        return self._store.dim
+
+    @property
+    def count(self):
+        return self._store.count
+
+    @property
+    def dtype(self):
+        return self._store.dtype
+
+    @property
+    def vectors(self):
+        """The stored (normalized) vectors, one row per story."""
+        return self._store.vectors
+
+    def add(self, embeddings, records):
+        """
+        Adds stories to the index. A story whose url is already indexed gets its vector and metadata replaced.
+
+        Args:
+            embeddings (np.ndarray): One embedding per story.
+            records (list of dict): Metadata of every story, with the keys of COLUMNS ('url' is required).
+
+        Returns:
+            np.ndarray: The row of every story.
+        """
+        embeddings = _normalize(embeddings)
+        if len(embeddings) != len(records):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(records)} records.")
+        with self._lock:
+            self._store.check_dim(embeddings.shape[1])
+
+            urls = [record['url'] for record in records]
+            known = dict(select_in(self._conn, "SELECT url, row FROM stories WHERE url IN ({})", urls))
+            rows = []
+            next_row = self.count
+            for url in urls:
+                if url not in known: # new story, duplicates within the batch share its row
+                    known[url] = next_row
+                    next_row += 1
+                rows.append(known[url])
+            rows = np.array(rows, dtype=np.int64)
+            new_count = max(self.count, int(rows.max()) + 1) if len(rows) else self.count
+
+            if len(rows):
+                self._store.write(rows, embeddings)
+
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO stories (row, url, title, category) VALUES (?, ?, ?, ?)",
+                [(int(row), record['url'], record.get('title', ''), record.get('category', '')) for row, record in zip(rows, records)])
+            self._store.set_count(new_count)
+            self._conn.execute("COMMIT")
+
+            if self.centroids is not None:
+                assignments = np.resize(self.assignments, new_count)
+                assignments[rows] = self._assign(embeddings)
+                self.assignments = assignments
+                self._build_lists()
+                self._save_ivf()
+        return rows
+
+    def search(self, queries, k=10, nprobe=None):
+        """
+        Finds the k most similar stories of every query.
+
+        Args:
+            queries (np.ndarray): One query embedding per row (a single vector is accepted too).
+            k (int): Number of results per query.
+            nprobe (int | None): Search only the nprobe closest IVF clusters. None (or no IVF built)
+                runs the exact search over all vectors.
+
+        Returns:
+            tuple: (scores, rows), arrays of shape (n_queries, k) sorted by decreasing cosine similarity.
+            When fewer than k stories are found (a small index, or few stories in the probed clusters),
+            the remaining columns hold score -inf and row -1.
+        """
+        queries = _normalize(queries)
+        if self.count == 0:
+            return np.full((len(queries), k), -np.inf, dtype="f"), np.full((len(queries), k), -1, dtype=np.int64)
+        if nprobe is None or self.centroids is None:
+            return self._search_exact(queries, k)
+        return self._search_ivf(queries, k, nprobe)
+
+    def _search_exact(self, queries, k):
+        ## score block by block and keep the running top k, so memory does not grow with the index
+        best_scores = np.empty((len(queries), 0), dtype="f")
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.count, _BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + _BLOCK_ROWS], dtype="f")
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))], axis=1)
+            top = _top_k(scores, k)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+        if best_rows.shape[1] < k: # fewer stories than k, padded like the IVF search
+            padding = k - best_rows.shape[1]
+            best_scores = np.pad(best_scores, ((0, 0), (0, padding)), constant_values=-np.inf)
+            best_rows = np.pad(best_rows, ((0, 0), (0, padding)), constant_values=-1)
+        return best_scores, best_rows
+
+    def _search_ivf(self, queries, k, nprobe):
+        probes = _top_k(queries @ self.centroids.T, nprobe)
+        scores = np.full((len(queries), k), -np.inf, dtype="f")
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            candidates = np.sort(np.concatenate([self._lists[c] for c in probes[i]]))
+            if len(candidates) == 0:
+                continue
+            candidate_scores = np.asarray(self.vectors[candidates], dtype="f") @ query
+            top = _top_k(candidate_scores[None, :], k)[0]
+            scores[i, :len(top)] = candidate_scores[top]
+            rows[i, :len(top)] = candidates[top]
+        return scores, rows
+
+    def build_ivf(self, n_lists=None, n_iter=10, sample=50000, seed=0):
+        """
+        Partitions the vectors into n_lists clusters with spherical k-means on a sample of the vectors,
+        for the approximate search of search(..., nprobe=...). Stories added later are assigned to their
+        nearest cluster; rebuild once the data has drifted a lot.
+
+        Args:
+            n_lists (int | None): Number of clusters. Defaults to about 4 * sqrt(count).
+            n_iter (int): k-means iterations.
+            sample (int): Number of vectors the clusters are trained on.
+            seed (int): Random seed.
+        """
+        with self._lock:
+            if self.count == 0:
+                raise ValueError("Cannot build an IVF partition of an empty index.")
+            n_lists = min(n_lists or int(4 * np.sqrt(self.count)), self.count)
+            rng = np.random.default_rng(seed)
+            training = np.asarray(self.vectors[np.sort(rng.choice(self.count, min(sample, self.count), replace=False))], dtype="f")
+            centroids = training[rng.choice(len(training), n_lists, replace=False)]
+            for _ in range(n_iter):
+                labels = np.argmax(training @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, training)
+                empty = np.bincount(labels, minlength=n_lists) == 0
+                ## an empty cluster is restarted at a random training vector
+                sums[empty] = training[rng.choice(len(training), int(empty.sum()))]
+                centroids = _normalize(sums)
+            self.centroids = centroids
+            self.assignments = self._assign(self.vectors)
+            self._build_lists()
+            self._save_ivf()
+
+    def _assign(self, vectors):
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), _BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + _BLOCK_ROWS], dtype="f")
+            labels[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def _build_lists(self):
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+
+    def _save_ivf(self):
+        np.savez(os.path.join(self.path, "ivf.npz"), centroids=self.centroids, assignments=self.assignments)
+
+    def records(self, rows):
+        """Returns the metadata (row, title, category, url) of the given rows, in order. Row -1 gives None."""
+        rows = [int(row) for row in np.ravel(rows)]
+        found = {}
+        with self._lock:
+            wanted = set(row for row in rows if row >= 0)
+            for row, title, category, url in select_in(self._conn, "SELECT row, title, category, url FROM stories WHERE row IN ({})", wanted):
+                found[row] = {'row': row, 'title': title, 'category': category, 'url': url}
+        return [found.get(row) for row in rows]
+
+    def query(self, embedder, texts, k=10, nprobe=None):
+        """Embeds texts with an Embedder and returns the k most similar stories of each, with a 'score' key."""
+        scores, rows = self.search(embedder.get_embedding(list(texts)), k=k, nprobe=nprobe)
+        results = []
+        for query_scores, query_rows in zip(scores, rows):
+            hits = []
+            for score, record in zip(query_scores, self.records(query_rows)):
+                if record is not None:
+                    hits.append({**record, 'score': float(score)})
+            results.append(hits)
+        return results
+
+    def stats(self):
+        return {"stories": self.count, "dim": self.dim, "dtype": self.dtype.name,
+                "ivf_lists": len(self.centroids) if self.centroids is not None else 0}
+
+    def close(self):
+        self._store.close()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def index_stories(csv_path, embedder, directory="story_index", text_column="content", chunksize=256, dtype="float32", dedup=None,
+                  title_column="title", url_column="url"):
+    """
+    Embeds the stories of a crawled CSV and adds them to the index at `directory`, chunk by chunk.
+    Rows without text are skipped; stories without a url column are keyed by '<csv_path>#<title>'.
+    With `dedup` (a story_dedup.StoryDeduper), near-duplicates of stories seen before are not embedded.
+    The crawlers name their columns differently (wpwx: 'text' and 'story_url', oesz: 'name' for the title),
+    `text_column`, `title_column` and `url_column` select them.
+    """
+    import pandas as pd
+
+    with StoryIndex(directory, dtype=dtype) as index:
+        for frame in pd.read_csv(csv_path, chunksize=chunksize):
+            if text_column not in frame:
+                raise ValueError(f"{csv_path} has no '{text_column}' column, choose one of {list(frame.columns)}.")
+            frame = frame[frame[text_column].notna()]
+            if frame.empty:
+                continue
+            metadata = frame.rename(columns={title_column: 'title', url_column: 'url'}).reindex(columns=COLUMNS).fillna('').astype(str)
+            records, texts = [], []
+            for (title, category, url), text in zip(metadata.itertuples(index=False), frame[text_column].astype(str)):
+                url = url or f"{csv_path}#{title}"
+                if dedup is not None and dedup.add(url, text) is not None:
+                    continue
+                records.append({'title': title, 'category': category, 'url': url})
+                texts.append(text)
+            if records:
+                index.add(embedder.get_embedding(texts), records)
+        print(f"{index.count} stories in {directory}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and query a similarity index over crawled stories')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Embed the stories of CSV files and add them to the index.')
+    build.add_argument('csv', nargs='+', help='Story CSV files, e.g. stories_togrowby.csv.')
+    build.add_argument('--ivf', action='store_true', help='Build the IVF partition afterwards.')
+    build.add_argument('--text-column', default='content', help="Column of the story text, e.g. 'text' for stories.csv (wpwx).")
+    build.add_argument('--title-column', default='title', help="Column of the story title, e.g. 'name' for stories_cn_oesz.csv.")
+    build.add_argument('--url-column', default='url', help="Column of the story url, e.g. 'story_url' for stories.csv (wpwx).")
+    search = subparsers.add_parser('search', help='Find the stories most similar to a text.')
+    search.add_argument('text', help='Query text.')
+    search.add_argument('-k', type=int, default=10, help='Number of results.')
+    search.add_argument('--nprobe', type=int, default=None, help='IVF clusters to search. Exact search if omitted.')
+    for sub in (build, search):
+        sub.add_argument('-i', '--index', default='story_index', help='Index directory.')
+        sub.add_argument('--api', default='jina', help="Embedding API: 'jina' or 'openai'.")
+        sub.add_argument('--model', default=None, help='Embedding model name.')
+    build.add_argument('--dedup', action='store_true', help='Skip near-duplicate stories (MinHash/LSH) across the files.')
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from Embedder import Embedder
+
+    load_dotenv()
+    embedder = Embedder(model_name=args.model, use_api=args.api)
+    if args.command == 'build':
+        dedup = None
+        if args.dedup:
+            sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            from story_dedup import StoryDeduper
+            dedup = StoryDeduper()
+        for path in args.csv:
+            index_stories(path, embedder, args.index, text_column=args.text_column, dedup=dedup,
+                          title_column=args.title_column, url_column=args.url_column)
+        if args.ivf:
+            with StoryIndex(args.index) as index:
+                index.build_ivf()
+    else:
+        with StoryIndex(args.index) as index:
+            for hit in index.query(embedder, [args.text], k=args.k, nprobe=args.nprobe)[0]:
+                print(f"{hit['score']:.3f}  [{hit['category']}] {hit['title']}  {hit['url']}")
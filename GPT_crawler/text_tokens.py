@@ -0,0 +1,33 @@
+import re
+
+## CJK 字符和标点约一个 token 一个字, 其他文字约 4 个字符一个 token
+CJK = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+## 中文按字切分, 其他语言按词切分
+WORD = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]|[^\W_\u3400-\u4dbf\u4e00-\u9fff]+')
+
+_encoding = None
+
+
+def estimate_tokens(text):
+    """Rough token count without a tokenizer: about one token per CJK character and per 4 other characters."""
+    cjk = len(CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text):
+    """Tokens of `text` for gpt-4o-mini. Uses tiktoken when it is installed, otherwise estimate_tokens."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken  # Importing tiktoken only when needed, it is optional
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def words(text):
+    """The lowercased words of `text` for comparing texts, every CJK character is a word of its own."""
+    return WORD.findall(str(text).lower())
@@ -0,0 +1,60 @@
+"""
+Benchmark of Fetcher: pages/s at several concurrency levels against a local stand-in server.
+Run from the repository root, e.g. `python benchmarks/fetcher_benchmark.py`.
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # fetcher lives one level up
+from fetcher import Fetcher
+
+
+def benchmark(page='target.html', n_pages=200, latency=0.05, max_workers=(1, 8, 32)):
+    """
+    Measures throughput against a local HTTP stand-in that serves `page` with a fixed latency.
+
+    Args:
+        page (str): Path of the html file to serve.
+        n_pages (int): Number of pages to fetch per run.
+        latency (float): Seconds the stand-in waits before answering, to mimic network wait.
+        max_workers (tuple): Concurrency levels to compare.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    with open(page, 'rb') as f:
+        body = f.read()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}/'
+    urls = [f'{base}{i}.html' for i in range(n_pages)]
+
+    try:
+        for workers in max_workers:
+            with Fetcher(max_workers=workers) as fetcher:
+                start = time.perf_counter()
+                n_ok = sum(1 for _, text, _ in fetcher.fetch_all(urls) if text is not None)
+                elapsed = time.perf_counter() - start
+            print(f"max_workers={workers:>3}: {n_ok} pages in {elapsed:.2f}s ({n_ok / elapsed:.1f} pages/s)")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    benchmark()
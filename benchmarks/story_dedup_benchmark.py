@@ -0,0 +1,51 @@
+"""
+Benchmark of StoryDeduper: dedup time, compared pairs and recall of planted near-duplicates.
+Run from the repository root, e.g. `python benchmarks/story_dedup_benchmark.py`.
+"""
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT) # story_dedup lives one level up
+sys.path.append(os.path.join(ROOT, 'GPT_crawler')) # and uses text_tokens
+from story_dedup import StoryDeduper
+
+
+def benchmark(sizes=(1000, 2000, 5000, 10000, 20000), words_per_story=300, duplicate_rate=0.1, edit_rate=0.05):
+    """
+    Dedup time, number of compared pairs and recall of planted near-duplicates (copies with `edit_rate`
+    of the words replaced) on synthetic corpora of growing size, against the n^2 / 2 pairs of an
+    all-pairs comparison.
+    """
+    import time
+
+    rng = np.random.default_rng(0)
+    vocabulary = np.array([f"w{i}" for i in range(20000)])
+    for n in sizes:
+        n_original = int(n / (1 + duplicate_rate))
+        stories = [rng.choice(vocabulary, words_per_story) for _ in range(n_original)]
+        planted = []
+        for _ in range(n - n_original):
+            source = int(rng.integers(n_original))
+            copy = stories[source].copy()
+            edits = rng.random(words_per_story) < edit_rate
+            copy[edits] = rng.choice(vocabulary, int(edits.sum()))
+            planted.append((source, len(stories)))
+            stories.append(copy)
+        texts = [" ".join(story) for story in stories]
+
+        start = time.perf_counter()
+        deduper = StoryDeduper()
+        for i, text in enumerate(texts):
+            deduper.add(i, text)
+        elapsed = time.perf_counter() - start
+        found = sum(deduper._find(a) == deduper._find(b) for a, b in planted)
+        print(f"{n:>6} stories: {elapsed:.2f}s ({n / elapsed:.0f} stories/s), {deduper.comparisons} pairs compared "
+              f"vs {n * (n - 1) // 2} all-pairs, recall {found / max(len(planted), 1):.2f}, "
+              f"{len(deduper.clusters())} clusters")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,63 @@
+"""
+Benchmark of StorySink: time and peak RSS of streaming stories versus growing a DataFrame.
+Run from the repository root, e.g. `python benchmarks/story_sink_benchmark.py`.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # story_sink lives one level up
+from story_sink import StorySink
+
+
+def _run_benchmark(approach, n_stories, story_length, path, fieldnames):
+    import resource
+    import time
+
+    body = '故事' * (story_length // 2)
+    rows = ([f"story {i}", f"{i} {body}", 'category', f"http://example.com/{i}.html"] for i in range(n_stories))
+
+    start = time.perf_counter()
+    if approach == 'dataframe':
+        import pandas as pd
+
+        df = pd.DataFrame(columns=fieldnames)
+        for nrow, row in enumerate(rows):
+            df.loc[nrow] = row
+        df.to_csv(f'{path}.csv', index=False)
+    else:
+        with StorySink(f'{path}.{approach}', fieldnames) as out:
+            for row in rows:
+                out.write(row)
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark(n_stories=10000, story_length=3000, path='sink_benchmark'):
+    """
+    Compares time and peak RSS of growing a DataFrame with `df.loc[nrow] = [...]` and then calling
+    `to_csv`, against streaming the same stories through StorySink. Each approach runs in a fresh process.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    fieldnames = ['title', 'text', 'category', 'story_url']
+    approaches = ['dataframe', 'csv', 'jsonl']
+    try:
+        import pyarrow  # noqa: F401
+        approaches.append('parquet')
+    except ImportError:
+        pass
+
+    try:
+        for approach in approaches:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                elapsed, peak = executor.submit(_run_benchmark, approach, n_stories, story_length, path, fieldnames).result()
+            name = 'DataFrame .loc' if approach == 'dataframe' else f'StorySink {approach}'
+            print(f"{name:<18}: {n_stories} stories in {elapsed:.2f}s, peak RSS {peak:.0f} MiB")
+    finally:
+        for ext in ('csv', 'jsonl', 'parquet'):
+            if os.path.exists(f'{path}.{ext}'):
+                os.remove(f'{path}.{ext}')
+
+
+if __name__ == '__main__':
+    benchmark()
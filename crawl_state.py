@@ -0,0 +1,145 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    category TEXT,
+    author TEXT,
+    content TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    error TEXT,
+    discovered_at REAL,
+    fetched_at REAL,
+    checked_at REAL
+);
+CREATE INDEX IF NOT EXISTS stories_status ON stories (status);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def content_hash(content):
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+
+class CrawlState:
+    def __init__(self, path):
+        """
+        SQLite-backed crawl frontier. Every discovered story url is stored with its status
+        ('pending', 'done' or 'failed'), the validators of the last response (ETag/Last-Modified),
+        the hash of the extracted content and timestamps, so an interrupted crawl can resume and a
+        re-run only fetches new or changed stories.
+
+        Args:
+            path (str): Path of the SQLite database. Created if it does not exist.
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def add(self, url, title, category):
+        """Records a discovered story. Returns True if the url was not known yet."""
+        cursor = self._execute(
+            "INSERT OR IGNORE INTO stories (url, title, category, discovered_at) VALUES (?, ?, ?, ?)",
+            (url, title, category, time.time()))
+        return cursor.rowcount == 1
+
+    def get(self, url):
+        row = self._execute("SELECT * FROM stories WHERE url = ?", (url,)).fetchone()
+        return dict(row) if row else None
+
+    def is_done(self, url):
+        row = self._execute("SELECT status FROM stories WHERE url = ?", (url,)).fetchone()
+        return bool(row) and row['status'] == 'done'
+
+    def pending(self):
+        """Returns the stories that still need fetching as {url: (title, category)}, in discovery order."""
+        rows = self._execute(
+            "SELECT title, url, category FROM stories WHERE status != 'done' ORDER BY rowid").fetchall()
+        return {row['url']: (row['title'], row['category']) for row in rows}
+
+    def conditional_headers(self, url):
+        """Returns If-None-Match/If-Modified-Since headers for a story fetched before."""
+        row = self._execute("SELECT etag, last_modified, status FROM stories WHERE url = ?", (url,)).fetchone()
+        headers = {}
+        if row and row['status'] == 'done':
+            if row['etag']:
+                headers['If-None-Match'] = row['etag']
+            if row['last_modified']:
+                headers['If-Modified-Since'] = row['last_modified']
+        return headers
+
+    def mark_done(self, url, content, author='', etag=None, last_modified=None):
+        """
+        Stores the extracted content of a story.
+
+        Returns:
+            bool: True if the content is new or differs from the stored one.
+        """
+        new_hash = content_hash(content)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM stories WHERE url = ?", (url,)).fetchone()
+            self._conn.execute(
+                "UPDATE stories SET content = ?, author = ?, status = 'done', etag = ?, last_modified = ?, "
+                "content_hash = ?, error = NULL, fetched_at = ?, checked_at = ? WHERE url = ?",
+                (content, author, etag, last_modified, new_hash, now, now, url))
+        return not row or row['content_hash'] != new_hash
+
+    def mark_unchanged(self, url):
+        """Records a successful revalidation (e.g. a 304 response)."""
+        self._execute("UPDATE stories SET checked_at = ? WHERE url = ?", (time.time(), url))
+
+    def mark_failed(self, url, error):
+        self._execute("UPDATE stories SET status = 'failed', error = ?, checked_at = ? WHERE url = ?",
+                      (str(error), time.time(), url))
+
+    def get_meta(self, key, default=None):
+        row = self._execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else default
+
+    def set_meta(self, key, value):
+        self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def iter_stories(self, batch_size=500):
+        """Yields the finished stories as dicts in discovery order, without loading them all at once."""
+        last_rowid = 0
+        while True:
+            rows = self._execute(
+                "SELECT rowid, * FROM stories WHERE status = 'done' AND rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            last_rowid = rows[-1]['rowid']
+
+    def counts(self):
+        rows = self._execute("SELECT status, COUNT(*) AS n FROM stories GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
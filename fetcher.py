@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HostRateLimiter:
+    def __init__(self, per_host_rate=None):
+        """
+        Spaces out requests to the same host.
+
+        Args:
+            per_host_rate (float | None): Maximum number of requests per second for each host. None means no limit.
+        """
+        self.min_interval = 1.0 / per_host_rate if per_host_rate else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Blocks until a request to the host of `url` is allowed."""
+        if not self.min_interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Fetcher:
+    def __init__(self, max_workers=8, per_host_rate=None, encoding='utf-8', timeout=30, rate_limiter=None):
+        """
+        Fetches pages concurrently with a bounded thread pool and a shared, pooled session.
+
+        Args:
+            max_workers (int): Maximum number of requests in flight.
+            per_host_rate (float | None): Maximum number of requests per second for each host. None means no limit.
+            encoding (str): Encoding used to decode the pages ('utf-8' for oesz, 'gbk' for wpwx).
+            timeout (int): Seconds to wait for each response.
+            rate_limiter (HostRateLimiter | None): Share one limiter between several fetchers. Overrides per_host_rate.
+        """
+        self.max_workers = max_workers
+        self.encoding = encoding
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or HostRateLimiter(per_host_rate)
+
+        ## 连接复用: 每个线程最多占用一个连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url, headers=None):
+        """
+        Fetches a single page and returns the response, decoded with the fetcher's encoding.
+        A 304 Not Modified answer to a conditional request is returned as is.
+        """
+        self.rate_limiter.wait(url)
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        response.encoding = self.encoding
+        return response
+
+    def get(self, url):
+        """Fetches a single page and returns its decoded text."""
+        return self.fetch(url).text
+
+    def fetch_all(self, items, key=lambda item: item):
+        """
+        Fetches every item concurrently and yields the results as soon as each page arrives.
+
+        Args:
+            items (iterable): Items to fetch, e.g. (name, url, category) tuples.
+            key (callable): Returns the url of an item. Defaults to the item itself.
+
+        Yields:
+            tuple: (item, text, error). `text` is None and `error` is the exception when the fetch failed.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.get, key(item)): item for item in items}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    yield item, future.result(), None
+                except requests.exceptions.RequestException as e:
+                    yield item, None, e
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,160 @@
+import re
+
+_XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+
+def strip_xml_declaration(html):
+    """Drops a leading <?xml ...?> declaration: lxml rejects str input with an encoding declaration."""
+    return _XML_DECLARATION.sub('', html) if isinstance(html, str) else html
+
+
+class Bs4Parser:
+    name = 'bs4'
+
+    def __init__(self):
+        """Reference backend, BeautifulSoup with the pure Python 'html.parser'."""
+        from bs4 import BeautifulSoup  # Importing bs4 only when needed
+
+        self._BeautifulSoup = BeautifulSoup
+
+    def parse(self, html):
+        """Parses a page once, the returned tree is passed to the extraction methods."""
+        return self._BeautifulSoup(html, 'html.parser')
+
+    def links(self, tree, href_prefix):
+        """Returns (text, href) of every <a> whose href starts with `href_prefix`, in document order."""
+        return [(a.get_text(), a['href']) for a in tree.find_all('a', href=lambda x: x and x.startswith(href_prefix))]
+
+    def links_after(self, tree, marker, href_suffix):
+        """Returns (text, href) of every <a> whose href ends with `href_suffix` after the <span> whose text is `marker`."""
+        span = tree.find('span', string=marker)
+        if span is None:
+            return []
+        return [(a.get_text(), a['href']) for a in span.find_all_next('a', href=lambda x: x and x.endswith(href_suffix))]
+
+    def text(self, tree, selector):
+        """Returns the text of the first element matching the CSS `selector`, or None."""
+        element = tree.select_one(selector)
+        return element.get_text() if element is not None else None
+
+    def texts(self, tree, selector):
+        """Returns the text of every element matching the CSS `selector`, in document order."""
+        return [element.get_text() for element in tree.select(selector)]
+
+
+class LxmlParser:
+    name = 'lxml'
+
+    def __init__(self):
+        """libxml2 backend. XPath expressions are compiled once and CSS selectors are compiled on first use."""
+        from lxml import etree, html  # Importing lxml only when needed
+
+        self._html = html
+        self._links = etree.XPath('//a[starts-with(@href, $prefix)]')
+        self._links_after = etree.XPath(
+            '(//span[normalize-space(.) = $marker])[1]/following::a'
+            '[substring(@href, string-length(@href) - string-length($suffix) + 1) = $suffix]')
+        self._selectors = {}
+
+    def parse(self, html):
+        return self._html.document_fromstring(strip_xml_declaration(html))
+
+    def _selector(self, selector):
+        compiled = self._selectors.get(selector)
+        if compiled is None:
+            from lxml.cssselect import CSSSelector  # requires the cssselect package
+
+            compiled = self._selectors[selector] = CSSSelector(selector)
+        return compiled
+
+    def links(self, tree, href_prefix):
+        return [(_lxml_text(a), a.get('href')) for a in self._links(tree, prefix=href_prefix)]
+
+    def links_after(self, tree, marker, href_suffix):
+        return [(_lxml_text(a), a.get('href')) for a in self._links_after(tree, marker=marker, suffix=href_suffix)]
+
+    def text(self, tree, selector):
+        elements = self._selector(selector)(tree)
+        return _lxml_text(elements[0]) if elements else None
+
+    def texts(self, tree, selector):
+        return [_lxml_text(element) for element in self._selector(selector)(tree)]
+
+
+def _lxml_text(element):
+    ## bs4 skips the contents of <script>/<style>, do the same
+    if element.tag in ('script', 'style'):
+        return ''
+    parts = [element.text or '']
+    for child in element:
+        if isinstance(child.tag, str):
+            parts.append(_lxml_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+class SelectolaxParser:
+    name = 'selectolax'
+
+    def __init__(self):
+        """Lexbor backend, the fastest option when selectolax is installed."""
+        from selectolax.lexbor import LexborHTMLParser  # Importing selectolax only when needed
+
+        self._parser = LexborHTMLParser
+
+    def parse(self, html):
+        return self._parser(html)
+
+    def links(self, tree, href_prefix):
+        return [(_selectolax_text(a), a.attributes['href'])
+                for a in tree.css('a[href]') if a.attributes['href'] and a.attributes['href'].startswith(href_prefix)]
+
+    def links_after(self, tree, marker, href_suffix):
+        links = []
+        found = False
+        for node in tree.css('span, a[href]'):
+            if not found:
+                found = node.tag == 'span' and node.text().strip() == marker
+            elif node.tag == 'a' and node.attributes['href'] and node.attributes['href'].endswith(href_suffix):
+                links.append((_selectolax_text(node), node.attributes['href']))
+        return links
+
+    def text(self, tree, selector):
+        element = tree.css_first(selector)
+        return _selectolax_text(element) if element is not None else None
+
+    def texts(self, tree, selector):
+        return [_selectolax_text(element) for element in tree.css(selector)]
+
+
+def _selectolax_text(node):
+    ## bs4 skips the contents of <script>/<style>, do the same
+    if node.tag in ('script', 'style'):
+        return ''
+    parts = []
+    child = node.child
+    while child is not None:
+        if child.tag == '-text':
+            parts.append(child.text_content or '')
+        elif not child.tag.startswith('-'):  # skip comments and doctype
+            parts.append(_selectolax_text(child))
+        child = child.next
+    return ''.join(parts)
+
+
+PARSERS = {'bs4': Bs4Parser, 'lxml': LxmlParser, 'selectolax': SelectolaxParser}
+_instances = {}
+
+
+def get_parser(name='bs4'):
+    """
+    Returns the shared parser instance of a backend.
+
+    Args:
+        name (str): 'bs4', 'lxml' or 'selectolax'.
+    """
+    if name not in PARSERS:
+        raise ValueError(f"Parser '{name}' not supported. Supported parsers: {list(PARSERS)}")
+    if name not in _instances:
+        _instances[name] = PARSERS[name]()
+    return _instances[name]
@@ -0,0 +1,330 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+if __name__ == '__main__': # run as a script, story_dedup needs text_tokens from GPT_crawler
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'GPT_crawler'))
+from crawl_state import CrawlState
+from fetcher import Fetcher, HostRateLimiter
+from page_parser import get_parser
+from story_dedup import StoryDeduper
+from story_sink import StorySink
+
+MAX_WORKERS = 16     # 每个站点同时进行的内容请求数
+PER_HOST_RATE = 20   # 每个域名每秒最多请求数, 所有站点共用
+
+_DONE = object()  # 工作队列的结束标记
+
+
+class SiteProfile:
+    PAGINATION_RULES = ['next_link', 'numeric']
+    BODY_RULES = ['selector', 'after_title']
+
+    def __init__(self, config):
+        """
+        Everything that differs between two list-page story sites: base urls of the categories, ignored
+        titles, encoding, story-link prefix, pagination rule, body rule and output columns.
+        See site_profiles/*.toml for the format.
+
+        Args:
+            config (dict): The parsed profile.
+        """
+        self.name = config['name']
+        self.encoding = config.get('encoding', 'utf-8')
+        self.parser = config.get('parser', 'lxml')
+        self.ignore = set(config.get('ignore', []))
+        self.categories = config['categories']
+        self.link_prefix = config.get('link_prefix', '/{suffix}/')
+        self.category_link_prefixes = config.get('category_link_prefixes', {})
+        self.pagination = config.get('pagination', {})
+        self.recent = config.get('recent')
+        self.body = config['body']
+        output = config.get('output', {})
+        self.output = output.get('path', f'stories_{self.name}.csv')
+        self.state = output.get('state', f'crawl_state_{self.name}.sqlite')
+        self.columns = output.get('columns', {'title': 'title', 'url': 'url', 'category': 'category', 'content': 'content'})
+
+        if self.pagination.get('rule', 'next_link') not in self.PAGINATION_RULES:
+            raise ValueError(f"Pagination rule '{self.pagination['rule']}' not supported. Supported rules: {self.PAGINATION_RULES}")
+        if self.body.get('rule', 'selector') not in self.BODY_RULES:
+            raise ValueError(f"Body rule '{self.body['rule']}' not supported. Supported rules: {self.BODY_RULES}")
+
+    def link_prefixes(self, category):
+        """Returns the href prefixes of the story links of a category."""
+        if category in self.category_link_prefixes:
+            return self.category_link_prefixes[category]
+        suffix = self.categories[category].strip('/').split('/')[-1]
+        return [self.link_prefix.format(suffix=suffix)]
+
+    def parse_list_page(self, html, page_url, category, recent=False):
+        """
+        Extracts the story links and the pagination links from a list page.
+
+        Returns:
+            tuple: ([(title, url)], {page_number: url}). The dict maps "next" to the next page for the
+            'next_link' rule and page numbers to urls for the 'numeric' rule.
+        """
+        parser = get_parser(self.parser)
+        tree = parser.parse(html)
+        numeric = self.pagination.get('rule', 'next_link') == 'numeric'
+        prefixes = self.link_prefixes(category)
+
+        stories = []
+        pages = {}
+        for prefix in prefixes:
+            in_index = False
+            for text, href in parser.links(tree, prefix):
+                text = text.strip()
+                if text in self.ignore:
+                    continue
+                if numeric and text.isdigit():
+                    in_index = True
+                    pages.setdefault(int(text), urljoin(page_url, href))
+                    continue
+                ## 页码之后的链接不属于本分类
+                if in_index and self.pagination.get('stop_after_pagination'):
+                    break
+                stories.append((text, urljoin(page_url, href)))
+
+        if not numeric:
+            for text, href in parser.links(tree, self.pagination.get('link_prefix', '')):
+                if text.strip() == self.pagination.get('text', '下一页'):
+                    pages['next'] = urljoin(page_url, href)
+                    break
+
+        if recent and self.recent:
+            for text, href in parser.links_after(tree, self.recent['marker'], self.recent.get('href_suffix', '.html')):
+                if any(href.startswith(prefix) for prefix in prefixes):
+                    stories.append((text.strip(), urljoin(page_url, href)))
+        return stories, pages
+
+    def parse_content(self, html, title):
+        """Extracts the story body from a story page, or None if it cannot be found."""
+        parser = get_parser(self.parser)
+        tree = parser.parse(html)
+        if self.body.get('rule', 'selector') == 'selector':
+            content = parser.text(tree, self.body['selector'])
+        else:
+            ## 正文是包含标题的元素的下一个元素
+            texts = parser.texts(tree, self.body['selector'])
+            content = None
+            for idx, text in enumerate(texts[:-1]):
+                if title in text.strip():
+                    content = texts[idx + 1]
+                    break
+        if content is None:
+            return None
+        if self.body.get('rstrip'):
+            content = content.rstrip()
+        for chars in self.body.get('remove', []):
+            content = content.replace(chars, '')
+        return content
+
+
+def load_profile(path):
+    with open(path, 'rb') as f:
+        return SiteProfile(tomllib.load(f))
+
+
+class StoryPipeline:
+    def __init__(self, profile, fetcher, state, sink, max_workers=MAX_WORKERS, dedup=None):
+        """
+        Overlaps list-page discovery with story fetching for one site.
+
+        Every category is paginated in its own thread. Each discovered story url goes straight onto a work
+        queue that `max_workers` content workers drain while pagination keeps running. Finished stories are
+        stored in `state` (a CrawlState); stories fetched in an earlier run are revalidated with a
+        conditional GET and only re-parsed when they changed. Every story is written to `sink` as
+        soon as it completes, unless `dedup` (a StoryDeduper) finds it to be a near-duplicate of a story
+        already written. Stories finished by earlier runs that this run did not write are written at the end.
+        """
+        self.profile = profile
+        self.fetcher = fetcher
+        self.state = state
+        self.sink = sink
+        self.max_workers = max_workers
+        self.dedup = dedup
+        self.work = queue.Queue()
+        self.n_processed = 0
+        self.stats = {}
+        self._seen = set()   # 已经加入队列的故事标题
+        self._written = set()  # 本次已写入 (或判定为重复) 的故事 url
+        self._lock = threading.Lock()
+        self._start = None
+
+    def submit(self, name, url, category):
+        """Queues a story unless a story with the same title was already queued."""
+        with self._lock:
+            if name in self.profile.ignore or name in self._seen:
+                return
+            self._seen.add(name)
+            self.stats[category]['discovered'] += 1
+        self.state.add(url, name, category)
+        self.work.put((name, url, category))
+
+    def walk_category(self, category, url):
+        """Walks every list page of a category and queues the stories it finds."""
+        max_pages = self.profile.pagination.get('max_pages')
+        page_number = 1
+        page_url = url
+        pages = {}
+        while page_url:
+            stories, new_pages = self.profile.parse_list_page(self.fetcher.get(page_url), page_url, category,
+                                                              recent=page_number == 1)
+            for name, story_url in stories:
+                self.submit(name, story_url, category)
+
+            ## 当下一页为空时, 退出循环
+            page_number += 1
+            if max_pages and page_number > max_pages:
+                break
+            pages.update(new_pages)
+            page_url = pages.pop('next', None) or pages.get(page_number)
+        self.stats[category]['pages'] = page_number - 1
+
+    def _walk(self, category, url):
+        try:
+            self.walk_category(category, url)
+        except Exception as e:
+            print(f"[{self.profile.name}] Category {category} stopped early: {e}")
+
+    def _content_worker(self):
+        while True:
+            item = self.work.get()
+            if item is _DONE:
+                return
+            name, url, category = item
+            outcome = 'unchanged'
+            try:
+                response = self.fetcher.fetch(url, headers=self.state.conditional_headers(url))
+                if response.status_code == 304:
+                    self.state.mark_unchanged(url)
+                    content = self.state.get(url)['content']
+                else:
+                    content = self.profile.parse_content(response.text, name)
+                    if content is None:
+                        raise ValueError("Story body not found")
+                    if self.state.mark_done(url, content,
+                                            etag=response.headers.get('ETag'),
+                                            last_modified=response.headers.get('Last-Modified')):
+                        outcome = 'fetched'
+                original = self.write(name, url, category, content)
+                if original is not None:
+                    print(f"[{self.profile.name}] {name} is a near-duplicate of {original}, not saved")
+                    outcome = 'duplicate'
+            except Exception as e:
+                print(f"[{self.profile.name}] Failed to fetch {name}: {e}")
+                ## 重新验证失败时保留之前抓取的内容
+                if not self.state.is_done(url):
+                    self.state.mark_failed(url, e)
+                outcome = 'failed'
+            elapsed = time.perf_counter() - self._start
+            with self._lock:
+                stats = self.stats[category]
+                if stats['first_story'] is None:
+                    stats['first_story'] = elapsed
+                stats['finished'] = elapsed
+                stats[outcome] += 1
+                self.n_processed += 1
+                if self.n_processed % 20 == 0:
+                    print(f"[{self.profile.name}] {self.n_processed} Stories processed")
+
+    def write(self, name, url, category, content):
+        """Writes a story to the sink unless it is a near-duplicate. Returns the url of the story it duplicates, or None."""
+        with self._lock:
+            self._written.add(url)
+        original = self.dedup.add(url, content) if self.dedup is not None else None
+        if original is None:
+            columns = self.profile.columns
+            self.sink.write({columns['title']: name, columns['url']: url,
+                             columns['category']: category, columns['content']: content})
+        return original
+
+    def write_remaining(self):
+        """Writes the stories finished by earlier runs that this run did not write, e.g. stories no longer listed."""
+        count = 0
+        for story in self.state.iter_stories():
+            if story['url'] not in self._written:
+                count += self.write(story['title'], story['url'], story['category'], story['content']) is None
+        if count:
+            print(f"[{self.profile.name}] {count} stories from earlier runs written")
+
+    def run(self):
+        """Crawls all categories of the profile. Stories left unfinished by an earlier run are queued first."""
+        categories = self.profile.categories
+        self._start = time.perf_counter()
+        for category in categories:
+            self.stats[category] = {'pages': 0, 'discovered': 0, 'fetched': 0, 'unchanged': 0, 'duplicate': 0,
+                                    'failed': 0, 'first_story': None, 'finished': None}
+        for url, (name, category) in self.state.pending().items():
+            if category in self.stats:
+                self.submit(name, url, category)
+
+        workers = [threading.Thread(target=self._content_worker, daemon=True) for _ in range(self.max_workers)]
+        for worker in workers:
+            worker.start()
+        with ThreadPoolExecutor(max_workers=len(categories)) as walkers:
+            for category, url in categories.items():
+                walkers.submit(self._walk, category, url)
+        for _ in workers:
+            self.work.put(_DONE)
+        for worker in workers:
+            worker.join()
+        ## 输出文件每次重写, 补上本次没有写入的已完成故事
+        self.write_remaining()
+
+    def report(self):
+        """Prints time-to-first-story and wall-clock per category."""
+        for category, stats in self.stats.items():
+            first = f"{stats['first_story']:.1f}s" if stats['first_story'] is not None else "-"
+            total = f"{stats['finished']:.1f}s" if stats['finished'] is not None else "-"
+            print(f"[{self.profile.name}] {category}: {stats['pages']} pages, {stats['discovered']} stories, "
+                  f"{stats['fetched']} new or changed, {stats['unchanged']} unchanged, {stats['duplicate']} duplicates, "
+                  f"{stats['failed']} failed, "
+                  f"first story {first}, total {total}")
+
+
+def crawl_site(profile, rate_limiter=None, max_workers=MAX_WORKERS, dedup=None):
+    """Crawls one site and streams its stories to the profile's output file, skipping near-duplicates if `dedup` is given."""
+    print(f"[{profile.name}] Crawling start.")
+    ## 分页请求和内容请求共用一个连接池, 每个故事完成后立即写入文件
+    with CrawlState(profile.state) as state, \
+            StorySink(profile.output, list(profile.columns.values())) as sink, \
+            Fetcher(max_workers=max_workers + len(profile.categories), encoding=profile.encoding,
+                    rate_limiter=rate_limiter or HostRateLimiter(PER_HOST_RATE)) as fetcher:
+        pipeline = StoryPipeline(profile, fetcher, state, sink, max_workers=max_workers, dedup=dedup)
+        pipeline.run()
+        print(f"[{profile.name}] Text crawling complete. {sink.count} stories saved to {profile.output}")
+        pipeline.report()
+
+
+def crawl_sites(profiles, max_workers=MAX_WORKERS, per_host_rate=PER_HOST_RATE, dedup=False):
+    """
+    Crawls several sites at once. All sites share one per-host rate limiter, so two profiles
+    pointing at the same host never exceed `per_host_rate` together. With `dedup`, all sites also share
+    one StoryDeduper, so a story is saved once even when several sites or categories carry it.
+    """
+    rate_limiter = HostRateLimiter(per_host_rate)
+    deduper = StoryDeduper() if dedup else None
+    with ThreadPoolExecutor(max_workers=len(profiles)) as executor:
+        futures = [executor.submit(crawl_site, profile, rate_limiter, max_workers, deduper) for profile in profiles]
+        for future in futures:
+            future.result()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl story sites described by site profiles')
+    parser.add_argument('profiles', nargs='+', help='Site profile files, e.g. site_profiles/oesz.toml.')
+    parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS, help='Concurrent content requests per site.')
+    parser.add_argument('-r', '--rate', type=float, default=PER_HOST_RATE, help='Maximum requests per second per host.')
+    parser.add_argument('--dedup', action='store_true', help='Do not save near-duplicate stories (MinHash/LSH).')
+    args = parser.parse_args()
+
+    crawl_sites([load_profile(path) for path in args.profiles], max_workers=args.workers, per_host_rate=args.rate,
+                dedup=args.dedup)
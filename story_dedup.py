@@ -0,0 +1,238 @@
+import argparse
+import os
+import sys
+import threading
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+if __name__ == '__main__': # run as a script, text_tokens and Embedder live in GPT_crawler
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'GPT_crawler'))
+from text_tokens import words
+
+NUM_PERM = 128
+BANDS = 32              # 32 bands of 4 rows: pairs with Jaccard 0.5 collide in some band with ~87% probability
+CANDIDATE_BANDS = 64    # 64 bands of 2 rows for embedding confirmation: pairs with Jaccard 0.2 collide with ~93% probability
+CANDIDATE_THRESHOLD = 0.2  # estimated Jaccard similarity from which a pair is checked with embeddings
+SHINGLE_SIZE = 5        # tokens per shingle; a token is a word, or a single CJK character
+THRESHOLD = 0.5         # estimated Jaccard similarity above which two stories are duplicates
+COSINE_THRESHOLD = 0.9  # embedding similarity that confirms a candidate pair
+
+
+class StoryDeduper:
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, shingle_size=SHINGLE_SIZE, threshold=THRESHOLD, seed=1):
+        """
+        Finds near-duplicate stories with shingles, MinHash signatures and LSH banding.
+
+        Every story is reduced to `num_perm` MinHash values. The signature is cut into `bands` bands, and
+        only stories sharing a whole band with an earlier story are compared, so adding n stories costs
+        about O(n) instead of comparing all n^2 / 2 pairs. A candidate is a duplicate when the share of
+        equal MinHash values (the Jaccard estimate) reaches `threshold`. Duplicates are grouped into
+        clusters with union-find. Thread-safe.
+
+        Args:
+            num_perm (int): Length of the MinHash signature.
+            bands (int): Number of LSH bands, must divide num_perm. More bands find less similar pairs.
+            shingle_size (int): Tokens (words, or CJK characters) per shingle.
+            threshold (float): Estimated Jaccard similarity from which a candidate pair is a duplicate.
+            seed (int): Seed of the hash permutations.
+        """
+        if num_perm % bands:
+            raise ValueError(f"bands ({bands}) must divide num_perm ({num_perm}).")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        ## multiply-shift hashes h -> (a * h + b) mod 2^64 >> 32 with odd a stand in for random permutations
+        self._a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self.keys = []
+        self.signatures = []
+        self.comparisons = 0
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+        self._parent = []
+        self._lock = threading.Lock()
+
+    def shingles(self, text):
+        """
+        Hashes of the distinct shingles (runs of shingle_size tokens) of the lower-cased text. Tokens are
+        text_tokens.words, so whitespace and punctuation do not make stories differ.
+        """
+        tokens = [zlib.crc32(token.encode('utf-8')) for token in words(text)]
+        tokens += [0] * max(0, self.shingle_size - len(tokens))
+        codes = np.array(tokens, dtype=np.uint64)
+        ## polynomial hash of every window of shingle_size tokens
+        hashes = np.zeros(len(codes) - self.shingle_size + 1, dtype=np.uint64)
+        for offset in range(self.shingle_size):
+            hashes = hashes * np.uint64(1000003) + codes[offset:offset + len(hashes)]
+        return np.unique(hashes)
+
+    def signature(self, text):
+        """MinHash signature of a text."""
+        shingles = self.shingles(text)
+        signature = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(shingles), 4096):
+            block = shingles[start:start + 4096, None]
+            signature = np.minimum(signature, ((block * self._a + self._b) >> np.uint64(32)).min(axis=0))
+        return signature
+
+    def candidates(self, signature):
+        """Indices of the stories that share at least one band with the signature."""
+        found = set()
+        for band in range(self.bands):
+            found.update(self._buckets[band].get(signature[band * self.rows:(band + 1) * self.rows].tobytes(), ()))
+        return found
+
+    def similarity(self, i, j):
+        """Estimated Jaccard similarity of two added stories."""
+        return float(np.mean(self.signatures[i] == self.signatures[j]))
+
+    def add(self, key, text, confirm=None, candidate_threshold=None):
+        """
+        Adds a story and returns the key of an earlier near-duplicate, or None if the story is new.
+
+        Args:
+            key: Identifier of the story (url, title, row, ...).
+            text (str): The story text.
+            confirm (callable | None): Optional check `confirm(key, other_key) -> bool` of every pair that
+                passes the Jaccard test, e.g. an embedding similarity. Only confirmed pairs are duplicates.
+                It runs outside the lock, so slow checks do not hold up other threads.
+            candidate_threshold (float | None): Jaccard threshold used instead of `threshold` when `confirm`
+                is given, so reworded retellings with a lower Jaccard similarity can still be confirmed.
+                Such pairs only become candidates with enough bands, see CANDIDATE_BANDS.
+        """
+        signature = self.signature(text)
+        threshold = candidate_threshold if confirm is not None and candidate_threshold is not None else self.threshold
+        with self._lock:
+            index = len(self.keys)
+            self.keys.append(key)
+            self.signatures.append(signature)
+            self._parent.append(index)
+            candidates = sorted(self.candidates(signature))
+            self.comparisons += len(candidates)
+            similar = [other for other in candidates if self.similarity(index, other) >= threshold]
+            for band in range(self.bands):
+                self._buckets[band][signature[band * self.rows:(band + 1) * self.rows].tobytes()].append(index)
+        ## the confirmation may call an embedding API, keep it out of the lock
+        if confirm is not None:
+            similar = [other for other in similar if confirm(key, self.keys[other])]
+        with self._lock:
+            for other in similar:
+                self._union(other, index)
+        return self.keys[similar[0]] if similar else None
+
+    def _find(self, i):
+        while self._parent[i] != i:
+            self._parent[i] = self._parent[self._parent[i]]
+            i = self._parent[i]
+        return i
+
+    def _union(self, i, j):
+        root_i, root_j = self._find(i), self._find(j)
+        if root_i != root_j:
+            ## the earliest story stays the root, so it is kept as the original of its cluster
+            self._parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    def clusters(self):
+        """Groups of keys of near-duplicate stories (clusters of one story are left out), earliest key first."""
+        with self._lock:
+            groups = defaultdict(list)
+            for i, key in enumerate(self.keys):
+                groups[self._find(i)].append(key)
+        return [keys for keys in groups.values() if len(keys) > 1]
+
+
+def embedding_confirmation(texts, embedder, cosine_threshold=COSINE_THRESHOLD):
+    """
+    Returns a `confirm` function for StoryDeduper.add that accepts a pair when the cosine similarity of
+    the two texts' embeddings reaches `cosine_threshold`. `texts` maps keys to texts. Only the texts of
+    candidate pairs are embedded, each once: the embeddings are cached by key.
+    """
+    embeddings = {}
+
+    def confirm(key, other_key):
+        missing = [k for k in dict.fromkeys((key, other_key)) if k not in embeddings]
+        if missing:
+            vectors = np.asarray(embedder.get_embedding([texts[k] for k in missing]), dtype="f")
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            embeddings.update(zip(missing, vectors))
+        return float(embeddings[key] @ embeddings[other_key]) >= cosine_threshold
+    return confirm
+
+
+def find_duplicates(records, text_column='content', embedder=None, threshold=THRESHOLD,
+                    candidate_threshold=CANDIDATE_THRESHOLD, cosine_threshold=COSINE_THRESHOLD, **kwargs):
+    """
+    Clusters near-duplicate stories of a combined corpus.
+
+    Args:
+        records (list of dict): Stories, e.g. the rows of several stories_*.csv files.
+        text_column (str): Key of the story text.
+        embedder (Embedder | None): If given, candidate pairs from Jaccard `candidate_threshold` on are
+            confirmed by embedding similarity instead of the Jaccard threshold alone. The deduper then
+            uses CANDIDATE_BANDS bands unless `bands` is given, so those pairs become candidates.
+        **kwargs: Passed on to StoryDeduper.
+
+    Returns:
+        tuple: (clusters, deduper). Clusters are lists of record indices, earliest record first.
+    """
+    if embedder is not None:
+        kwargs.setdefault('bands', CANDIDATE_BANDS)
+    deduper = StoryDeduper(threshold=threshold, **kwargs)
+    confirm = None
+    if embedder is not None:
+        confirm = embedding_confirmation({i: str(record[text_column]) for i, record in enumerate(records)},
+                                         embedder, cosine_threshold)
+    for i, record in enumerate(records):
+        deduper.add(i, record[text_column], confirm=confirm, candidate_threshold=candidate_threshold)
+    return deduper.clusters(), deduper
+
+
+def load_stories(paths, text_column='content'):
+    """Reads story CSV files into one list of records with a 'source' key. Rows without text are dropped."""
+    import pandas as pd
+
+    records = []
+    for path in paths:
+        frame = pd.read_csv(path, on_bad_lines='skip', engine='python')
+        if text_column not in frame:
+            print(f"{path} has no '{text_column}' column, skipped")
+            continue
+        frame = frame[frame[text_column].notna()].fillna('')
+        for record in frame.to_dict('records'):
+            record['source'] = path
+            records.append(record)
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find near-duplicate stories across crawled CSV files')
+    parser.add_argument('csv', nargs='*', help='Story CSV files, e.g. GPT_crawler/stories_*.csv.')
+    parser.add_argument('-o', '--output', default=None, help='Write the clusters to this CSV file.')
+    parser.add_argument('-t', '--threshold', type=float, default=THRESHOLD, help='Estimated Jaccard similarity of duplicates.')
+    parser.add_argument('--embed', default=None, help="Confirm candidates with embeddings of this API ('jina' or 'openai').")
+    args = parser.parse_args()
+
+    stories = load_stories(args.csv)
+    embedder = None
+    if args.embed:
+        from dotenv import load_dotenv
+        from Embedder import Embedder
+        load_dotenv()
+        embedder = Embedder(use_api=args.embed)
+    clusters, _ = find_duplicates(stories, embedder=embedder, threshold=args.threshold)
+    print(f"{len(stories)} stories, {len(clusters)} duplicate clusters, "
+          f"{sum(len(cluster) - 1 for cluster in clusters)} duplicates")
+    rows = []
+    for cluster_id, cluster in enumerate(clusters):
+        for i in cluster:
+            story = stories[i]
+            print(f"[{cluster_id}] {story['source']}: {story.get('title', '')}")
+            rows.append({'cluster': cluster_id, 'source': story['source'], 'title': story.get('title', ''),
+                         'url': story.get('url', ''), 'original': i == cluster[0]})
+    if args.output:
+        import pandas as pd
+        pd.DataFrame(rows, columns=['cluster', 'source', 'title', 'url', 'original']).to_csv(args.output, index=False)
@@ -0,0 +1,93 @@
+import csv
+import json
+import os
+import threading
+
+
+class StorySink:
+    def __init__(self, path, fieldnames, format=None, flush_every=100, append=False):
+        """
+        Streams finished stories to disk as they complete instead of holding them all in a DataFrame.
+
+        Rows are buffered and written every `flush_every` rows, so memory stays bounded by the buffer size.
+        Writes are thread-safe, content workers can share one sink.
+
+        Args:
+            path (str): Output file.
+            fieldnames (list): Column names, in output order.
+            format (str | None): 'csv', 'jsonl' or 'parquet'. Inferred from the file extension if None.
+            flush_every (int): Number of buffered rows that triggers a write.
+            append (bool): Append to an existing file instead of overwriting it (not supported for parquet).
+        """
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.format = format or os.path.splitext(path)[1].lstrip('.').lower()
+        self.flush_every = flush_every
+        self.count = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+
+        if self.format == 'csv':
+            write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+            self._file = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+            if write_header:
+                self._writer.writeheader()
+        elif self.format == 'jsonl':
+            self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+        elif self.format == 'parquet':
+            if append:
+                raise ValueError("Appending to a parquet file is not supported.")
+            import pyarrow as pa  # Importing pyarrow only when needed
+            import pyarrow.parquet as pq
+
+            self._schema = pa.schema([(name, pa.string()) for name in self.fieldnames])
+            self._writer = pq.ParquetWriter(path, self._schema)
+        else:
+            raise ValueError(f"Output format '{self.format}' not supported. Supported formats: ['csv', 'jsonl', 'parquet']")
+
+    def write(self, row):
+        """Buffers one story, given as a dict or as a sequence in `fieldnames` order."""
+        if not isinstance(row, dict):
+            row = dict(zip(self.fieldnames, row))
+        with self._lock:
+            self._buffer.append(row)
+            self.count += 1
+            if len(self._buffer) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        if self.format == 'csv':
+            self._writer.writerows(self._buffer)
+            self._file.flush()
+        elif self.format == 'jsonl':
+            self._file.writelines(json.dumps({name: row.get(name) for name in self.fieldnames}, ensure_ascii=False) + '\n'
+                                  for row in self._buffer)
+            self._file.flush()
+        else:
+            import pyarrow as pa
+
+            columns = {name: [None if row.get(name) is None else str(row.get(name)) for row in self._buffer]
+                       for name in self.fieldnames}
+            self._writer.write_table(pa.Table.from_pydict(columns, schema=self._schema))
+        self._buffer = []
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self.format == 'parquet':
+                self._writer.close()
+            else:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,92 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GPT_CRAWLER = os.path.join(ROOT, 'GPT_crawler')
+
+## shared crawler modules live in the repo root, the GPT crawler imports its modules flatly
+for path in (ROOT, GPT_CRAWLER):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class FakeAPI:
+    def __init__(self, base):
+        """
+        State of the fake r.jina.ai and OpenAI server. `requests` logs (kind, path, client port) of every request,
+        `failures[kind]` lists the error statuses returned before the next success, `delay[kind]` slows a kind down.
+        """
+        self.base = base
+        self.requests = []
+        self.failures = {'reader': [], 'completions': [], 'page': []}
+        self.delay = {'reader': 0.0, 'completions': 0.0, 'page': 0.0}
+        self.lock = threading.Lock()
+
+    def count(self, kind):
+        return sum(1 for request in self.requests if request[0] == kind)
+
+    def ports(self, kind):
+        """Client ports seen for a kind of request, one per connection."""
+        return {port for request_kind, _, port in self.requests if request_kind == kind}
+
+
+def _completion(content):
+    """A chat completion in the get_content response format, the story is the user message."""
+    story = {"content": {"title": "", "author": "", "content": content}, "next_page": ""}
+    return {"id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": json.dumps(story)}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}
+
+
+@pytest.fixture
+def fake_api():
+    """
+    Local stand-in for r.jina.ai (GET /<url> returns "Snapshot of <url>"), the pages themselves (any other GET) and the OpenAI chat completions endpoint
+    (POST /v1/chat/completions echoes the user message as the story content), keeping connections alive.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def respond(self, kind, status, body):
+            with api.lock:
+                api.requests.append((kind, self.path, self.client_address[1]))
+                failure = api.failures[kind].pop(0) if api.failures[kind] else None
+            time.sleep(api.delay[kind])
+            if failure is not None:
+                status, body = failure, json.dumps({"error": {"message": "busy", "type": "server_error"}}).encode()
+            self.send_response(status)
+            if failure is not None:
+                self.send_header('Retry-After', '0')
+            self.send_header('Content-Type', 'application/json' if kind == 'completions' else 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith('/http'):
+                self.respond('reader', 200, f"Snapshot of {self.path[1:]}".encode())
+            else:
+                self.respond('page', 200, b"<html><body>the page itself</body></html>")
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            content = request['messages'][-1]['content'][0]['text']
+            self.respond('completions', 200, json.dumps(_completion(content)).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    api = FakeAPI(f'http://127.0.0.1:{server.server_port}')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield api
+    server.shutdown()
+    server.server_close()
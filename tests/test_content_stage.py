@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+from openai import AsyncOpenAI
+
+import GPT_crawler as crawler
+import GPT_crawler_utils
+from conftest import GPT_CRAWLER
+from rate_limit import AdaptiveBackoff
+
+CONCURRENCY = 4
+
+
+@pytest.fixture
+def api(fake_api, monkeypatch):
+    """Points the snapshot and completion calls at the fake server, without caches."""
+    monkeypatch.chdir(GPT_CRAWLER) # the prompts are loaded relative to the crawler directory
+    monkeypatch.setenv('JINAAI_API_KEY', 'test')
+    monkeypatch.setattr(GPT_crawler_utils, 'JINA_READER_URL', f'{fake_api.base}/')
+    monkeypatch.setattr(GPT_crawler_utils, 'async_client', AsyncOpenAI(base_url=f'{fake_api.base}/v1', api_key='test', max_retries=0))
+    monkeypatch.setattr(GPT_crawler_utils, 'snapshot_backend', 'jina')
+    monkeypatch.setattr(GPT_crawler_utils, 'snapshot_cache', None)
+    monkeypatch.setattr(GPT_crawler_utils, 'completion_cache', None)
+    monkeypatch.setattr(GPT_crawler_utils, 'llm_backoff', AdaptiveBackoff(initial_delay=0.01, max_delay=0.1))
+    return fake_api
+
+
+def stories(n):
+    return {f"Story {i}": (f"https://site.test/story-{i}/", "fairy tales") for i in range(n)}
+
+
+def test_stories_are_extracted_concurrently(api):
+    result = crawler.get_content(stories(12), concurrency=CONCURRENCY)
+    assert len(result) == 12
+    for title, (url, _) in stories(12).items():
+        assert result[title]['content'] == f"Snapshot of {url}"
+    assert api.count('reader') == 12 and api.count('completions') == 12
+
+
+def test_identical_requests_in_flight_are_sent_once(api):
+    api.delay['reader'] = 0.2
+    barrier = threading.Barrier(8)
+    results = []
+
+    def snapshot():
+        barrier.wait()
+        results.append(GPT_crawler_utils.get_text_snapshot("https://site.test/story-0/", use_cache=False))
+
+    threads = [threading.Thread(target=snapshot) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["Snapshot of https://site.test/story-0/"] * 8
+    assert api.count('reader') == 1
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_completion_errors_are_retried_with_the_shared_backoff(api, status):
+    api.failures['completions'] = [status] * 3
+    result = crawler.get_content(stories(6), concurrency=CONCURRENCY)
+    assert all(story['content'] for story in result.values())
+    assert api.count('completions') == 6 + 3
+    assert GPT_crawler_utils.llm_backoff.rate_limits == 3
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_snapshot_errors_are_retried(api, status):
+    api.failures['reader'] = [status] * 2
+    snapshot = GPT_crawler_utils.get_text_snapshot("https://site.test/story-0/", use_cache=False)
+    assert snapshot == "Snapshot of https://site.test/story-0/"
+    assert api.count('reader') == 3
+
+
+def test_connections_are_reused(api):
+    for i in range(10):
+        GPT_crawler_utils.get_text_snapshot(f"https://site.test/story-{i}/", use_cache=False)
+    assert len(api.ports('reader')) == 1
+
+    crawler.get_content(stories(16), concurrency=CONCURRENCY)
+    assert api.count('completions') == 16
+    assert len(api.ports('completions')) <= CONCURRENCY
+    assert len(api.ports('reader')) <= CONCURRENCY + 1
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import types
+
+import content_template
+import GPT_crawler as crawler
+
+PAGES = content_template._synthetic_pages(20)
+URLS = {f"https://site.test/story-{i}/": page for i, page in enumerate(PAGES)}
+
+
+def completion(content, author):
+    message = types.SimpleNamespace(content=json.dumps({"content": {"content": content, "author": author}}))
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+def fake_site(monkeypatch, calls):
+    async def get_content_async(url, backoff_state):
+        calls.append(url)
+        _, content, author = URLS[url]
+        return completion(content, author)
+    monkeypatch.setattr(crawler.GPT_crawler, 'get_content_async', get_content_async)
+    monkeypatch.setattr(crawler.Fetcher, 'get', lambda self, url: URLS[url][0])
+
+
+def test_learned_template_reproduces_the_llm():
+    template = content_template.learn_template(PAGES[:5])
+    assert template is not None
+    for html, content, author in PAGES[5:]:
+        extracted, extracted_author, confidence = template.extract(html)
+        assert content_template.overlap(extracted, content) == 1.0
+        assert extracted_author == author and confidence >= content_template.MIN_CONFIDENCE
+
+
+def test_templates_replace_llm_calls(monkeypatch):
+    calls = []
+    fake_site(monkeypatch, calls)
+    stories = crawler.get_content({f"t{i}": (url, "c") for i, url in enumerate(URLS)}, use_templates=True)
+    assert len(stories) == 20 and all(story['content'] for story in stories.values())
+    assert len(calls) == content_template.TRAIN_SAMPLES + content_template.HOLDOUT_SAMPLES
+
+
+def test_template_is_learned_from_pages_with_an_xml_declaration():
+    declared = [('<?xml version="1.0" encoding="utf-8"?>\n' + html, content, author) for html, content, author in PAGES[:6]]
+    template = content_template.learn_template(declared[:5])
+    assert template is not None
+    extracted, _, confidence = template.extract(declared[5][0])
+    assert content_template.overlap(extracted, declared[5][1]) == 1.0 and confidence >= content_template.MIN_CONFIDENCE
+
+
+def test_failed_learning_falls_back_to_the_llm(monkeypatch):
+    calls = []
+    fake_site(monkeypatch, calls)
+    ## a script-rendered site: the html holds an empty app shell, never the story the LLM read
+    shell = '<html><body><div id="app"></div><script src="/app.js"></script></body></html>'
+    monkeypatch.setattr(crawler.Fetcher, 'get', lambda self, url: "  \n" if url.endswith("-0/") else shell)
+    stories = crawler.get_content({f"t{i}": (url, "c") for i, url in enumerate(URLS)}, use_templates=True)
+    assert len(stories) == 20 and all(story['content'] for story in stories.values())
+    assert len(calls) == 20
@@ -0,0 +1,142 @@
+import subprocess
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from conftest import GPT_CRAWLER
+from Embedder import Embedder, _make_batches, _weighted_mean_pooling
+from text_tokens import estimate_tokens
+
+
+def stub_backend(embedder, calls):
+    """Replaces the Jina call with a stub that embeds a text as [its number, its length] and records the batches."""
+    def embed(texts, dim=1024):
+        calls.append(list(texts))
+        return np.array([[float(text.split()[1]), len(text)] for text in texts], dtype="f")
+    embedder._get_jina_embedding = embed
+
+
+def texts(n):
+    rng = np.random.default_rng(0)
+    return [f"text {i} " + "word " * int(rng.integers(1, 60)) for i in range(n)]
+
+
+def test_batches_follow_the_input_order():
+    calls = []
+    embedder = Embedder(use_api='jina', batch_size=8, max_batch_tokens=200)
+    stub_backend(embedder, calls)
+    inputs = texts(50)
+    embeddings = embedder.get_embedding(inputs)
+    assert embeddings.shape == (50, 2)
+    assert embeddings[:, 0].tolist() == list(range(50))
+    assert sorted(text for batch in calls for text in batch) == sorted(inputs)
+
+
+def test_batches_respect_size_and_token_budget():
+    calls = []
+    embedder = Embedder(use_api='jina', batch_size=8, max_batch_tokens=200)
+    stub_backend(embedder, calls)
+    embedder.get_embedding(texts(50))
+    assert len(calls) > 1
+    for batch in calls:
+        assert len(batch) <= 8
+        assert len(batch) == 1 or sum(estimate_tokens(text) for text in batch) <= 200
+
+
+def test_make_batches_groups_similar_lengths():
+    lengths = [5, 100, 7, 90, 6, 95]
+    assert _make_batches(lengths, batch_size=3, max_batch_tokens=10**6, padded=False) == [[1, 5, 3], [2, 4, 0]]
+    ## padded budget: longest text x batch size
+    assert _make_batches(lengths, batch_size=6, max_batch_tokens=200, padded=True) == [[1, 5], [3, 2], [4, 0]]
+    ## a text over the budget gets a batch of its own
+    assert _make_batches([500, 1], batch_size=6, max_batch_tokens=100, padded=False) == [[0], [1]]
+
+
+def test_import_loads_no_model_libraries():
+    ## a fresh interpreter, this one may have imported them already
+    probe = ("import sys; import Embedder; Embedder.Embedder(use_api='jina'); "
+             "print(' '.join(m for m in ('torch', 'transformers', 'onnxruntime', 'openai', 'requests') if m in sys.modules))")
+    loaded = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True, cwd=GPT_CRAWLER).stdout.split()
+    assert loaded == []
+
+
+def test_weighted_mean_pooling_weights_later_tokens_more():
+    hidden = np.array([[[1.0, 0.0], [0.0, 1.0], [5.0, 5.0]]], dtype="f")
+    ## the padding token is left out, the second token weighs twice as much as the first
+    pooled = _weighted_mean_pooling(hidden, np.array([[1, 1, 0]]))
+    np.testing.assert_allclose(pooled, [[1 / 3, 2 / 3]], rtol=1e-6)
+
+
+def test_cpu_backends_match_fp32_torch(tmp_path):
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    pytest.importorskip("onnxruntime")
+
+    ## a tiny random BERT, so the test needs no download
+    words = sorted({word for text in texts(40) for word in text.split()})
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words
+    (tmp_path / "vocab.txt").write_text("\n".join(vocab))
+    transformers.BertTokenizer(str(tmp_path / "vocab.txt")).save_pretrained(tmp_path)
+    torch.manual_seed(0)
+    config = transformers.BertConfig(vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2, num_attention_heads=2,
+                                     intermediate_size=128)
+    transformers.BertModel(config).save_pretrained(tmp_path)
+
+    embeddings = {backend: Embedder(model_name=str(tmp_path), local_backend=backend, onnx_path=str(tmp_path / "model.onnx"))
+                  .get_embedding(texts(40)) for backend in ("torch", "int8", "onnx")}
+    for backend, minimum in (("onnx", 0.9999), ("int8", 0.98)):
+        cosine = np.einsum("ij,ij->i", embeddings["torch"], embeddings[backend])
+        assert cosine.min() > minimum, backend
+
+
+def test_jina_400_segments_only_the_text_that_is_too_long(monkeypatch):
+    import requests
+    posts, segmented = [], []
+
+    def post(url, headers=None, json=None):
+        posts.append(list(json["input"]))
+        if any(len(text) > 100 for text in json["input"]):
+            return types.SimpleNamespace(status_code=400, text="input too long")
+        data = [{"embedding": [float(len(text)), 1.0]} for text in json["input"]]
+        return types.SimpleNamespace(status_code=200, json=lambda: {"data": data})
+
+    def segment(text, max_token):
+        segmented.append(text)
+        return [text[:len(text) // 2], text[len(text) // 2:]]
+
+    monkeypatch.setattr(requests, "post", post)
+    embedder = Embedder(use_api='jina')
+    monkeypatch.setattr(embedder, "_segment", segment)
+    inputs = ["short"] * 6 + ["x" * 150] + ["tiny"]
+    embeddings = embedder._get_jina_embedding(inputs)
+    assert segmented == ["x" * 150]
+    assert embeddings.shape == (8, 2)
+    assert embeddings[0].tolist() == [5.0, 1.0] and embeddings[7].tolist() == [4.0, 1.0]
+    ## the other texts are embedded whole, once each
+    embedded = [text for batch in posts if all(len(text) <= 100 for text in batch) for text in batch]
+    assert embedded.count("short") == 6 and embedded.count("tiny") == 1
+
+
+@pytest.mark.parametrize("text", [
+    "从前有一只小狐狸。" * 40 + "\n\n" + "它在森林里走啊走啊" * 200 + "。最后它回家了！",
+    "Once upon a time there was a fox. " * 40 + "\n\n" + "and it walked and walked " * 400 + "until it came home.",
+], ids=["cjk", "latin"])
+def test_local_segmenter_keeps_oversize_text_under_the_limit(text):
+    embedder = Embedder(use_api='jina')
+    chunks = embedder._local_segmenter(text, max_token=100)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_empty_input_with_a_cache(tmp_path):
+    calls = []
+    embedder = Embedder(use_api='jina', cache_dir=str(tmp_path))
+    stub_backend(embedder, calls)
+    embedder.get_embedding(["text 1 once", "text 2 upon"])
+    embeddings = embedder.get_embedding([])
+    assert isinstance(embeddings, np.ndarray) and embeddings.shape == (0, 2)
+    assert embedder.get_embedding(["text 2 upon"])[0].tolist() == [2.0, 11.0]
+    assert len(calls) == 1
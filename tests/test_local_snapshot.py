@@ -0,0 +1,69 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import GPT_crawler_utils
+import local_snapshot
+
+PAGES = {
+    '/list.html': b'<html><head><title>Stories</title></head><body><div class="ads">Buy</div><h1>All stories</h1>'
+                  b'<ul><li><a href="/story/1/">The first story</a></li></ul><a href="/list_2.html">Next</a></body></html>',
+    '/xml.html': '<?xml version="1.0" encoding="gbk"?><html><body><p>从前有座山</p></body></html>'.encode('gbk'),
+    '/empty.html': b'',
+}
+
+
+@pytest.fixture(scope='module')
+def site():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = PAGES[self.path]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=gbk' if self.path == '/xml.html' else 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def test_markdown_and_links_summary(site):
+    snapshot = GPT_crawler_utils.get_text_snapshot(f'{site}/list.html', exclude_selector=['.ads'], links_at_end=True,
+                                                   backend='local', use_cache=False)
+    assert snapshot.startswith('Title: Stories\n')
+    assert '# All stories' in snapshot and 'Buy' not in snapshot
+    assert snapshot.split('Links/Buttons:')[1].split() == ['-', f'[The', 'first', f'story]({site}/story/1/)', '-', f'[Next]({site}/list_2.html)']
+
+
+def test_xml_declaration_and_empty_pages_do_not_raise(site):
+    snapshot = GPT_crawler_utils.get_text_snapshot(f'{site}/xml.html', backend='local', use_cache=False)
+    assert '从前有座山' in snapshot
+    snapshot = GPT_crawler_utils.get_text_snapshot(f'{site}/empty.html', links_at_end=True, backend='local', use_cache=False)
+    assert 'Markdown Content:' in snapshot and 'Links/Buttons:' in snapshot
+
+
+def test_parse_errors_become_error_strings(monkeypatch, site):
+    def broken(*args, **kwargs):
+        raise ValueError("Cannot parse")
+    monkeypatch.setattr(local_snapshot, 'html_to_snapshot', broken)
+    assert GPT_crawler_utils.get_text_snapshot(f'{site}/list.html', backend='local', use_cache=False).startswith("Error fetching text snapshot")
+
+
+def test_library_modules_leave_sys_path_alone():
+    import os
+    import subprocess
+    import sys
+
+    from conftest import GPT_CRAWLER, ROOT
+
+    code = "import sys; before = list(sys.path); import GPT_crawler, content_template, local_snapshot; print(sys.path == before)"
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join([ROOT, GPT_CRAWLER])}
+    result = subprocess.run([sys.executable, '-c', code], cwd=GPT_CRAWLER, env=env, capture_output=True, text=True)
+    assert result.stdout.strip() == "True", result.stderr
@@ -0,0 +1,19 @@
+import pytest
+
+import page_parser
+
+PAGE = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Tales</title></head>
+<body><div class="content"><p>Once upon a time</p></div><a href="/news/tonghua/1.html">The fox</a></body></html>"""
+
+
+@pytest.mark.parametrize('name', ['bs4', 'lxml', 'selectolax'])
+def test_pages_with_an_xml_declaration_are_parsed(name):
+    try:
+        parser = page_parser.get_parser(name)
+    except ImportError:
+        pytest.skip(f"{name} is not installed")
+    tree = parser.parse(PAGE)
+    assert parser.text(tree, 'div.content') == "Once upon a time"
+    assert parser.links(tree, '/news/tonghua/') == [("The fox", "/news/tonghua/1.html")]
@@ -0,0 +1,96 @@
+import pagination
+
+STORIES = "\n".join(f"- [A story called {i}](https://s.com/stories/story-{i}/)" for i in range(20))
+
+
+def snapshot(*links):
+    return "Title: Stories\n\nLinks/Buttons:\n" + STORIES + "".join(f"\n- [{text}]({url})" for text, url in links)
+
+
+def test_wordpress_next_links_are_detected():
+    for text in ("Next Page »", "« Older Entries", "Older Posts", "Next →", "»", "下一页"):
+        result = pagination.detect_pagination(snapshot((text, "https://s.com/stories/2/")), "https://s.com/stories/", 1)
+        assert result['agree'], text
+        assert result['next_page'] == "https://s.com/stories/2/", text
+
+
+def test_story_title_with_next_is_not_a_next_link():
+    result = pagination.detect_pagination(snapshot(("What Happened Next", "https://s.com/stories/what-happened-next/")),
+                                          "https://s.com/stories/", 1)
+    assert result['next_page'] == ""
+    assert not result['agree']
+
+
+def test_no_signal_is_unknown_not_last_page():
+    result = pagination.detect_pagination(snapshot(), "https://s.com/stories/", 1)
+    assert result['next_page'] == ""
+    assert not result['agree']
+
+
+def test_end_of_page_sequence_is_last_page():
+    links = [(str(n), f"https://s.com/stories/page/{n}/") for n in (1, 2, 3)]
+    result = pagination.detect_pagination(snapshot(*links), "https://s.com/stories/page/3/", 3)
+    assert result['agree'] and result['next_page'] == "" and result['last_page'] == 3
+
+
+def test_page_range_is_predicted():
+    links = [(str(n), f"https://s.com/stories/?page={n}") for n in (1, 2, 3, 9)] + [("Next", "https://s.com/stories/?page=2")]
+    result = pagination.detect_pagination(snapshot(*links), "https://s.com/stories/?page=1", 1)
+    assert result['agree'] and result['last_page'] == 9
+    assert result['page_urls'][0] == "https://s.com/stories/?page=2"
+    assert len(result['page_urls']) == 8
+
+
+def test_find_next_page_asks_the_llm_when_heuristics_find_nothing(monkeypatch):
+    import GPT_crawler as crawler
+
+    asked = []
+    monkeypatch.setattr(crawler.GPT_crawler, 'get_text_snapshot', lambda url, **kwargs: "next page snapshot")
+    monkeypatch.setattr(crawler.GPT_crawler, 'GPT_boolean', lambda content, query: asked.append(content) or True)
+    next_page, page_urls, next_snapshot = crawler.find_next_page(snapshot(), "https://s.com/stories/", 1, "https://s.com/stories/2/")
+    assert next_page == "https://s.com/stories/2/"
+    assert asked and next_snapshot.startswith("next page snapshot")
+
+    asked.clear()
+    assert crawler.find_next_page(snapshot(), "https://s.com/stories/", 1, "")[0] == ""
+    assert not asked
+
+
+def test_empty_predicted_page_does_not_end_the_listing(monkeypatch):
+    import GPT_crawler as crawler
+
+    pages = {f"https://s.com/stories/page/{n}/": [{'title': f"Story {n}", 'url': f"https://s.com/story-{n}/"}] for n in (2, 4, 5)}
+    pages["https://s.com/stories/"] = [{'title': "Story 1", 'url': "https://s.com/story-1/"}]
+    pages["https://s.com/stories/page/3/"] = [] # a page that failed to extract
+    predicted = [f"https://s.com/stories/page/{n}/" for n in (2, 3, 4, 5)]
+
+    def list_page(page_url, page, full_page=False, snapshot=None, label=""):
+        return f"snapshot of {page_url}", pages[page_url], ""
+
+    def find_next_page(snapshot, page_url, page, llm_next_page, label=""):
+        return (predicted[0], predicted, None) if page == 1 else ("", [], None)
+
+    monkeypatch.setattr(crawler, '_list_page', list_page)
+    monkeypatch.setattr(crawler, 'find_next_page', find_next_page)
+    emitted = []
+    crawler._crawl_category("c", "https://s.com/stories/", lambda title, url: emitted.append(title), {'pages': 0, 'titles': 0})
+    assert emitted == ["Story 1", "Story 2", "Story 4", "Story 5"]
+
+
+def test_failed_category_leaves_the_listing_unfinished(monkeypatch, tmp_path):
+    import GPT_crawler as crawler
+    from crawl_state import CrawlState
+
+    def crawl_category(category, category_url, emit, progress):
+        if category == "broken":
+            raise RuntimeError("listing page unreachable")
+        emit(f"{category} story", f"https://s.com/{category}/story/")
+
+    monkeypatch.setattr(crawler, '_crawl_category', crawl_category)
+    with CrawlState(str(tmp_path / "state.sqlite")) as state:
+        listed = list(crawler.list_new_stories({"fables": "https://s.com/fables/", "broken": "https://s.com/broken/"}, state))
+        assert listed == [("fables story", "https://s.com/fables/story/", "fables")]
+        assert state.get_meta('listing_done') is None
+
+        list(crawler.list_new_stories({"fables": "https://s.com/fables/"}, state))
+        assert state.get_meta('listing_done') == '1'
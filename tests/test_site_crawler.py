@@ -0,0 +1,72 @@
+import types
+
+import pytest
+
+from crawl_state import CrawlState
+from site_crawler import SiteProfile, StoryPipeline
+
+BASE = "http://site.test"
+PROFILE = {
+    'name': "test",
+    'categories': {"童话": f"{BASE}/tonghua/"},
+    'body': {'rule': "selector", 'selector': "div.content"},
+}
+
+
+class FakeFetcher:
+    def __init__(self, stories):
+        """Serves one list page linking `stories` ({path: (title, body)}); bodies of None fail to fetch."""
+        self.stories = stories
+
+    def get(self, url):
+        links = "".join(f'<a href="{path}">{title}</a>' for path, (title, _) in self.stories.items())
+        return f"<html><body>{links}</body></html>"
+
+    def fetch(self, url, headers=None):
+        body = self.stories[url[len(BASE):]][1]
+        if body is None:
+            raise ConnectionError("connection reset")
+        return types.SimpleNamespace(status_code=200, headers={}, text=f'<div class="content">{body}</div>')
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+
+def crawl(state, stories):
+    sink = ListSink()
+    StoryPipeline(SiteProfile(PROFILE), FakeFetcher(stories), state, sink, max_workers=2).run()
+    return sink.rows
+
+
+@pytest.fixture
+def state(tmp_path):
+    with CrawlState(str(tmp_path / "state.sqlite")) as state:
+        yield state
+
+
+def test_failed_revalidation_keeps_the_story(state):
+    crawl(state, {"/tonghua/1.html": ("小红帽", "从前有个小姑娘")})
+    assert state.is_done(f"{BASE}/tonghua/1.html")
+
+    crawl(state, {"/tonghua/1.html": ("小红帽", None)})
+    story = state.get(f"{BASE}/tonghua/1.html")
+    assert story['status'] == 'done' and story['content'] == "从前有个小姑娘"
+
+
+def test_pending_stories_are_keyed_by_url(state):
+    state.add(f"{BASE}/tonghua/1.html", "小红帽", "童话")
+    state.add(f"{BASE}/yuyan/1.html", "小红帽", "寓言")
+    assert state.pending() == {f"{BASE}/tonghua/1.html": ("小红帽", "童话"), f"{BASE}/yuyan/1.html": ("小红帽", "寓言")}
+
+
+def test_stories_of_earlier_runs_stay_in_the_output(state):
+    crawl(state, {"/tonghua/1.html": ("小红帽", "从前有个小姑娘"), "/tonghua/2.html": ("丑小鸭", "鸭妈妈孵出了一窝小鸭")})
+    ## the second story is no longer listed, the first one fails to revalidate
+    rows = crawl(state, {"/tonghua/1.html": ("小红帽", None)})
+    assert sorted(row['title'] for row in rows) == ["丑小鸭", "小红帽"]
+    assert {row['title']: row['content'] for row in rows}["小红帽"] == "从前有个小姑娘"
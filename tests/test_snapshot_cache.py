@@ -0,0 +1,20 @@
+import os
+import zlib
+
+from snapshot_cache import SnapshotCache
+
+
+def test_shared_body_is_counted_until_its_last_entry_is_evicted(tmp_path):
+    text = os.urandom(4000).hex()
+    max_bytes = len(zlib.compress(text.encode("utf-8"))) * 3 // 2 # room for one body
+    cache = SnapshotCache(str(tmp_path / "cache.sqlite"), max_bytes=max_bytes)
+    ## one body shared by two entries, then a second body pushes the total over the limit
+    cache.set("https://s.com/a", {}, text)
+    cache.set("https://s.com/a", {"X-With-Links-Summary": "true"}, text)
+    cache.set("https://s.com/b", {}, text[::-1])
+    ## both entries of the shared body have to go, freeing one entry frees no bytes
+    assert cache.get("https://s.com/a", {}) is None
+    assert cache.get("https://s.com/a", {"X-With-Links-Summary": "true"}) is None
+    assert cache.get("https://s.com/b", {}) == text[::-1]
+    assert cache.stats()["bytes"] <= max_bytes
+    cache.close()
@@ -0,0 +1,30 @@
+import snapshot_links
+
+STORIES = [(f"A story called {i}", f"https://s.com/stories/story-{i}/") for i in range(20)]
+
+
+def snapshot(links):
+    return "Links/Buttons:\n" + "\n".join(f"- [{text}]({url})" for text, url in links)
+
+
+def test_next_links_survive_the_filter():
+    links = STORIES + [("Next Page »", "https://s.com/stories/2/"), ("About us", "https://s.com/about/")]
+    parts, stats = snapshot_links.prepare_links(snapshot(links), "https://s.com/stories/", 8000)
+    assert "https://s.com/stories/2/" in parts[0]
+    assert "https://s.com/about/" not in parts[0]
+    assert stats['kept_links'] == 21
+
+
+def test_unlabelled_page_variants_are_pagination():
+    stories, pagination = snapshot_links.story_links(STORIES + [("2", "https://s.com/stories/2/"), ("Go", "https://s.com/stories/page/3/")],
+                                                     page_url="https://s.com/stories/")
+    assert [url for _, url in pagination] == ["https://s.com/stories/2/", "https://s.com/stories/page/3/"]
+    assert len(stories) == 20
+
+
+def test_is_page_variant():
+    assert snapshot_links.is_page_variant("list_12_2.html", "https://s.com/news/list_12_1.html")
+    assert snapshot_links.is_page_variant("?page=2", "https://s.com/stories/?page=1")
+    assert snapshot_links.is_page_variant("/stories/", "https://s.com/stories/page/2/")
+    assert not snapshot_links.is_page_variant("/stories/story-1/", "https://s.com/stories/")
+    assert not snapshot_links.is_page_variant("/stories/", "https://s.com/stories/")
@@ -0,0 +1,34 @@
+import json
+
+from openai import OpenAI
+
+import GPT_crawler_utils
+from conftest import GPT_CRAWLER
+
+
+def test_is_url_does_not_fetch(monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError("_is_url must not send requests")
+    monkeypatch.setattr(GPT_crawler_utils.session, 'get', no_network)
+    monkeypatch.setattr(GPT_crawler_utils.requests, 'get', no_network)
+    assert GPT_crawler_utils._is_url("https://site.test/story-1/")
+    assert GPT_crawler_utils._is_url("http://site.test/list_12_3.html?page=2")
+    for text in ("Once upon a time", "site.test/story-1/", "ftp://site.test/", "https://", "https://site.test/a story", None):
+        assert not GPT_crawler_utils._is_url(text), text
+
+
+def test_get_content_takes_one_round_trip_per_page(fake_api, monkeypatch):
+    monkeypatch.chdir(GPT_CRAWLER)
+    monkeypatch.setenv('JINAAI_API_KEY', 'test')
+    monkeypatch.setattr(GPT_crawler_utils, 'JINA_READER_URL', f'{fake_api.base}/')
+    monkeypatch.setattr(GPT_crawler_utils, 'client', OpenAI(base_url=f'{fake_api.base}/v1', api_key='test', max_retries=0))
+    monkeypatch.setattr(GPT_crawler_utils, 'snapshot_backend', 'jina')
+    monkeypatch.setattr(GPT_crawler_utils, 'snapshot_cache', None)
+    monkeypatch.setattr(GPT_crawler_utils, 'completion_cache', None)
+
+    page_url = f'{fake_api.base}/story/1/'
+    completion = GPT_crawler_utils.get_content(page_url)
+    story = json.loads(completion.choices[0].message.content)['content']
+    assert story['content'] == f"Snapshot of {page_url}"
+    ## the page is only read through the snapshot, never fetched to check that it exists
+    assert [kind for kind, _, _ in fake_api.requests] == ['reader', 'completions']
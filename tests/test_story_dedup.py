@@ -0,0 +1,48 @@
+import numpy as np
+
+import story_dedup
+
+
+class StubEmbedder:
+    def __init__(self, groups):
+        """Embeds every text of a group as the same vector, `groups` maps texts to group numbers."""
+        self.groups = groups
+        self.embedded = []
+
+    def get_embedding(self, texts):
+        self.embedded.extend(texts)
+        vectors = np.zeros((len(texts), 64), dtype="f")
+        vectors[np.arange(len(texts)), [self.groups[text] for text in texts]] = 1.0
+        return vectors
+
+
+def corpus(n_stories=40, words=200, kept=0.45, seed=0):
+    """Random stories, and a retelling of the first one that keeps its opening (`kept` of the words) and rewrites the rest."""
+    rng = np.random.default_rng(seed)
+    stories = [rng.integers(0, 50000, words) for _ in range(n_stories)]
+    retelling = stories[0].copy()
+    retelling[int(words * kept):] = rng.integers(50000, 100000, words - int(words * kept))
+    return [" ".join(f"w{word}" for word in story) for story in stories + [retelling]]
+
+
+def test_retellings_are_confirmed_with_embeddings():
+    texts = corpus()
+    deduper = story_dedup.StoryDeduper()
+    jaccard = float(np.mean(deduper.signature(texts[0]) == deduper.signature(texts[-1])))
+    assert story_dedup.CANDIDATE_THRESHOLD < jaccard < story_dedup.THRESHOLD # not a duplicate without embeddings
+
+    embedder = StubEmbedder({text: 0 if i in (0, len(texts) - 1) else i for i, text in enumerate(texts)})
+    clusters, _ = story_dedup.find_duplicates([{'content': text} for text in texts], embedder=embedder)
+    assert clusters == [[0, len(texts) - 1]]
+    ## only the candidate pair is embedded, not the whole corpus
+    assert sorted(embedder.embedded) == sorted([texts[0], texts[-1]])
+
+
+def test_confirmation_runs_outside_the_lock():
+    deduper = story_dedup.StoryDeduper()
+    deduper.add("a", "once upon a time there was a fox who lived in the forest")
+
+    def confirm(key, other_key):
+        assert not deduper._lock.locked()
+        return True
+    assert deduper.add("b", "once upon a time there was a fox who lived in the forest", confirm=confirm) == "a"
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from story_index import StoryIndex, index_stories
+
+
+def test_exact_and_ivf_search_pad_to_k(tmp_path):
+    rng = np.random.default_rng(0)
+    with StoryIndex(str(tmp_path / "index")) as index:
+        assert [a.shape for a in index.search(rng.standard_normal(8), k=5)] == [(1, 5), (1, 5)]
+        index.add(rng.standard_normal((3, 8)), [{'url': f"u{i}"} for i in range(3)])
+        exact = index.search(rng.standard_normal((2, 8)), k=5)
+        index.build_ivf(n_lists=2)
+        ivf = index.search(rng.standard_normal((2, 8)), k=5, nprobe=2)
+        for scores, rows in (exact, ivf):
+            assert scores.shape == rows.shape == (2, 5)
+            assert (rows[:, 3:] == -1).all() and np.isneginf(scores[:, 3:]).all()
+            assert sorted(rows[0, :3]) == [0, 1, 2]
+
+
+class StubEmbedder:
+    def get_embedding(self, texts):
+        return np.array([[len(text), 1.0] for text in texts], dtype="f")
+
+
+def test_index_stories_with_crawler_column_names(tmp_path):
+    csv = tmp_path / "stories.csv"
+    pd.DataFrame({'title': ["小红帽", "丑小鸭"], 'text': ["从前有个小姑娘", "鸭妈妈孵出了一窝小鸭"],
+                  'category': ["童话", "童话"], 'story_url': ["http://s.test/1", "http://s.test/2"]}).to_csv(csv, index=False)
+    index_stories(str(csv), StubEmbedder(), str(tmp_path / "index"), text_column="text", url_column="story_url")
+    with StoryIndex(str(tmp_path / "index")) as index:
+        assert [record['url'] for record in index.records([0, 1])] == ["http://s.test/1", "http://s.test/2"]
+
+
+def test_vectors_persist_across_growth_and_reopen(tmp_path):
+    from embedding_cache import EmbeddingCache
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3000, 4)).astype("f") # past the initial capacity of 1024 rows
+    with StoryIndex(str(tmp_path / "index")) as index:
+        index.add(vectors, [{'url': f"u{i}"} for i in range(len(vectors))])
+    with StoryIndex(str(tmp_path / "index")) as index:
+        assert index.count == 3000 and index.dim == 4
+        np.testing.assert_allclose(index.vectors[2999], vectors[2999] / np.linalg.norm(vectors[2999]), rtol=1e-6)
+    with pytest.raises(ValueError):
+        StoryIndex(str(tmp_path / "index"), dtype="float16")
+
+    cache = EmbeddingCache(str(tmp_path / "cache"), "model")
+    cache.add([f"text {i}" for i in range(3000)], vectors)
+    cache.close()
+    cache = EmbeddingCache(str(tmp_path / "cache"), "model")
+    embeddings, missing = cache.lookup(["text 2999", "unknown"])
+    assert missing == [1] and np.array_equal(embeddings[0], vectors[2999])
+    with pytest.raises(ValueError):
+        cache.add(["other"], np.ones((1, 5)))
+    cache.close()